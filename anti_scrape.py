@@ -172,8 +172,7 @@ for cidr in DATA_CENTER_CIDRS:
 # In-memory request tracking (for pattern detection)
 # In production, use Redis for distributed tracking
 request_history = {}
-HISTORY_CLEANUP_INTERVAL = 300  # Clean up every 5 minutes
-last_cleanup = datetime.now()
+HISTORY_CLEANUP_INTERVAL = 300  # Clean up every 5 minutes (maintenance.py)
 
 # Honeypot blocked IPs (bots that followed hidden links)
 honeypot_blocked_ips = set()
@@ -365,27 +364,21 @@ def get_real_ip():
     return request.remote_addr
 
 
-def track_request(ip, path):
-    """Track request for pattern detection"""
-    global last_cleanup, request_history
+def cleanup_request_history():
+    """Drop request timestamps older than 10 minutes (run by the maintenance thread)"""
+    cutoff = datetime.now() - timedelta(minutes=10)
+    for key, timestamps in list(request_history.items()):
+        recent = [t for t in timestamps if t > cutoff]
+        if recent:
+            request_history[key] = recent
+        else:
+            request_history.pop(key, None)
 
-    now = datetime.now()
 
-    # Cleanup old entries periodically
-    if (now - last_cleanup).total_seconds() > HISTORY_CLEANUP_INTERVAL:
-        cutoff = now - timedelta(minutes=10)
-        request_history = {
-            k: [t for t in v if t > cutoff]
-            for k, v in request_history.items()
-            if any(t > cutoff for t in v)
-        }
-        last_cleanup = now
-
-    # Track this request
+def track_request(ip, path):
+    """Track request for pattern detection"""
     key = f"{ip}:{path}"
-    if key not in request_history:
-        request_history[key] = []
-    request_history[key].append(now)
+    request_history.setdefault(key, []).append(datetime.now())
 
 
 def is_scraping_pattern(ip):
@@ -395,7 +388,7 @@ def is_scraping_pattern(ip):
 
     # Count recent requests from this IP to doctor-related pages
     doctor_page_count = 0
-    for key, timestamps in request_history.items():
+    for key, timestamps in list(request_history.items()):
         if key.startswith(f"{ip}:") and ('/doctor/' in key or '/doctors' in key):
             recent = [t for t in timestamps if t > one_minute_ago]
             doctor_page_count += len(recent)
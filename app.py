@@ -8,6 +8,7 @@ import json
 from datetime import datetime, timedelta, date, time
 from zoneinfo import ZoneInfo
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from markupsafe import escape
 
 # Nepal timezone helper (UTC+5:45)
 NEPAL_TZ = ZoneInfo('Asia/Kathmandu')
@@ -27,18 +28,37 @@ from authlib.integrations.flask_client import OAuth
 from models import db, City, Specialty, Clinic, Doctor, User, Rating, Appointment, ContactMessage, Advertisement, VerificationRequest, DoctorResponse, ReviewFlag, BadgeDefinition, UserBadge, ReviewHelpful, Article, ArticleCategory, ClinicManagerDoctor, ClinicAccount, DoctorContact, DoctorWorkplace, DoctorSubscription, DoctorCredentials, DoctorSettings, DoctorMedicalTools, DoctorTemplateUsage, ClinicStaff, ClinicDoctor, ClinicSchedule, ScheduleException, AppointmentReminder, PatientNoShowRecord, BlockedIdentity, SecurityEvent, LocalLevel
 from config import Config
 import ad_manager
+import article_render
+import article_search
 import upload_utils
-import r2_storage
+import view_counter
+import review_dedup
+import review_analysis
+import jobs
+import mailer
+import appointment_reminders
+import maintenance
+import security_events
+import media_delivery
+import image_variants
+import image_processing
+import object_store
+import qr_codes
+import share_images
+import avatars
 import stripe
 import subscription_config
 import promo_config
 import resend
 import requests
-from PIL import Image, ImageDraw, ImageFont
-import secrets
-import qrcode
-from io import BytesIO
 import base64
+from urllib.parse import quote
+
+# orjson is optional - /doctors falls back to the stdlib encoder without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Import text_utils with fallback
 try:
@@ -119,6 +139,35 @@ app.config['ALLOWED_EXTENSIONS'] = {'pdf', 'jpg', 'jpeg', 'png'}
 # Initialize SQLAlchemy
 db.init_app(app)
 
+# Batched article/profile view counters (flushed by the maintenance thread)
+view_counter.init_app(app)
+
+# Background job queue (`flask jobs worker`, see jobs.py)
+jobs.init_app(app)
+
+# Outgoing email outbox, sent in batches by the job worker (see mailer.py)
+mailer.init_app(app)
+
+# Appointment reminder emails, scanned periodically by the job worker
+appointment_reminders.init_app(app)
+
+# Scheduled housekeeping: job-worker database tasks and a per-process thread (see maintenance.py)
+maintenance.init_app(app)
+
+# R2 photo/logo delivery (redirects, or proxied through a disk cache under instance/)
+media_delivery.init_app(app)
+
+# Uploaded photos, logos and article images are processed off-request (see image_processing.py)
+image_processing.init_app(app)
+
+# Profile QR codes and printable cards are rendered once and cached under instance/ (see qr_codes.py)
+qr_codes.init_app(app)
+
+# Per-doctor Open Graph cards, rendered by a background batch (see share_images.py)
+share_images.init_app(app)
+
+ARTICLE_PAGE_CACHE_SECONDS = int(os.getenv('ARTICLE_PAGE_CACHE_SECONDS', '300'))
+
 # Initialize Flask-Migrate
 migrate = Migrate(app, db)
 
@@ -344,12 +393,7 @@ def is_global_email_rate_limited():
     """Check if global email sending is rate limited to prevent quota abuse"""
     if GLOBAL_EMAIL_RATE_LIMIT <= 0:
         return False
-    window_start = datetime.utcnow() - timedelta(seconds=GLOBAL_EMAIL_RATE_WINDOW)
-    recent_count = SecurityEvent.query.filter(
-        SecurityEvent.event_type == 'verification_email_sent',
-        SecurityEvent.created_at >= window_start
-    ).count()
-    return recent_count >= GLOBAL_EMAIL_RATE_LIMIT
+    return mailer.recent_count('verification', GLOBAL_EMAIL_RATE_WINDOW) >= GLOBAL_EMAIL_RATE_LIMIT
 
 # Per-email rate limiting (prevent abuse of specific email addresses)
 EMAIL_VERIFICATION_LIMIT = int(os.getenv('EMAIL_VERIFICATION_LIMIT', '3'))  # Max per email per window
@@ -531,6 +575,11 @@ def is_verification_ip_limited(ip):
     ).count()
     return recent_count >= VERIFICATION_EMAIL_IP_LIMIT
 
+def queue_email(params, category=None, dedupe_key=None, db_commit=True):
+    """Add an email to the outbox instead of calling Resend in the request"""
+    return mailer.queue_message(params, category=category, dedupe_key=dedupe_key, db_commit=db_commit)
+
+
 def send_email_verification(user):
     now = datetime.utcnow()
     if user.last_verification_sent_at:
@@ -563,12 +612,12 @@ def send_email_verification(user):
     """
     params = {"from": "RankSewa <support@ranksewa.com>", "to": [user.email], "subject": subject, "html": html}
     try:
-        resend.Emails.send(params)
         user.last_verification_sent_at = now
-        db.session.commit()
+        queue_email(params, category='verification')
         return {"sent": True, "verify_url": None, "cooldown_seconds": 0}
     except Exception as e:
-        print(f"❌ Failed to send verification email: {e}")
+        db.session.rollback()
+        print(f"❌ Failed to queue verification email: {e}")
         if should_show_dev_verify_link():
             user.last_verification_sent_at = now
             db.session.commit()
@@ -623,10 +672,11 @@ def send_password_reset_email(user):
         "html": html
     }
     try:
-        resend.Emails.send(params)
+        queue_email(params, category='password_reset')
         return None
     except Exception as e:
-        print(f"❌ Failed to send password reset email: {e}")
+        db.session.rollback()
+        print(f"❌ Failed to queue password reset email: {e}")
         if should_show_dev_verify_link():
             return reset_url
         return None
@@ -966,20 +1016,13 @@ def enforce_subscription_expiry(doctor):
         doctor.subscription_expires_at = None
         db.session.commit()
 
-_last_subscription_cleanup = None
-
+@maintenance.database_task('expire_subscriptions', 300)
 def clear_expired_subscriptions():
-    """Clear expired subscriptions - runs at most once per 5 minutes"""
-    global _last_subscription_cleanup
+    """Downgrade doctors whose premium/featured subscription has expired (every 5 minutes)"""
     now = datetime.utcnow()
 
-    # Only run once every 5 minutes to avoid unnecessary DB writes on every request
-    if _last_subscription_cleanup and (now - _last_subscription_cleanup).total_seconds() < 300:
-        return
-
     if promo_config.is_promotion_active():
-        _last_subscription_cleanup = now
-        return
+        return 0
 
     updated = Doctor.query.filter(
         Doctor.subscription_expires_at.isnot(None),
@@ -992,8 +1035,8 @@ def clear_expired_subscriptions():
     }, synchronize_session=False)
     if updated:
         db.session.commit()
-
-    _last_subscription_cleanup = now
+        print(f"[MAINTENANCE] Downgraded {updated} expired subscriptions")
+    return updated
 
 # --- Helper Function for Slugs ---
 def generate_slug(name):
@@ -1025,81 +1068,25 @@ def send_verification_approved_email(to_email, doctor_name):
         doctor_name: Full name of the doctor (e.g., "Dr. Bilakshan Mishra")
 
     Returns:
-        True if email sent successfully, False otherwise
+        True if email queued successfully, False otherwise
     """
-    if not resend_key:
-        app.logger.warning("RESEND_API_KEY not set. Skipping verification approved email.")
-        return False
-
     try:
         # Extract last name for personalization
         last_name = doctor_name.split()[-1].replace('Dr.', '').strip()
 
-        subject = "Your RankSewa Profile Has Been Verified"
-
-        html_body = f"""
-        <div style="font-family: Arial, Helvetica, sans-serif; line-height: 1.6; color: #111;">
-            <p>Dear Dr. {last_name},</p>
-
-            <p>
-                Greetings from <strong>RankSewa</strong>.
-            </p>
-
-            <p>
-                We are pleased to inform you that your doctor profile on
-                <strong>RankSewa</strong> has been <strong>successfully verified</strong>
-                after reviewing the documents you submitted.
-            </p>
-
-            <p>
-                Thank you for taking the time to complete the verification process.
-                As we build RankSewa to help patients in Nepal find trusted healthcare
-                professionals, verified doctors like you play a vital role in
-                maintaining transparency and trust.
-            </p>
-
-            <p>
-                We would also like to sincerely thank you for your contribution to
-                the healthcare community. Medical professionals like you are essential
-                to the well-being of our society, and your work makes a meaningful
-                difference every day.
-            </p>
-
-            <p>
-                RankSewa is still in its early stages, and your decision to verify your
-                profile means a great deal to us. We truly appreciate your trust
-                and support.
-            </p>
-
-            <p>
-                If you ever wish to update your profile or share feedback on how we can
-                improve the platform for doctors and patients, please contact us at
-                <a href="mailto:support@ranksewa.com">support@ranksewa.com</a>.
-            </p>
-
-            <p style="margin-top: 32px;">
-                With sincere appreciation,<br>
-                <strong>Paul Paudyal</strong><br>
-                Founder, RankSewa<br>
-                <a href="https://ranksewa.com">https://ranksewa.com</a><br>
-                <span style="color: #6b7280; font-size: 14px;">Support: <a href="mailto:support@ranksewa.com">support@ranksewa.com</a></span>
-            </p>
-        </div>
-        """
-
         params = {
             "from": "RankSewa Onboarding <onboarding@ranksewa.com>",
             "to": [to_email],
-            "subject": subject,
-            "html": html_body
+            "subject": "Your RankSewa Profile Has Been Verified",
+            "html": mailer.render('verification_approved.html', last_name=last_name)
         }
 
-        email_response = resend.Emails.send(params)
-        print(f"✅ Verification approved email sent to {to_email}")
+        queue_email(params, category='verification_result')
+        print(f"✅ Verification approved email queued for {to_email}")
         return True
 
     except Exception as e:
-        print(f"❌ Failed to send verification email to {to_email}: {e}")
+        print(f"❌ Failed to queue verification email to {to_email}: {e}")
         return False
 
 def send_verification_rejected_email(to_email, doctor_name, admin_notes=None):
@@ -1112,78 +1099,24 @@ def send_verification_rejected_email(to_email, doctor_name, admin_notes=None):
         admin_notes: Optional notes from admin about rejection
 
     Returns:
-        True if email sent successfully, False otherwise
+        True if email queued successfully, False otherwise
     """
-    if not resend_key:
-        app.logger.warning("RESEND_API_KEY not set. Skipping verification rejected email.")
-        return False
-
     try:
         last_name = doctor_name.split()[-1].replace('Dr.', '').strip()
 
-        subject = "Update on Your RankSewa Verification Request"
-
-        rejection_reason = ""
-        if admin_notes:
-            rejection_reason = f"""
-            <p>
-                <strong>Admin Notes:</strong><br>
-                {admin_notes}
-            </p>
-            """
-
-        html_body = f"""
-        <div style="font-family: Arial, Helvetica, sans-serif; line-height: 1.6; color: #111;">
-            <p>Dear Dr. {last_name},</p>
-
-            <p>
-                Thank you for submitting your verification request on <strong>RankSewa</strong>.
-            </p>
-
-            <p>
-                After reviewing your submission, we were unable to approve your verification
-                request at this time.
-            </p>
-
-            {rejection_reason}
-
-            <p>
-                You are welcome to submit a new verification request with updated information
-                or documentation. Please ensure:
-            </p>
-            <ul>
-                <li>Your NMC registration number is valid and matches NMC records</li>
-                <li>All uploaded documents are clear and readable</li>
-                <li>Your information matches your official NMC registration</li>
-            </ul>
-
-            <p>
-                If you have any questions or need clarification, please contact us at
-                <a href="mailto:support@ranksewa.com">support@ranksewa.com</a> and we'll be happy to help.
-            </p>
-
-            <p style="margin-top: 32px;">
-                Best regards,<br>
-                <strong>RankSewa Team</strong><br>
-                <a href="https://ranksewa.com">https://ranksewa.com</a><br>
-                <span style="color: #6b7280; font-size: 14px;">Support: <a href="mailto:support@ranksewa.com">support@ranksewa.com</a></span>
-            </p>
-        </div>
-        """
-
         params = {
             "from": "RankSewa Onboarding <onboarding@ranksewa.com>",
             "to": [to_email],
-            "subject": subject,
-            "html": html_body
+            "subject": "Update on Your RankSewa Verification Request",
+            "html": mailer.render('verification_rejected.html', last_name=last_name, admin_notes=admin_notes)
         }
 
-        email_response = resend.Emails.send(params)
-        print(f"✅ Verification rejected email sent to {to_email}")
+        queue_email(params, category='verification_result')
+        print(f"✅ Verification rejected email queued for {to_email}")
         return True
 
     except Exception as e:
-        print(f"❌ Failed to send rejection email to {to_email}: {e}")
+        print(f"❌ Failed to queue rejection email to {to_email}: {e}")
         return False
 
 
@@ -1197,76 +1130,24 @@ def send_resubmission_request_email(to_email, doctor_name, feedback_text):
         feedback_text: Specific issues to address
 
     Returns:
-        True if email sent successfully, False otherwise
+        True if email queued successfully, False otherwise
     """
-    if not resend_key:
-        app.logger.warning("RESEND_API_KEY not set. Skipping resubmission request email.")
-        return False
-
     try:
         last_name = doctor_name.split()[-1].replace('Dr.', '').strip()
 
-        subject = "Action Required: Please Resubmit Documents for RankSewa Verification"
-
-        # Format feedback with proper HTML
-        feedback_html = feedback_text.replace('\n', '<br>').replace('• ', '&bull; ')
-
-        html_body = f"""
-        <div style="font-family: Arial, Helvetica, sans-serif; line-height: 1.6; color: #111;">
-            <p>Dear Dr. {last_name},</p>
-
-            <p>
-                Thank you for submitting your verification request on <strong>RankSewa</strong>.
-            </p>
-
-            <p>
-                We've reviewed your submission and need a few documents resubmitted before we can complete verification.
-                <strong>Your NMC registration has been validated</strong> — we just need clearer documentation.
-            </p>
-
-            <div style="background: #fffbeb; border-left: 4px solid #f59e0b; padding: 16px; margin: 20px 0;">
-                <strong style="color: #92400e;">Please address the following:</strong><br><br>
-                {feedback_html}
-            </div>
-
-            <p>
-                <a href="https://ranksewa.com/doctor/request-verification"
-                   style="display: inline-block; background: #0d8abc; color: white; padding: 12px 24px; text-decoration: none; border-radius: 8px; font-weight: bold;">
-                    Resubmit Documents
-                </a>
-            </p>
-
-            <p style="color: #6b7280; font-size: 14px;">
-                <strong>Why is this important?</strong><br>
-                Identity clarity is non-negotiable for a healthcare directory. Clear documentation protects both patients and your professional reputation.
-            </p>
-
-            <p>
-                If you have questions, reply to this email or contact us at
-                <a href="mailto:support@ranksewa.com">support@ranksewa.com</a>.
-            </p>
-
-            <p style="margin-top: 32px;">
-                Best regards,<br>
-                <strong>RankSewa Verification Team</strong><br>
-                <a href="https://ranksewa.com">https://ranksewa.com</a>
-            </p>
-        </div>
-        """
-
         params = {
             "from": "RankSewa Verification <onboarding@ranksewa.com>",
             "to": [to_email],
-            "subject": subject,
-            "html": html_body
+            "subject": "Action Required: Please Resubmit Documents for RankSewa Verification",
+            "html": mailer.render('resubmission_request.html', last_name=last_name, feedback_text=feedback_text)
         }
 
-        email_response = resend.Emails.send(params)
-        print(f"✅ Resubmission request email sent to {to_email}")
+        queue_email(params, category='verification_result')
+        print(f"✅ Resubmission request email queued for {to_email}")
         return True
 
     except Exception as e:
-        print(f"❌ Failed to send resubmission email to {to_email}: {e}")
+        print(f"❌ Failed to queue resubmission email to {to_email}: {e}")
         return False
 
 
@@ -1280,12 +1161,8 @@ def send_admin_verification_notification(verification_request, doctor_name, user
         user_email: Email of the user submitting request
 
     Returns:
-        True if email sent successfully, False otherwise
+        True if email queued successfully, False otherwise
     """
-    if not resend_key:
-        app.logger.warning("RESEND_API_KEY not set. Skipping admin verification notification.")
-        return False
-
     try:
         admin_emails = admin_email_set()
         fallback_admin = os.getenv('ADMIN_EMAIL')
@@ -1297,53 +1174,26 @@ def send_admin_verification_notification(verification_request, doctor_name, user
 
         request_type = "New Doctor Registration" if verification_request.is_new_doctor else "Profile Claim"
 
-        subject = f"New Verification Request: {doctor_name}"
-
-        html_body = f"""
-        <div style="font-family: Arial, Helvetica, sans-serif; line-height: 1.6; color: #111;">
-            <h2 style="color: #2563eb;">🔔 New Verification Request</h2>
-
-            <p><strong>Type:</strong> {request_type}</p>
-            <p><strong>Doctor Name:</strong> {doctor_name}</p>
-            <p><strong>User Email:</strong> {user_email}</p>
-            <p><strong>NMC Number:</strong> {verification_request.nmc_number or 'Not provided'}</p>
-            <p><strong>Submitted:</strong> {verification_request.created_at.strftime('%B %d, %Y at %I:%M %p') if verification_request.created_at else 'Just now'}</p>
-
-            <div style="margin: 30px 0; padding: 20px; background-color: #f3f4f6; border-left: 4px solid #2563eb;">
-                <p style="margin: 0;"><strong>Action Required:</strong></p>
-                <p style="margin: 10px 0 0 0;">Review and approve/reject this verification request in your admin panel.</p>
-            </div>
-
-            <p>
-                <a href="https://ranksewa.com/admin/verification-requests/{verification_request.id}"
-                   style="display: inline-block; padding: 12px 24px; background-color: #2563eb; color: white; text-decoration: none; border-radius: 6px; font-weight: bold;">
-                    Review Request →
-                </a>
-            </p>
-
-            <hr style="margin: 30px 0; border: none; border-top: 1px solid #e5e7eb;">
-
-            <p style="color: #6b7280; font-size: 14px;">
-                This is an automated notification from RankSewa.<br>
-                <a href="https://ranksewa.com/admin/verification-requests" style="color: #2563eb;">View all pending requests</a>
-            </p>
-        </div>
-        """
-
         params = {
             "from": "RankSewa Admin <onboarding@ranksewa.com>",
             "to": sorted(admin_emails),
-            "subject": subject,
-            "html": html_body,
+            "subject": f"New Verification Request: {doctor_name}",
+            "html": mailer.render(
+                'admin_verification_notification.html',
+                request_type=request_type,
+                doctor_name=doctor_name,
+                user_email=user_email,
+                verification_request=verification_request
+            ),
             "reply_to": user_email
         }
 
-        email_response = resend.Emails.send(params)
-        print(f"✅ Admin notification sent to {', '.join(sorted(admin_emails))} for {doctor_name}")
+        queue_email(params, category='admin_notification', dedupe_key=f'verification-admin:{verification_request.id}')
+        print(f"✅ Admin notification queued for {', '.join(sorted(admin_emails))} for {doctor_name}")
         return True
 
     except Exception as e:
-        print(f"❌ Failed to send admin notification: {e}")
+        print(f"❌ Failed to queue admin notification: {e}")
         return False
 
 def generate_unique_slug(name, doctor_id=None):
@@ -1370,62 +1220,52 @@ def generate_unique_clinic_slug(name, clinic_id=None):
         counter += 1
 
 
-def get_doctor_avatar_url(doctor_name, doctor_id):
+def avatar_url_prefix():
+    """URL prefix for the initials avatar route, resolved once per request instead of per row"""
+    return url_for('doctor_initials_avatar', initials='X', color=avatars.AVATAR_COLORS[0])[:-len(f'X/{avatars.AVATAR_COLORS[0]}.svg')]
+
+
+def get_doctor_avatar_url(doctor_name, doctor_id, avatar_prefix=None):
     """
-    Generate professional avatar URL for doctors without photos.
-    Uses DiceBear Avatars API to create unique, professional initials-based avatars.
+    Initials avatar URL for doctors without photos (served by doctor_initials_avatar, see avatars.py)
 
     Args:
         doctor_name: Full name of the doctor (e.g., "Dr. Ramesh Sharma")
         doctor_id: Unique doctor ID for color consistency
+        avatar_prefix: result of avatar_url_prefix(), when building many URLs
 
     Returns:
-        URL to professional avatar image
+        URL to the avatar image, e.g. /avatars/RS/0D8ABC.svg
     """
-    from urllib.parse import quote
-
-    # Color palette - professional medical colors
-    colors = [
-        '0D8ABC',  # Medical blue
-        '2a9d8f',  # Teal
-        'e76f51',  # Coral
-        'f4a261',  # Sandy brown
-        '264653',  # Dark blue-green
-        '9b59b6',  # Purple
-        '3498db',  # Sky blue
-        '16a085',  # Green sea
-    ]
-
-    # Select color based on doctor ID for consistency
-    color = colors[doctor_id % len(colors)]
-
-    # Normalize to avoid "Dr" being used as the first initial
-    cleaned_name = doctor_name or ''
-    title_pattern = r'^\s*(dr|mr|mrs|ms|prof|professor|asst|assistant|assoc|associate)\.?\s+'
-    while re.match(title_pattern, cleaned_name, flags=re.IGNORECASE):
-        cleaned_name = re.sub(title_pattern, '', cleaned_name, flags=re.IGNORECASE)
-    cleaned_name = re.sub(r'\s+', ' ', cleaned_name).strip()
-    seed_name = cleaned_name or doctor_name
-
-    # URL encode the doctor name for seed
-    seed = quote(seed_name)
-
-    # Generate DiceBear initials avatar URL
-    return f"https://api.dicebear.com/7.x/initials/svg?seed={seed}&backgroundColor={color}"
+    if avatar_prefix is None:
+        avatar_prefix = avatar_url_prefix()
+    initials = avatars.initials_for(doctor_name)
+    return f"{avatar_prefix}{quote(initials)}/{avatars.color_for(doctor_id)}.svg"
 
 
 # Register as Jinja template filter
 @app.template_filter('doctor_avatar')
 def doctor_avatar_filter(doctor):
     """
-    Jinja template filter to get doctor avatar URL.
+    Jinja template filter for a doctor's initials avatar URL (also the
+    onerror fallback when a photo fails to load).
     Usage in templates: {{ doctor|doctor_avatar }}
     """
-    if doctor.photo_url:
-        return doctor.photo_url
     return get_doctor_avatar_url(doctor.name, doctor.id)
 
 
+@app.template_filter('doctor_avatar_srcset')
+def doctor_avatar_srcset_filter(doctor, fmt='jpeg'):
+    """
+    Jinja template filter for the srcset of a doctor's photo renditions.
+    Empty until the photo has renditions (see image_variants.py).
+    Usage in templates: {{ doctor|doctor_avatar_srcset }}, {{ doctor|doctor_avatar_srcset('webp') }}
+    """
+    if not doctor.photo_url or not doctor.photo_variants:
+        return ''
+    return photo_srcset(doctor.photo_url, fmt, photo_url_prefix())
+
+
 @app.template_filter('from_json')
 def from_json_filter(json_string):
     """
@@ -1445,21 +1285,14 @@ def markdown_filter(text):
     """
     Jinja template filter to convert Markdown to HTML.
     Usage in templates: {{ article.content|markdown|safe }}
+
+    Articles should use their pre-rendered HTML (article_render.get_article_html);
+    this filter is memoized per process for any other Markdown.
     """
     if not text:
         return ''
 
-    import markdown
-    from markdown.extensions import fenced_code, tables, nl2br
-
-    md = markdown.Markdown(extensions=[
-        'fenced_code',
-        'tables',
-        'nl2br',
-        'toc'
-    ])
-
-    return md.convert(text)
+    return article_render.render_markdown_cached(text)[0]
 
 
 @app.template_filter('doctor_title')
@@ -1482,69 +1315,28 @@ def doctor_title_filter(name):
     return f'Dr. {name}'
 
 
-def optimize_and_save_article_image(image_file):
-    """
-    Optimize uploaded article image and save to static/img/articles/
+# --- Off-request image processing (see image_processing.py) ---
+@image_processing.processor('profile_photo', Doctor, 'photo_url', 'photo_upload_token',
+                            discard=lambda path: upload_utils.delete_profile_photo(app.config['UPLOAD_FOLDER'], path))
+def process_profile_photo_upload(staged_path, doctor_id):
+    """Resize a staged profile photo and store it with its renditions"""
+    photo_path = upload_utils.process_profile_photo(staged_path, app.config['UPLOAD_FOLDER'], doctor_id)
+    return {'photo_url': photo_path, 'photo_variants': True}
 
-    - Resizes to optimal social sharing size (1200x630px for OG tags)
-    - Compresses for web (reduces file size 60-80%)
-    - Converts to JPEG for consistency
-    - Generates unique filename
 
-    Returns: relative path like 'img/articles/abc123.jpg' or None if error
-    """
-    try:
-        # Generate unique filename
-        random_hex = secrets.token_hex(8)
-        filename = f"{random_hex}.jpg"
-        filepath = os.path.join('static', 'img', 'articles', filename)
-
-        # Open and optimize image
-        img = Image.open(image_file)
-
-        # Convert to RGB if necessary (handles PNG with transparency, etc.)
-        if img.mode != 'RGB':
-            # Create white background for images with transparency
-            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'RGBA' or 'transparency' in img.info:
-                # Paste with alpha channel as mask
-                rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            else:
-                rgb_img.paste(img)
-            img = rgb_img
-
-        # Resize to optimal social sharing size (1200x630px for OG tags)
-        # This is the perfect size for Facebook/Twitter/LinkedIn sharing
-        target_width = 1200
-        target_height = 630
-
-        # Calculate aspect ratio
-        aspect = img.width / img.height
-        target_aspect = target_width / target_height
-
-        if aspect > target_aspect:
-            # Image is wider - crop width
-            new_width = int(img.height * target_aspect)
-            left = (img.width - new_width) // 2
-            img = img.crop((left, 0, left + new_width, img.height))
-        else:
-            # Image is taller - crop height
-            new_height = int(img.width / target_aspect)
-            top = (img.height - new_height) // 2
-            img = img.crop((0, top, img.width, top + new_height))
+@image_processing.processor('clinic_logo', Clinic, 'logo_url', 'logo_upload_token',
+                            discard=lambda path: upload_utils.delete_clinic_logo(app.config['UPLOAD_FOLDER'], path))
+def process_clinic_logo_upload(staged_path, clinic_id):
+    """Resize and store a staged clinic logo"""
+    return {'logo_url': upload_utils.process_clinic_logo(staged_path, app.config['UPLOAD_FOLDER'], clinic_id)}
 
-        # Resize to target dimensions
-        img = img.resize((target_width, target_height), Image.Resampling.LANCZOS)
 
-        # Save with high quality JPEG compression (85 = good balance of quality/size)
-        img.save(filepath, 'JPEG', quality=85, optimize=True)
-
-        # Return relative path for database (without 'static/' prefix)
-        return f"img/articles/{filename}"
-
-    except Exception as e:
-        print(f"Error optimizing image: {e}")
-        return None
+@image_processing.processor('article_image', Article, 'featured_image', 'featured_image_upload_token',
+                            discard=upload_utils.delete_article_image,
+                            after=lambda article_id: invalidate_health_digest_cache())
+def process_article_image_upload(staged_path, article_id):
+    """Crop a staged article image to 1200x630 (OG size) under static/img/articles/"""
+    return {'featured_image': upload_utils.process_article_image(staged_path)}
 
 
 # --- Authentication Routes ---
@@ -2116,11 +1908,17 @@ def pricing():
 
 @app.route('/sitemap.xml')
 def sitemap():
-    """Generate sitemap for Google Search Console"""
-    from sitemap import generate_sitemap
-    sitemap_xml = generate_sitemap(app, db)
-
-    response = make_response(sitemap_xml)
+    """Serve the sitemap regenerated by the 'regenerate_sitemap' maintenance task"""
+    from sitemap import generate_sitemap, SITEMAP_DOCUMENT
+    from models import CachedDocument
+
+    document = db.session.get(CachedDocument, SITEMAP_DOCUMENT)
+    if document is None:
+        # Not generated yet (fresh database, worker not started)
+        response = make_response(generate_sitemap(app, db))
+    else:
+        response = make_response(document.content)
+        response.last_modified = document.generated_at
     response.headers['Content-Type'] = 'application/xml'
     return response
 
@@ -2228,64 +2026,111 @@ Sitemap: https://ranksewa.com/sitemap.xml
     response.headers['Content-Type'] = 'text/plain'
     return response
 
+# --- Health Digest Sidebar Cache ---
+# Category counts and Editor's Picks change only when an admin edits articles,
+# so they are cached per process and dropped by invalidate_health_digest_cache().
+_health_digest_cache = {
+    'data': None,
+    'expires_at': None
+}
+HEALTH_DIGEST_CACHE_TTL = 600  # 10 minutes (bounds staleness on other workers)
+HEALTH_DIGEST_PER_PAGE = 20
+
+
+def invalidate_health_digest_cache():
+    """Drop cached category counts/featured articles after an article changes"""
+    _health_digest_cache['data'] = None
+    _health_digest_cache['expires_at'] = None
+
+
+def get_health_digest_sidebar():
+    """Get cached categories (with published article counts) and featured articles
+
+    Returns plain dicts instead of ORM objects to avoid DetachedInstanceError
+    when cached objects are accessed across different requests/sessions.
+    """
+    import time
+    from sqlalchemy import func
+    now = time.time()
+
+    if _health_digest_cache['data'] and _health_digest_cache['expires_at'] and now < _health_digest_cache['expires_at']:
+        return _health_digest_cache['data']
+
+    counts = dict(
+        db.session.query(Article.category_id, func.count(Article.id))
+        .filter(Article.is_published.is_(True))
+        .group_by(Article.category_id)
+        .all()
+    )
+    categories = [
+        {'id': cat.id, 'name': cat.name, 'slug': cat.slug, 'article_count': counts.get(cat.id, 0)}
+        for cat in ArticleCategory.query.order_by(ArticleCategory.display_order).all()
+    ]
+    featured_articles = [
+        {'slug': slug, 'title': title}
+        for slug, title in db.session.query(Article.slug, Article.title).filter(
+            Article.is_published.is_(True),
+            Article.is_featured.is_(True)
+        ).order_by(Article.published_at.desc()).limit(3).all()
+    ]
+
+    data = {
+        'categories': categories,
+        'total_articles': sum(counts.values()),
+        'featured_articles': featured_articles,
+    }
+    _health_digest_cache['data'] = data
+    _health_digest_cache['expires_at'] = now + HEALTH_DIGEST_CACHE_TTL
+    return data
+
+
 @app.route('/health-digest')
 def health_digest():
     """Health digest article listing page"""
     # Get filter parameters
     category_slug = request.args.get('category')
     search_query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
 
-    # Base query - only published articles
-    query = Article.query.filter_by(is_published=True)
+    sidebar = get_health_digest_sidebar()
+
+    # Base query - only published articles (category is shown on every card)
+    query = Article.query.options(joinedload(Article.category)).filter_by(is_published=True)
 
     # Filter by category if specified
+    category = None
     if category_slug:
-        category = ArticleCategory.query.filter_by(slug=category_slug).first_or_404()
-        query = query.filter_by(category_id=category.id)
-    else:
-        category = None
+        category = next((cat for cat in sidebar['categories'] if cat['slug'] == category_slug), None)
+        if not category:
+            abort(404)
+        query = query.filter_by(category_id=category['id'])
 
-    # Search if query provided
+    # Search uses the precomputed full-text index (see article_search.py)
     if search_query:
-        search_pattern = f'%{search_query}%'
-        query = query.filter(
-            db.or_(
-                Article.title.ilike(search_pattern),
-                Article.summary.ilike(search_pattern),
-                Article.content.ilike(search_pattern)
-            )
-        )
+        query = article_search.apply_search(query, search_query)
 
     # Order by featured first, then by published date
-    articles = query.order_by(
+    pagination = query.order_by(
         Article.is_featured.desc(),
         Article.published_at.desc()
-    ).all()
-
-    # Get all categories for filter menu
-    categories = ArticleCategory.query.order_by(ArticleCategory.display_order).all()
-
-    # Get featured articles for sidebar
-    featured_articles = Article.query.filter_by(
-        is_published=True,
-        is_featured=True
-    ).order_by(Article.published_at.desc()).limit(3).all()
+    ).paginate(page=page, per_page=HEALTH_DIGEST_PER_PAGE, error_out=False)
 
     return render_template('health_digest.html',
-                         articles=articles,
-                         categories=categories,
+                         articles=pagination.items,
+                         pagination=pagination,
+                         categories=sidebar['categories'],
+                         total_articles=sidebar['total_articles'],
                          current_category=category,
-                         featured_articles=featured_articles,
+                         featured_articles=sidebar['featured_articles'],
                          search_query=search_query)
 
 
 @app.route('/health-digest/<slug>')
 def article_detail(slug):
     """Individual article detail page"""
-    # Get article and increment view count
+    # Get article; the view is counted in memory and flushed in batches
     article = Article.query.filter_by(slug=slug, is_published=True).first_or_404()
-    article.view_count += 1
-    db.session.commit()
+    view_counter.record_article_view(article.id)
 
     # Get related articles (same category, exclude current)
     related_articles = Article.query.filter_by(
@@ -2307,53 +2152,34 @@ def article_detail(slug):
             Doctor.is_featured.desc()
         ).limit(4).all()
 
-    return render_template('article_detail.html',
+    # Pre-rendered on save - no Markdown parsing on the request path
+    article_html, article_toc = article_render.get_article_html(article)
+
+    response = make_response(render_template('article_detail.html',
                          article=article,
+                         article_html=article_html,
+                         article_toc=article_toc,
                          related_articles=related_articles,
-                         related_doctors=related_doctors)
+                         related_doctors=related_doctors))
+
+    # No per-view write anymore, so anonymous page views can be cached briefly
+    if 'user_id' not in session:
+        response.headers['Cache-Control'] = f'public, max-age={ARTICLE_PAGE_CACHE_SECONDS}'
+    return response
 
 
 @app.route('/leaderboard')
 def leaderboard():
-    """Show top reviewers leaderboard"""
-    from sqlalchemy import func, desc
-
-    # Get top reviewers by points
-    top_by_points = User.query.filter(User.points > 0)\
-        .order_by(desc(User.points))\
-        .limit(50).all()
-
-    # Get top reviewers by review count
-    top_by_reviews = db.session.query(User)\
-        .join(Rating)\
-        .group_by(User.id)\
-        .order_by(desc(func.count(Rating.id)))\
-        .limit(50).all()
-
-    # Get top reviewers by helpful votes (most helpful)
-    # This is more complex - need to count helpful votes across all their reviews
-    from sqlalchemy import select
-    helpful_subquery = db.session.query(
-        Rating.user_id,
-        func.count(ReviewHelpful.id).label('helpful_count')
-    ).join(ReviewHelpful, Rating.id == ReviewHelpful.rating_id)\
-     .group_by(Rating.user_id)\
-     .subquery()
-
-    top_by_helpful = db.session.query(User)\
-        .join(helpful_subquery, User.id == helpful_subquery.c.user_id)\
-        .order_by(desc(helpful_subquery.c.helpful_count))\
-        .limit(50).all()
-
-    # Get all badge definitions for display
-    badges = BadgeDefinition.query.filter_by(is_active=True)\
-        .order_by(BadgeDefinition.display_order).all()
+    """Show top reviewers leaderboard (served from the periodically rebuilt snapshot)"""
+    import gamification
+
+    boards = gamification.get_leaderboard()
 
     return render_template('leaderboard.html',
-                         top_by_points=top_by_points,
-                         top_by_reviews=top_by_reviews,
-                         top_by_helpful=top_by_helpful,
-                         badges=badges)
+                         top_by_points=boards['points'],
+                         top_by_reviews=boards['reviews'],
+                         top_by_helpful=boards['helpful'],
+                         badges=gamification.get_active_badges())
 
 # --- Doctor Verification Routes ---
 @app.route('/claim-profile', methods=['GET'])
@@ -2752,74 +2578,27 @@ def claim_profile_submit(doctor_id):
             flash('NMC Practice License is required for verification.', 'danger')
             return redirect(url_for('claim_profile_form', doctor_id=doctor_id))
 
-        # Save files to R2 (with local fallback)
+        # Store files content-addressed (R2 with local fallback, see object_store.py)
         upload_folder = app.config['UPLOAD_FOLDER']
-        govt_id_path = None
-
-        # Try R2 first
         try:
-            govt_id_path = r2_storage.save_verification_document(
-                govt_id, doctor_id, 'govt_id'
-            )
-        except Exception as e:
-            print(f"R2 upload failed, falling back to local storage: {e}")
-            govt_id_path = None
-
-        # Fallback to local storage if R2 fails
-        if not govt_id_path:
-            try:
-                govt_id.seek(0)  # Reset file pointer
-            except Exception:
-                pass  # File might be closed, try upload anyway
-
-            govt_id_path = upload_utils.save_verification_document(
-                govt_id, upload_folder, doctor_id, 'govt_id'
-            )
+            govt_id_path = object_store.save_verification_document(govt_id, upload_folder)
             if not govt_id_path:
                 flash('Error uploading government ID. Please try again.', 'danger')
                 return redirect(url_for('claim_profile_form', doctor_id=doctor_id))
 
-        # Optional medical degree
-        medical_degree_path = None
-        if medical_degree and medical_degree.filename:
-            try:
-                medical_degree_path = r2_storage.save_verification_document(
-                    medical_degree, doctor_id, 'medical_degree'
-                )
-            except Exception as e:
-                print(f"R2 upload failed for medical_degree, falling back: {e}")
-                medical_degree_path = None
-
-            # Fallback to local if R2 fails
-            if not medical_degree_path:
-                try:
-                    medical_degree.seek(0)
-                except Exception:
-                    pass
-                medical_degree_path = upload_utils.save_verification_document(
-                    medical_degree, upload_folder, doctor_id, 'medical_degree'
-                )
+            # Optional medical degree
+            medical_degree_path = None
+            if medical_degree and medical_degree.filename:
+                medical_degree_path = object_store.save_verification_document(medical_degree, upload_folder)
 
-        # Optional practice license
-        practice_license_path = None
-        if practice_license and practice_license.filename:
-            try:
-                practice_license_path = r2_storage.save_verification_document(
-                    practice_license, doctor_id, 'practice_license'
-                )
-            except Exception as e:
-                print(f"R2 upload failed for practice_license, falling back: {e}")
-                practice_license_path = None
-
-            # Fallback to local if R2 fails
-            if not practice_license_path:
-                try:
-                    practice_license.seek(0)
-                except Exception:
-                    pass
-                practice_license_path = upload_utils.save_verification_document(
-                    practice_license, upload_folder, doctor_id, 'practice_license'
-                )
+            # Optional practice license
+            practice_license_path = None
+            if practice_license and practice_license.filename:
+                practice_license_path = object_store.save_verification_document(practice_license, upload_folder)
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('claim_profile_form', doctor_id=doctor_id))
 
         # Handle Ranksewa Network opt-in
         ranksewa_network = request.form.get('ranksewa_network') == 'on'
@@ -3042,74 +2821,30 @@ def doctor_self_register_submit():
             flash('NMC Practice License is required for verification.', 'danger')
             return redirect(url_for('doctor_self_register'))
 
-        # Handle document uploads
+        # Store documents content-addressed (R2 with local fallback, see object_store.py)
         upload_folder = app.config['UPLOAD_FOLDER']
-
-        # Use a temporary ID for uploads (user_id since no doctor exists yet)
-        temp_upload_id = f"pending_{user_id}"
-
-        # Upload government ID (required)
-        govt_id_path = None
         try:
-            govt_id_path = r2_storage.save_verification_document(
-                govt_id, temp_upload_id, 'govt_id'
-            )
-        except Exception as e:
-            print(f"R2 upload failed, falling back to local storage: {e}")
-
-        if not govt_id_path:
-            try:
-                govt_id.seek(0)
-            except Exception:
-                pass
-            govt_id_path = upload_utils.save_verification_document(
-                govt_id, upload_folder, temp_upload_id, 'govt_id'
-            )
-
-        if not govt_id_path:
-            flash('Failed to upload government ID. Please try again.', 'danger')
-            return redirect(url_for('doctor_self_register'))
-
-        # Optional medical degree
-        medical_degree = request.files.get('medical_degree')
-        medical_degree_path = None
-        if medical_degree and medical_degree.filename:
-            try:
-                medical_degree_path = r2_storage.save_verification_document(
-                    medical_degree, temp_upload_id, 'medical_degree'
-                )
-            except Exception as e:
-                print(f"R2 upload failed for medical_degree: {e}")
-
-            if not medical_degree_path:
-                try:
-                    medical_degree.seek(0)
-                except Exception:
-                    pass
-                medical_degree_path = upload_utils.save_verification_document(
-                    medical_degree, upload_folder, temp_upload_id, 'medical_degree'
-                )
-
-        # Upload NMC practice license (required - already validated above)
-        practice_license_path = None
-        try:
-            practice_license_path = r2_storage.save_verification_document(
-                practice_license, temp_upload_id, 'practice_license'
-            )
-        except Exception as e:
-            print(f"R2 upload failed for practice_license: {e}")
+            # Upload government ID (required)
+            govt_id_path = object_store.save_verification_document(govt_id, upload_folder)
+            if not govt_id_path:
+                flash('Failed to upload government ID. Please try again.', 'danger')
+                return redirect(url_for('doctor_self_register'))
 
-        if not practice_license_path:
-            try:
-                practice_license.seek(0)
-            except Exception:
-                pass
-            practice_license_path = upload_utils.save_verification_document(
-                practice_license, upload_folder, temp_upload_id, 'practice_license'
-            )
+            # Optional medical degree
+            medical_degree = request.files.get('medical_degree')
+            medical_degree_path = None
+            if medical_degree and medical_degree.filename:
+                medical_degree_path = object_store.save_verification_document(medical_degree, upload_folder)
 
-        if not practice_license_path:
-            flash('Failed to upload NMC Practice License. Please try again.', 'danger')
+            # Upload NMC practice license (required - already validated above)
+            practice_license_path = object_store.save_verification_document(practice_license, upload_folder)
+            if not practice_license_path:
+                db.session.rollback()
+                flash('Failed to upload NMC Practice License. Please try again.', 'danger')
+                return redirect(url_for('doctor_self_register'))
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
             return redirect(url_for('doctor_self_register'))
 
         # Create verification request (NO doctor profile created yet)
@@ -3480,6 +3215,19 @@ def get_homepage_stats():
     return stats
 
 
+CACHE_WARM_INTERVAL = 240  # shorter than the TTLs above, so requests rarely find an expired cache
+
+@maintenance.process_task('warm_caches', CACHE_WARM_INTERVAL)
+def warm_caches():
+    """Refill this process's dropdown, homepage stats and health digest caches off the request path"""
+    _dropdown_cache['expires_at'] = None
+    get_cached_dropdowns()
+    _homepage_stats_cache['expires_at'] = None
+    get_homepage_stats()
+    _health_digest_cache['expires_at'] = None
+    get_health_digest_sidebar()
+
+
 # --- Main App Routes ---
 @app.route('/')
 def index():
@@ -3554,29 +3302,115 @@ def track_human():
     return '', 204  # No Content response
 
 
-@app.route('/doctors')
-def get_doctors():
-    clear_expired_subscriptions()
-    city_id = request.args.get('city_id', '')
-    specialty_id = request.args.get('specialty_id', '')
-    name_search = request.args.get('name', '').strip()
-    page = request.args.get('page', 1, type=int)
-    per_page = 50  # Limit results per page
+# --- Doctor Listing Serialization ---
+# /doctors is the hottest JSON endpoint. Instead of hydrating Doctor entities (plus
+# city/specialty/clinic/user relationships) we select plain columns and build dicts
+# from tuples. Order matters: serialize_doctor_listing_rows() unpacks by position.
+DOCTOR_LISTING_COLUMNS = (
+    Doctor.id, Doctor.name, Doctor.slug, Doctor.city_id, Doctor.specialty_id,
+    Doctor.nmc_number, Doctor.workplace, Doctor.experience, Doctor.education,
+    Doctor.college, Doctor.description, Doctor.photo_url, Doctor.is_featured,
+    Doctor.is_verified, Doctor.specialty_verified, Doctor.profile_views, Doctor.photo_variants,
+)
 
-    # Validate integer parameters to prevent 500 errors (critical for SEO)
-    try:
-        if city_id:
-            city_id = int(city_id)
-        if specialty_id:
-            specialty_id = int(specialty_id)
-    except (ValueError, TypeError):
-        response = jsonify({'error': 'Invalid city_id or specialty_id parameter'})
-        response.status_code = 400
-        return response
+_PHOTO_PATH_SAFE_CHARS = "/:@!$&'()*+,;="
+
+
+def photo_url_prefix():
+    """URL prefix for the serve_photo route, resolved once per request instead of per row"""
+    return url_for('serve_photo', filename='x', _external=False)[:-1]
+
+
+def photo_path_from_url(photo_url):
+    """Map a stored Doctor.photo_url to the serve_photo filename"""
+    if photo_url.count('/') > 1:
+        # R2 format: photos/{doctor_id}/{filename} - remove 'photos/' prefix for the route
+        return photo_url.replace('photos/', '')
+    # Local format: photos/{filename}
+    return photo_url.split('/')[-1]
+
+
+def photo_srcset(photo_url, fmt, photo_prefix):
+    """srcset listing a stored photo's renditions in one format ('jpeg' or 'webp')"""
+    return ', '.join(
+        f"{photo_prefix}{quote(photo_path_from_url(image_variants.variant_key(photo_url, width, fmt)), safe=_PHOTO_PATH_SAFE_CHARS)} {width}w"
+        for width in image_variants.VARIANT_WIDTHS
+    )
 
-    # Build query with rating aggregates and eager loading to prevent N+1 queries
-    from sqlalchemy import func, case, and_
-    from sqlalchemy.orm import selectinload
+
+def serialize_doctor_listing_rows(rows, photo_prefix, avatar_prefix=None):
+    """Turn projected /doctors rows into JSON-ready dicts
+
+    Args:
+        rows: tuples of DOCTOR_LISTING_COLUMNS followed by city_name, clinic_name,
+              clinic_slug, specialty_name, is_claimed, avg_rating, rating_count,
+              profile_score, response_count
+        photo_prefix: result of photo_url_prefix()
+        avatar_prefix: result of avatar_url_prefix()
+    """
+    if avatar_prefix is None:
+        avatar_prefix = avatar_url_prefix()
+    doctors_list = []
+    append = doctors_list.append
+    for (doctor_id, name, slug, city_id, specialty_id, nmc_number, workplace, experience,
+         education, college, description, photo_url, is_featured, is_verified,
+         specialty_verified, profile_views, photo_variants, city_name, clinic_name, clinic_slug,
+         specialty_name, is_claimed, avg_rating_value, rating_count_value,
+         profile_score_value, response_count_value) in rows:
+        photo_srcset_jpeg = photo_srcset_webp = None
+        if photo_url:
+            if photo_variants:
+                photo_srcset_jpeg = photo_srcset(photo_url, 'jpeg', photo_prefix)
+                photo_srcset_webp = photo_srcset(photo_url, 'webp', photo_prefix)
+            photo_url = photo_prefix + quote(photo_path_from_url(photo_url), safe=_PHOTO_PATH_SAFE_CHARS)
+
+        # Calculate response rate for this doctor
+        rating_count_int = int(rating_count_value or 0)
+        response_count_int = int(response_count_value or 0)
+        response_rate = (response_count_int / rating_count_int * 100) if rating_count_int > 0 else 0
+
+        append({
+            'id': doctor_id,
+            'name': name,
+            'slug': slug,
+            'city_id': city_id,  # TODO: Use local_level_id after migration
+            'city_name': city_name or 'Unknown',
+            'clinic_name': clinic_name,
+            'clinic_slug': clinic_slug,
+            'specialty_id': specialty_id,
+            'specialty_name': specialty_name,
+            'nmc_number': nmc_number,
+            'workplace': workplace,
+            'experience': experience,
+            'education': education,
+            'college': college,
+            'description': description,
+            'photo_url': photo_url or None,
+            'photo_srcset': photo_srcset_jpeg,
+            'photo_srcset_webp': photo_srcset_webp,
+            'avatar_url': get_doctor_avatar_url(name, doctor_id, avatar_prefix),
+            'is_featured': is_featured,
+            'is_verified': is_verified,
+            'specialty_verified': specialty_verified,
+            'is_claimed': bool(is_claimed),
+            'avg_rating': float(avg_rating_value or 0),
+            'rating_count': rating_count_int,
+            'profile_completion': int(profile_score_value or 0),
+            'response_rate': int(response_rate),
+            'profile_views': profile_views or 0
+        })
+    return doctors_list
+
+
+def build_doctor_ranking_subqueries():
+    """Aggregate subqueries used to rank /doctors results
+
+    Returns:
+        (rating_stats, response_counts) - rating_stats has avg_rating, rating_count,
+        rating_score, sort_rank, profile_score and review_bonus per doctor_id;
+        response_counts has response_count per doctor_id.
+    """
+    from sqlalchemy import func, case
 
     # Rating statistics
     avg_rating = func.coalesce(func.avg(Rating.rating), 0).label('avg_rating')
@@ -3628,42 +3462,87 @@ def get_doctors():
         review_bonus
     ).outerjoin(Rating).group_by(Doctor.id).subquery()
 
+    return rating_stats, response_counts
+
+
+def fast_json_response(payload, status=200):
+    """JSON response encoded with orjson when available (falls back to compact json.dumps)"""
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, separators=(',', ':'), default=str)
+    return app.response_class(body, status=status, mimetype='application/json')
+
+
+@app.route('/doctors')
+def get_doctors():
+    city_id = request.args.get('city_id', '')
+    specialty_id = request.args.get('specialty_id', '')
+    name_search = request.args.get('name', '').strip()
+    page = request.args.get('page', 1, type=int)
+    per_page = 50  # Limit results per page
+
+    # Validate integer parameters to prevent 500 errors (critical for SEO)
+    try:
+        if city_id:
+            city_id = int(city_id)
+        if specialty_id:
+            specialty_id = int(specialty_id)
+    except (ValueError, TypeError):
+        response = jsonify({'error': 'Invalid city_id or specialty_id parameter'})
+        response.status_code = 400
+        return response
+
+    # Build query with rating aggregates joined in SQL to prevent N+1 queries
+    from sqlalchemy import func
+    rating_stats, response_counts = build_doctor_ranking_subqueries()
+
+    # Claimed = some user account points at this doctor. EXISTS avoids loading the User rows.
+    is_claimed = db.session.query(User.id).filter(User.doctor_id == Doctor.id).exists().label('is_claimed')
+
+    # Column projection: fetch only the fields we serialize, with display names joined in SQL
     query = db.session.query(
-        Doctor,
+        *DOCTOR_LISTING_COLUMNS,
+        City.name.label('city_name'),
+        Clinic.name.label('clinic_name'),
+        Clinic.slug.label('clinic_slug'),
+        Specialty.name.label('specialty_name'),
+        is_claimed,
         rating_stats.c.avg_rating,
         rating_stats.c.rating_count,
-        rating_stats.c.rating_score,
-        rating_stats.c.sort_rank,
         rating_stats.c.profile_score,
         func.coalesce(response_counts.c.response_count, 0).label('response_count')
     ).join(rating_stats, Doctor.id == rating_stats.c.doctor_id).outerjoin(
         response_counts, Doctor.id == response_counts.c.doctor_id
-    ).options(
-        selectinload(Doctor.city),
-        selectinload(Doctor.local_level),
-        selectinload(Doctor.specialty),
-        selectinload(Doctor.clinic),
-        selectinload(Doctor.user_account)
-    ).filter(Doctor.is_active.is_(True))  # Show all active doctors (NMC city = practice location)
+    ).outerjoin(City, Doctor.city_id == City.id)\
+     .outerjoin(Specialty, Doctor.specialty_id == Specialty.id)\
+     .outerjoin(Clinic, Doctor.clinic_id == Clinic.id)
+
+    # Count only needs the filters, not the rating/response aggregates
+    count_query = db.session.query(func.count(Doctor.id))
+    if name_search:
+        count_query = count_query.outerjoin(Clinic, Doctor.clinic_id == Clinic.id)
+
+    filters = [Doctor.is_active.is_(True)]  # Show all active doctors (NMC city = practice location)
 
     if city_id:
         # Filter by local_level_id (dropdown now sends LocalLevel IDs)
-        query = query.filter(Doctor.local_level_id == city_id)
+        filters.append(Doctor.local_level_id == city_id)
 
     if specialty_id:
-        query = query.filter(Doctor.specialty_id == specialty_id)
+        filters.append(Doctor.specialty_id == specialty_id)
 
     if name_search:
         # Search by doctor or clinic name (case-insensitive partial match)
-        query = query.outerjoin(Clinic).filter(
-            or_(
-                Doctor.name.ilike(f'%{name_search}%'),
-                Clinic.name.ilike(f'%{name_search}%')
-            )
-        )
+        filters.append(or_(
+            Doctor.name.ilike(f'%{name_search}%'),
+            Clinic.name.ilike(f'%{name_search}%')
+        ))
+
+    query = query.filter(*filters)
 
     # Get total count BEFORE pagination for pagination UI
-    total_doctors = query.count()
+    total_doctors = count_query.filter(*filters).scalar() or 0
     total_pages = (total_doctors + per_page - 1) // per_page  # Ceiling division
 
     # Order by priority:
@@ -3684,60 +3563,13 @@ def get_doctors():
 
     # Paginate results using offset and limit
     offset = (page - 1) * per_page
-    doctors = query.offset(offset).limit(per_page).all()
+    rows = query.offset(offset).limit(per_page).all()
 
     # Serialize to JSON
-    doctors_list = []
-    for d, avg_rating_value, rating_count_value, _rating_score, _sort_rank, profile_score_value, response_count_value in doctors:
-        # Generate proper photo URL
-        photo_url = None
-        if d.photo_url:
-            # Extract filename/path for serve_photo route
-            if d.photo_url.count('/') > 1:
-                # R2 format: photos/{doctor_id}/{filename}
-                # Remove 'photos/' prefix for the route
-                photo_path = d.photo_url.replace('photos/', '')
-            else:
-                # Local format: photos/{filename}
-                photo_path = d.photo_url.split('/')[-1]
-
-            photo_url = url_for('serve_photo', filename=photo_path, _external=False)
-
-        # Calculate response rate for this doctor
-        rating_count_int = int(rating_count_value or 0)
-        response_count_int = int(response_count_value or 0)
-        response_rate = (response_count_int / rating_count_int * 100) if rating_count_int > 0 else 0
-
-        doctors_list.append({
-            'id': d.id,
-            'name': d.name,
-            'slug': d.slug,
-            'city_id': d.city_id,  # TODO: Use local_level_id after migration
-            'city_name': d.city.name if d.city else 'Unknown',
-            'clinic_name': d.clinic.name if d.clinic else None,
-            'clinic_slug': d.clinic.slug if d.clinic else None,
-            'specialty_id': d.specialty_id,
-            'specialty_name': d.specialty.name,
-            'nmc_number': d.nmc_number,
-            'workplace': d.workplace,
-            'experience': d.experience,
-            'education': d.education,
-            'college': d.college,
-            'description': d.description,
-            'photo_url': photo_url,
-            'is_featured': d.is_featured,
-            'is_verified': d.is_verified,
-            'specialty_verified': d.specialty_verified if hasattr(d, 'specialty_verified') else True,
-            'is_claimed': d.user_account is not None,
-            'avg_rating': float(avg_rating_value or 0),
-            'rating_count': rating_count_int,
-            'profile_completion': int(profile_score_value or 0),
-            'response_rate': int(response_rate),
-            'profile_views': d.profile_views or 0
-        })
+    doctors_list = serialize_doctor_listing_rows(rows, photo_url_prefix(), avatar_url_prefix())
 
     # Add X-Robots-Tag to prevent Google from indexing API responses
-    response = make_response(jsonify({
+    response = fast_json_response({
         'doctors': doctors_list,
         'pagination': {
             'page': page,
@@ -3747,7 +3579,7 @@ def get_doctors():
             'has_next': page < total_pages,
             'has_prev': page > 1
         }
-    }))
+    })
     response.headers['X-Robots-Tag'] = 'noindex, nofollow'
     return response
 
@@ -3954,12 +3786,9 @@ def admin_doctor_new():
                 photo_file = request.files['profile_photo']
                 if photo_file and photo_file.filename:
                     try:
-                        photo_path = upload_utils.save_profile_photo(
-                            photo_file,
-                            app.config['UPLOAD_FOLDER'],
-                            doctor.id
-                        )
-                        doctor.photo_url = photo_path
+                        # Resized and stored off-request; photo_url is set when done
+                        upload_utils.validate_image_upload(photo_file, min_dimension=100)
+                        image_processing.submit('profile_photo', photo_file, doctor)
                     except ValueError as e:
                         flash(f'Error uploading photo: {str(e)}', 'warning')
 
@@ -4072,6 +3901,7 @@ def admin_doctor_edit(doctor_id):
                 return render_template('admin_doctor_form.html', doctor=doctor, cities=cities, specialties=specialties, clinics=clinics)
 
         if name != doctor.name:
+            qr_codes.invalidate(doctor.slug)
             doctor.slug = generate_unique_slug(name, doctor_id=doctor.id)
 
         doctor.name = name
@@ -4100,22 +3930,16 @@ def admin_doctor_edit(doctor_id):
             if 'remove_photo' in request.form and doctor.photo_url:
                 upload_utils.delete_profile_photo(app.config['UPLOAD_FOLDER'], doctor.photo_url)
                 doctor.photo_url = None
+                doctor.photo_variants = False
 
             # Handle photo upload
             if 'profile_photo' in request.files:
                 photo_file = request.files['profile_photo']
                 if photo_file and photo_file.filename:
                     try:
-                        # Delete old photo if exists
-                        if doctor.photo_url:
-                            upload_utils.delete_profile_photo(app.config['UPLOAD_FOLDER'], doctor.photo_url)
-
-                        photo_path = upload_utils.save_profile_photo(
-                            photo_file,
-                            app.config['UPLOAD_FOLDER'],
-                            doctor.id
-                        )
-                        doctor.photo_url = photo_path
+                        # Processed off-request; the old photo is deleted once the new one replaces it
+                        upload_utils.validate_image_upload(photo_file, min_dimension=100)
+                        image_processing.submit('profile_photo', photo_file, doctor)
                     except ValueError as e:
                         flash(f'Error uploading photo: {str(e)}', 'warning')
 
@@ -4539,15 +4363,15 @@ def admin_article_new():
             specialties = Specialty.query.order_by(Specialty.name).all()
             return render_template('admin_article_form.html', article=None, categories=categories, specialties=specialties)
 
-        # Handle image upload
-        featured_image = None
-        if 'featured_image' in request.files:
-            image_file = request.files['featured_image']
-            if image_file and image_file.filename:
-                # Optimize and save image
-                featured_image = optimize_and_save_article_image(image_file)
-                if not featured_image:
-                    flash('Error processing image. Please try again or use a different image.', 'warning')
+        # Validate the image now; it is cropped and saved off-request once the article exists
+        image_file = request.files.get('featured_image')
+        if image_file and image_file.filename:
+            try:
+                upload_utils.validate_image_upload(image_file, max_size_mb=upload_utils.MAX_FILE_SIZE_MB,
+                                                   min_dimension=200, max_dimension=12000, file_type='article_image')
+            except ValueError as e:
+                flash(f'Error processing image: {e}. Please try again or use a different image.', 'warning')
+                image_file = None
 
         # Generate slug from title
         import re
@@ -4565,7 +4389,7 @@ def admin_article_new():
             category_id=category_id,
             summary=summary or None,
             content=content,
-            featured_image=featured_image,
+            featured_image=None,  # Set by image_processing once the upload is processed
             meta_description=meta_description or None,
             meta_keywords=meta_keywords or None,
             related_specialty_id=related_specialty_id,
@@ -4574,7 +4398,11 @@ def admin_article_new():
             published_at=datetime.utcnow() if is_published else None
         )
         db.session.add(article)
+        db.session.flush()
+        if image_file and image_file.filename:
+            image_processing.submit('article_image', image_file, article)
         db.session.commit()
+        invalidate_health_digest_cache()
         flash('Article created successfully!', 'success')
         return redirect(url_for('admin_articles'))
 
@@ -4607,23 +4435,15 @@ def admin_article_edit(article_id):
             return render_template('admin_article_form.html', article=article, categories=categories, specialties=specialties)
 
         # Handle image upload (keep existing image if no new one uploaded)
-        if 'featured_image' in request.files:
-            image_file = request.files['featured_image']
-            if image_file and image_file.filename:
-                # Optimize and save new image
-                new_image_path = optimize_and_save_article_image(image_file)
-                if new_image_path:
-                    # Delete old image file if it exists
-                    if article.featured_image:
-                        old_image_path = os.path.join('static', article.featured_image)
-                        if os.path.exists(old_image_path):
-                            try:
-                                os.remove(old_image_path)
-                            except:
-                                pass  # Ignore errors if file doesn't exist
-                    article.featured_image = new_image_path
-                else:
-                    flash('Error processing new image. Keeping existing image.', 'warning')
+        image_file = request.files.get('featured_image')
+        if image_file and image_file.filename:
+            try:
+                # Processed off-request; the old image is deleted once the new one replaces it
+                upload_utils.validate_image_upload(image_file, max_size_mb=upload_utils.MAX_FILE_SIZE_MB,
+                                                   min_dimension=200, max_dimension=12000, file_type='article_image')
+                image_processing.submit('article_image', image_file, article)
+            except ValueError as e:
+                flash(f'Error processing new image: {e}. Keeping existing image.', 'warning')
 
         article.title = title
         article.category_id = category_id
@@ -4640,6 +4460,7 @@ def admin_article_edit(article_id):
             article.published_at = datetime.utcnow()
 
         db.session.commit()
+        invalidate_health_digest_cache()
         flash('Article updated successfully!', 'success')
         return redirect(url_for('admin_articles'))
 
@@ -4691,6 +4512,7 @@ def admin_article_delete(article_id):
     article = Article.query.get_or_404(article_id)
     db.session.delete(article)
     db.session.commit()
+    invalidate_health_digest_cache()
     flash('Article deleted successfully.', 'success')
     return redirect(url_for('admin_articles'))
 
@@ -4705,12 +4527,19 @@ def admin_email_composer():
     return render_template('admin_email_composer.html',
                          verified_doctors=verified_doctors)
 
+def personalize_email_body(body, doctor_name):
+    """Fill the composer templates' "Dr. [Name]" / "[Name]" placeholders for one doctor"""
+    body = body.replace('Dr. [Name]', str(escape(doctor_title_filter(doctor_name))))
+    return body.replace('[Name]', str(escape(doctor_name or '')))
+
+
 @app.route('/admin/send-email', methods=['POST'])
 @admin_required
 def admin_send_email():
-    """Send email to doctor(s)"""
+    """Send email to one doctor, or an announcement to every claimed doctor"""
     doctor_id = request.form.get('doctor_id')
     recipient_email = request.form.get('recipient_email', '').strip()
+    send_to_all_claimed = request.form.get('audience') == 'all_claimed'
     subject = request.form.get('subject', '').strip()
     body = request.form.get('body', '').strip()
 
@@ -4719,6 +4548,30 @@ def admin_send_email():
         flash('Subject and body are required', 'danger')
         return redirect(url_for('admin_email_composer'))
 
+    if send_to_all_claimed:
+        # Every active doctor profile with a linked user account, each greeted by name
+        recipients = db.session.query(User.email, Doctor.name)\
+            .join(Doctor, Doctor.id == User.doctor_id)\
+            .filter(User.is_active == True, Doctor.is_active == True, User.email.isnot(None))\
+            .distinct().all()
+        messages = [{
+            "from": "RankSewa Support <support@ranksewa.com>",
+            "to": [email],
+            "subject": subject,
+            "html": mailer.render('admin_message.html', body=personalize_email_body(body, name)),
+            "reply_to": "support@ranksewa.com"
+        } for email, name in recipients]
+        try:
+            queued = mailer.queue_messages(messages, category='announcement')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'❌ Failed to queue announcement: {str(e)}', 'danger')
+            print(f"[EMAIL ERROR] Failed to queue announcement: {e}")
+            return redirect(url_for('admin_email_composer'))
+        flash(f'✅ Announcement queued for {queued} claimed doctors.', 'success')
+        print(f"[EMAIL] Announcement queued for {queued} doctors: {subject}")
+        return redirect(url_for('admin_email_composer'))
+
     # Determine recipient
     to_email = None
     doctor_name = None
@@ -4740,15 +4593,13 @@ def admin_send_email():
         flash('Please select a doctor or enter an email address', 'danger')
         return redirect(url_for('admin_email_composer'))
 
-    # Send email using Resend
-    try:
-        # Wrap body in professional HTML template
-        html_body = f"""
-        <div style="font-family: Arial, Helvetica, sans-serif; line-height: 1.6; color: #111;">
-            {body}
-        </div>
-        """
+    if doctor_id:
+        body = personalize_email_body(body, doctor_name)
+    # Wrap body in professional HTML template
+    html_body = mailer.render('admin_message.html', body=body)
 
+    # Queue for the outbox worker
+    try:
         params = {
             "from": "RankSewa Support <support@ranksewa.com>",
             "to": [to_email],
@@ -4757,14 +4608,15 @@ def admin_send_email():
             "reply_to": "support@ranksewa.com"
         }
 
-        response = resend.Emails.send(params)
+        queue_email(params, category='admin')
 
-        flash(f'✅ Email sent successfully to {to_email}!', 'success')
-        print(f"[EMAIL] Sent to {to_email}: {subject}")
+        flash(f'✅ Email queued for {to_email}!', 'success')
+        print(f"[EMAIL] Queued for {to_email}: {subject}")
 
     except Exception as e:
-        flash(f'❌ Failed to send email: {str(e)}', 'danger')
-        print(f"[EMAIL ERROR] Failed to send to {to_email}: {e}")
+        db.session.rollback()
+        flash(f'❌ Failed to queue email: {str(e)}', 'danger')
+        print(f"[EMAIL ERROR] Failed to queue for {to_email}: {e}")
         return redirect(url_for('admin_email_composer'))
 
     return redirect(url_for('admin_email_composer'))
@@ -4904,17 +4756,22 @@ def admin_blocklist_toggle(block_id):
 def admin_security_events():
     page = request.args.get('page', 1, type=int)
     per_page = 50
+    # No total count: counting every row of a large (partitioned) table per page view is the slow part
     pagination = SecurityEvent.query.order_by(
         SecurityEvent.created_at.desc()
     ).paginate(
         page=page,
         per_page=per_page,
-        error_out=False
+        error_out=False,
+        count=False
     )
     return render_template(
         'admin_security_events.html',
         events=pagination.items,
-        pagination=pagination
+        pagination=pagination,
+        has_next=len(pagination.items) == per_page,
+        chart=security_events.hourly_chart(),
+        top_ips=security_events.top_ips()
     )
 
 @app.route('/admin/users/<int:user_id>/status', methods=['POST'])
@@ -5106,8 +4963,15 @@ def admin_delete_review(review_id):
         ReviewFlag.query.filter_by(rating_id=review_id).delete()
         # Delete associated helpful votes
         ReviewHelpful.query.filter_by(rating_id=review_id).delete()
+        # Drop it from the near-duplicate index
+        review_dedup.remove_review(review_id)
         # Delete the review
+        author_id = review.user_id
         db.session.delete(review)
+        db.session.flush()
+        # Bring the author's reputation counters back in line
+        from gamification import recalculate_user_counters
+        recalculate_user_counters([author_id])
         db.session.commit()
         flash(f'Review by {user_name} for {doctor_name} has been deleted.', 'success')
     except Exception as e:
@@ -5367,7 +5231,6 @@ def doctor_profile(slug):
     # Query doctor by slug with eager loading to avoid N+1 queries
     from sqlalchemy.orm import joinedload
 
-    clear_expired_subscriptions()
     doctor = Doctor.query.options(
         joinedload(Doctor.ratings).joinedload(Rating.user),
         joinedload(Doctor.specialty),
@@ -5386,51 +5249,23 @@ def doctor_profile(slug):
             user_is_doctor = True
 
     if not user_is_doctor:
-        # Increment total profile views
-        doctor.profile_views = (doctor.profile_views or 0) + 1
-
-        # Track daily analytics (using Nepal timezone)
-        from models import DoctorAnalytics
-        today = nepal_today()
-        analytics = DoctorAnalytics.query.filter_by(
-            doctor_id=doctor.id,
-            date=today
-        ).first()
-
-        if not analytics:
-            analytics = DoctorAnalytics(
-                doctor_id=doctor.id,
-                date=today,
-                profile_views=1,
-                search_appearances=0,
-                search_clicks=0,
-                phone_clicks=0,
-                website_clicks=0,
-                review_button_clicks=0,
-                source_search=0,
-                source_homepage=0,
-                source_google=0,
-                source_direct=0
-            )
-            db.session.add(analytics)
-        else:
-            analytics.profile_views += 1
-
         # Track source
         referrer = request.referrer or ''
+        source_field = None
         if 'doctors?city' in referrer or 'doctors?specialty' in referrer or 'doctors?' in referrer:
-            analytics.source_search = (analytics.source_search or 0) + 1
+            source_field = 'source_search'
         elif 'google' in referrer.lower():
-            analytics.source_google = (analytics.source_google or 0) + 1
+            source_field = 'source_google'
         elif referrer == '' or 'ranksewa.com' not in referrer:
-            analytics.source_direct = (analytics.source_direct or 0) + 1
+            source_field = 'source_direct'
         elif referrer and 'ranksewa.com' in referrer:
             if 'index' in referrer or referrer.endswith('/'):
-                analytics.source_homepage = (analytics.source_homepage or 0) + 1
+                source_field = 'source_homepage'
             else:
-                analytics.source_direct = (analytics.source_direct or 0) + 1
+                source_field = 'source_direct'
 
-        db.session.commit()
+        # Total and daily analytics (Nepal timezone) are counted in memory and flushed in batches
+        view_counter.record_doctor_view(doctor.id, nepal_today(), source_field)
 
     # Get ratings sorted by ID descending
     ratings = sorted(doctor.ratings, key=lambda r: r.id, reverse=True)
@@ -5557,12 +5392,13 @@ def rate_doctor():
         doctor = Doctor.query.get(doctor_id)
         return redirect(url_for('doctor_profile', slug=doctor.slug))
 
-    # Content moderation check (only if comment provided)
+    # Content moderation check (only if comment provided) - one pass that
+    # also feeds the credibility score below
+    analysis = None
     if comment and comment.strip():
-        from content_moderation import moderate_review
-        moderation = moderate_review('', comment)
-        if not moderation['approved']:
-            flash(moderation['message'], 'warning')
+        analysis = review_analysis.analyze_review(comment)
+        if not analysis['approved']:
+            flash(analysis['message'], 'warning')
             doctor = Doctor.query.get(doctor_id)
             return redirect(url_for('doctor_profile', slug=doctor.slug))
 
@@ -5635,19 +5471,6 @@ def rate_doctor():
     db.session.add(new_rating)
     db.session.flush()  # Flush to get the rating ID
 
-    # Calculate credibility score
-    from credibility import calculate_credibility_score, get_credibility_tier
-    user = User.query.get(user_id)
-    credibility_score, credibility_signals = calculate_credibility_score(new_rating, user)
-    credibility_tier = get_credibility_tier(credibility_score)
-
-    # Update the rating with credibility score
-    new_rating.credibility_score = credibility_score
-
-    # Auto-flag low credibility reviews
-    if credibility_tier == 'suspicious':
-        new_rating.is_suspected = True
-
     if is_suspected:
         auto_flag = ReviewFlag(
             rating_id=new_rating.id,
@@ -5657,22 +5480,55 @@ def rate_doctor():
         )
         db.session.add(auto_flag)
 
-    # Award points and badges using gamification system
-    from gamification import process_new_review
-    result = process_new_review(user, new_rating, is_first_for_doctor=is_first_review)
+    # Credibility scoring, near-duplicate indexing, points and badges run in
+    # the job worker (committed together with the review)
+    jobs.enqueue(
+        'process_new_review',
+        {'rating_id': new_rating.id, 'is_first_for_doctor': is_first_review},
+        idempotency_key=f'review:{new_rating.id}'
+    )
 
     # Show success message with points earned
-    points_msg = f"Your review has been submitted! You earned {result['points']} points"
-    if result['badges']:
-        badge_names = ', '.join([b.badge_definition.name for b in result['badges']])
-        points_msg += f" and unlocked: {badge_names}"
-    flash(points_msg, 'success')
+    from gamification import review_points
+    points = review_points(comment, is_first_for_doctor=is_first_review)
+    flash(f"Your review has been submitted! You earned {points} points", 'success')
 
     # Get the doctor's slug to redirect correctly
     doctor = Doctor.query.get(doctor_id)
     return redirect(url_for('doctor_profile', slug=doctor.slug))
 
 
+@jobs.task('process_new_review')
+def process_new_review_job(rating_id, is_first_for_doctor=False):
+    """Score, index and reward a new review (queued by rate_doctor)"""
+    from credibility import calculate_credibility_score, get_credibility_tier
+    from gamification import process_new_review
+
+    new_rating = db.session.get(Rating, rating_id)
+    if new_rating is None:
+        return  # Deleted before the worker got to it
+    user = db.session.get(User, new_rating.user_id)
+
+    analysis = None
+    if new_rating.comment and new_rating.comment.strip():
+        analysis = review_analysis.analyze_review(new_rating.comment)
+
+    # Calculate credibility score
+    credibility_score, credibility_signals = calculate_credibility_score(new_rating, user, analysis=analysis)
+    new_rating.credibility_score = credibility_score
+
+    # Auto-flag low credibility reviews
+    if get_credibility_tier(credibility_score) == 'suspicious':
+        new_rating.is_suspected = True
+
+    # Index the text for cross-doctor near-duplicate checks on later reviews
+    review_dedup.index_review(new_rating)
+
+    # Award points and badges; the worker commits them with the job's status,
+    # so a retried job can't award them twice
+    process_new_review(user, new_rating, is_first_for_doctor=is_first_for_doctor, db_commit=False)
+
+
 @app.route('/flag_review', methods=['POST'])
 def flag_review():
     """Flag a review as inappropriate (content moderation, NOT for negative reviews)"""
@@ -5754,8 +5610,9 @@ def mark_helpful():
 
     if existing_vote:
         # Remove the helpful vote (toggle off)
+        from gamification import process_helpful_vote_removed
         db.session.delete(existing_vote)
-        db.session.commit()
+        process_helpful_vote_removed(rating.user)
         flash('Helpful vote removed.', 'info')
     else:
         # Add helpful vote
@@ -6155,10 +6012,7 @@ def admin_verification_detail(request_id):
 @app.route('/verification/document/<int:request_id>/<doc_type>')
 @admin_required
 def serve_verification_document(request_id, doc_type):
-    """Serve verification documents from R2 (admin only)"""
-    from flask import send_file
-    import io
-
+    """Stream verification documents from R2 or local storage (admin only)"""
     verification_request = VerificationRequest.query.get_or_404(request_id)
 
     # Get the document path based on type
@@ -6176,13 +6030,6 @@ def serve_verification_document(request_id, doc_type):
         flash('Document not found.', 'danger')
         return redirect(url_for('admin_verification_detail', request_id=request_id))
 
-    # Get file from R2
-    file_content = r2_storage.get_verification_document(doc_path)
-
-    if not file_content:
-        flash('Document file not found in storage.', 'warning')
-        return redirect(url_for('admin_verification_detail', request_id=request_id))
-
     # Determine content type based on file extension
     file_ext = doc_path.split('.')[-1].lower()
     content_type_map = {
@@ -6193,21 +6040,37 @@ def serve_verification_document(request_id, doc_type):
     }
     content_type = content_type_map.get(file_ext, 'application/octet-stream')
 
-    # Create a BytesIO object and send file
-    return send_file(
-        io.BytesIO(file_content),
-        mimetype=content_type,
-        as_attachment=False,
-        download_name=doc_path.split('/')[-1]
-    )
+    # Stream from R2 (or local storage), honouring Range and If-None-Match
+    response = object_store.send(doc_path, app.config['UPLOAD_FOLDER'], content_type,
+                                 download_name=doc_path.split('/')[-1])
+    if response is None:
+        flash('Document file not found in storage.', 'warning')
+        return redirect(url_for('admin_verification_detail', request_id=request_id))
+    return response
+
+
+@app.route('/avatars/<initials>/<color>.svg')
+@limiter.exempt
+def doctor_initials_avatar(initials, color):
+    """Initials avatar (see avatars.py); the URL determines the image, so it is cached for a year"""
+    if not avatars.is_valid(initials, color):
+        abort(404)
+    etag = avatars.etag_for(initials, color)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(avatars.render_svg(initials, color))
+        response.mimetype = 'image/svg+xml'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = avatars.AVATAR_CACHE_CONTROL
+    return response
 
 
 @app.route('/uploads/photos/<path:filename>')
 def serve_photo(filename):
-    """Serve profile photos from R2 or local storage (publicly accessible)"""
-    from flask import send_from_directory, send_file, make_response
+    """Serve profile photos from R2 (see media_delivery) or local storage (publicly accessible)"""
+    from flask import send_from_directory, make_response
     import os
-    from io import BytesIO
 
     # Security: Prevent directory traversal
     if '..' in filename or filename.startswith('/'):
@@ -6215,21 +6078,12 @@ def serve_photo(filename):
 
     # If filename contains doctor ID (R2 format: {doctor_id}/{filename}), try R2 first
     if '/' in filename:
-        # Try to fetch from R2
         try:
-            from r2_storage import get_verification_document
-            # For photos, use photos/{doctor_id}/{filename} format
-            r2_path = f"photos/{filename}"
-            photo_data = get_verification_document(r2_path)
-            if photo_data:
-                response = make_response(send_file(
-                    BytesIO(photo_data),
-                    mimetype='image/jpeg',
-                    as_attachment=False
-                ))
-                # Add cache headers - cache for 7 days (photos rarely change)
-                response.headers['Cache-Control'] = 'public, max-age=604800, immutable'
-                response.headers['Expires'] = '7 days'
+            # For photos, use photos/{doctor_id}/{filename} format. Photos are always
+            # JPEG whatever their extension; only renditions may be WebP
+            mimetype = 'image/webp' if filename.endswith('.webp') else 'image/jpeg'
+            response = media_delivery.serve_r2_object(f"photos/{filename}", mimetype)
+            if response is not None:
                 return response
         except Exception as e:
             print(f"[R2] Error fetching photo from R2: {e}")
@@ -6244,19 +6098,31 @@ def serve_photo(filename):
     if os.path.exists(local_path):
         response = make_response(send_from_directory(photos_folder, filename))
         # Add cache headers - cache for 7 days
-        response.headers['Cache-Control'] = 'public, max-age=604800, immutable'
-        response.headers['Expires'] = '7 days'
+        response.headers['Cache-Control'] = media_delivery.IMMUTABLE_CACHE_CONTROL
         return response
 
     # Photo not found anywhere
     abort(404)
 
 
+@app.route('/uploads/share/<path:filename>')
+def serve_share_image(filename):
+    """Serve Open Graph share images (see share_images.py) from R2"""
+    key = f"share/{filename}"
+    # Only a doctor's current card is known to be in R2; replaced ones are deleted
+    if '..' in filename or not share_images.is_current(key):
+        abort(404)
+
+    response = media_delivery.serve_r2_object(key, 'image/jpeg')
+    if response is None:
+        abort(404)
+    return response
+
+
 @app.route('/uploads/clinic_logos/<path:filename>')
 def serve_clinic_logo(filename):
-    """Serve clinic logos from R2 or local storage"""
-    from flask import send_from_directory, send_file, make_response
-    from io import BytesIO
+    """Serve clinic logos from R2 (see media_delivery) or local storage"""
+    from flask import send_from_directory, make_response
     import os
 
     # Security: Prevent directory traversal
@@ -6265,18 +6131,9 @@ def serve_clinic_logo(filename):
 
     # If filename contains clinic ID (R2 format: {clinic_id}/{filename}), try R2 first
     if '/' in filename:
-        # Try to fetch from R2
         try:
-            from r2_storage import get_clinic_logo
-            r2_path = f"clinic_logos/{filename}"
-            logo_data = get_clinic_logo(r2_path)
-            if logo_data:
-                response = make_response(send_file(
-                    BytesIO(logo_data),
-                    mimetype='image/jpeg',
-                    as_attachment=False
-                ))
-                response.headers['Cache-Control'] = 'public, max-age=604800, immutable'
+            response = media_delivery.serve_r2_object(f"clinic_logos/{filename}", 'image/jpeg')
+            if response is not None:
                 return response
         except Exception as e:
             print(f"[R2] Error fetching clinic logo from R2: {e}")
@@ -6290,7 +6147,7 @@ def serve_clinic_logo(filename):
 
     if os.path.exists(local_path):
         response = make_response(send_from_directory(logos_folder, filename))
-        response.headers['Cache-Control'] = 'public, max-age=604800, immutable'
+        response.headers['Cache-Control'] = media_delivery.IMMUTABLE_CACHE_CONTROL
         return response
 
     abort(404)
@@ -6327,18 +6184,10 @@ def clinic_settings(clinic_slug):
         logo_file = request.files.get('logo')
         if logo_file and logo_file.filename:
             try:
-                # Delete old logo if exists
-                if clinic.logo_url:
-                    upload_utils.delete_clinic_logo(app.config['UPLOAD_FOLDER'], clinic.logo_url)
-
-                logo_path = upload_utils.save_clinic_logo(
-                    logo_file,
-                    app.config['UPLOAD_FOLDER'],
-                    clinic.id
-                )
-                if logo_path:
-                    clinic.logo_url = logo_path
-                    flash('Logo updated successfully!', 'success')
+                # Processed off-request; the old logo is deleted once the new one replaces it
+                upload_utils.validate_image_upload(logo_file, min_dimension=50)
+                image_processing.submit('clinic_logo', logo_file, clinic)
+                flash('Logo uploaded. It will appear in a few seconds.', 'success')
             except Exception as e:
                 flash(f'Error uploading logo: {str(e)}', 'danger')
 
@@ -6467,64 +6316,19 @@ def doctor_request_verification():
             return redirect(url_for('doctor_request_verification'))
 
         try:
-            # Create upload folder
-            upload_folder = os.path.join(app.config.get('UPLOAD_FOLDER', 'uploads'), 'verification_docs')
-            os.makedirs(upload_folder, exist_ok=True)
+            # Store documents content-addressed (R2 with local fallback, see object_store.py)
+            upload_folder = app.config['UPLOAD_FOLDER']
 
             # Upload NMC License (stored as medical_degree_path)
-            nmc_license_path = None
-            try:
-                nmc_license_path = r2_storage.save_verification_document(
-                    nmc_license, doctor.id, 'medical_degree'
-                )
-            except Exception as e:
-                print(f"R2 upload failed for nmc_license: {e}")
-
-            if not nmc_license_path:
-                try:
-                    nmc_license.seek(0)
-                except Exception:
-                    pass
-                nmc_license_path = upload_utils.save_verification_document(
-                    nmc_license, upload_folder, doctor.id, 'medical_degree'
-                )
+            nmc_license_path = object_store.save_verification_document(nmc_license, upload_folder)
 
             # Upload Government ID
-            govt_id_path = None
-            try:
-                govt_id_path = r2_storage.save_verification_document(
-                    govt_id, doctor.id, 'govt_id'
-                )
-            except Exception as e:
-                print(f"R2 upload failed for govt_id: {e}")
-
-            if not govt_id_path:
-                try:
-                    govt_id.seek(0)
-                except Exception:
-                    pass
-                govt_id_path = upload_utils.save_verification_document(
-                    govt_id, upload_folder, doctor.id, 'govt_id'
-                )
+            govt_id_path = object_store.save_verification_document(govt_id, upload_folder)
 
             # Upload Practice License (optional)
             practice_license_path = None
             if practice_license and practice_license.filename:
-                try:
-                    practice_license_path = r2_storage.save_verification_document(
-                        practice_license, doctor.id, 'practice_license'
-                    )
-                except Exception as e:
-                    print(f"R2 upload failed for practice_license: {e}")
-
-                if not practice_license_path:
-                    try:
-                        practice_license.seek(0)
-                    except Exception:
-                        pass
-                    practice_license_path = upload_utils.save_verification_document(
-                        practice_license, upload_folder, doctor.id, 'practice_license'
-                    )
+                practice_license_path = object_store.save_verification_document(practice_license, upload_folder)
 
             # Create verification request
             verification_request = VerificationRequest(
@@ -6572,36 +6376,11 @@ def doctor_request_verification():
 @app.route('/doctor/qr-code/generate')
 @verified_doctor_required
 def generate_qr_code():
-    """Generate QR code for doctor's public profile"""
+    """QR code for doctor's public profile (cached, see qr_codes.py)"""
     user = User.query.get(session['user_id'])
     doctor = user.doctor_profile
-
-    # Generate the profile URL
-    profile_url = url_for('doctor_profile', slug=doctor.slug, _external=True)
-
-    # Create QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(profile_url)
-    qr.make(fit=True)
-
-    # Create image
-    img = qr.make_image(fill_color="black", back_color="white")
-
-    # Save to bytes
-    img_io = BytesIO()
-    img.save(img_io, 'PNG')
-    img_io.seek(0)
-
-    response = make_response(img_io.getvalue())
-    response.headers['Content-Type'] = 'image/png'
-    response.headers['Content-Disposition'] = f'inline; filename=qr-code-{doctor.slug}.png'
-
-    return response
+    return qr_codes.send(doctor, 'qr', request.args.get('size', type=int),
+                         download_name=f'qr-code-{doctor.slug}.png')
 
 
 @app.route('/doctor/qr-code/preview')
@@ -6610,172 +6389,17 @@ def preview_printable_qr():
     """Preview the printable template (inline, no download)"""
     user = User.query.get(session['user_id'])
     doctor = user.doctor_profile
-
-    # Generate the same template but serve inline
-    profile_url = url_for('doctor_profile', slug=doctor.slug, _external=True)
-
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=2,
-    )
-    qr.add_data(profile_url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="#0D8ABC", back_color="white")
-
-    width, height = 1240, 1754
-    template = Image.new('RGB', (width, height), 'white')
-    draw = ImageDraw.Draw(template)
-
-    try:
-        title_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 60)
-        name_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 50)
-        body_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 35)
-        small_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 28)
-    except:
-        title_font = ImageFont.load_default()
-        name_font = ImageFont.load_default()
-        body_font = ImageFont.load_default()
-        small_font = ImageFont.load_default()
-
-    draw.text((620, 80), "RankSewa", font=title_font, fill='#0D8ABC', anchor='mm')
-    draw.text((620, 150), "Nepal's Doctor Directory", font=small_font, fill='#64748b', anchor='mm')
-    draw.rectangle([(120, 200), (1120, 205)], fill='#0D8ABC')
-
-    doctor_name = doctor.name if hasattr(doctor, 'name') else "Doctor"
-    draw.text((620, 280), doctor_name, font=name_font, fill='#0f172a', anchor='mm')
-
-    specialty_text = f"{doctor.specialty.name} • {doctor.city.name}"
-    draw.text((620, 340), specialty_text, font=body_font, fill='#64748b', anchor='mm')
-
-    qr_size = 600
-    qr_img_resized = qr_img.resize((qr_size, qr_size), Image.Resampling.LANCZOS)
-    qr_position = ((width - qr_size) // 2, 450)
-    template.paste(qr_img_resized, qr_position)
-
-    draw.text((620, 1100), "Scan to Rate Your Experience", font=body_font, fill='#0f172a', anchor='mm')
-    draw.text((620, 1160), "Share your feedback and help other patients", font=small_font, fill='#64748b', anchor='mm')
-
-    instructions = [
-        "1. Open your phone's camera app",
-        "2. Point it at this QR code",
-        "3. Tap the notification to visit profile",
-        "4. Write your review"
-    ]
-
-    y_offset = 1250
-    for instruction in instructions:
-        draw.text((620, y_offset), instruction, font=small_font, fill='#64748b', anchor='mm')
-        y_offset += 45
-
-    draw.rectangle([(120, 1550), (1120, 1555)], fill='#0D8ABC')
-    draw.text((620, 1620), "Thank you for your feedback!", font=body_font, fill='#0D8ABC', anchor='mm')
-    draw.text((620, 1680), f"{profile_url}", font=small_font, fill='#94a3b8', anchor='mm')
-
-    img_io = BytesIO()
-    template.save(img_io, 'PNG', quality=95)
-    img_io.seek(0)
-
-    response = make_response(img_io.getvalue())
-    response.headers['Content-Type'] = 'image/png'
-    response.headers['Content-Disposition'] = f'inline; filename=preview-qr-{doctor.slug}.png'
-
-    return response
+    return qr_codes.send(doctor, 'printable', download_name=f'preview-qr-{doctor.slug}.png')
 
 
 @app.route('/doctor/qr-code/printable')
 @verified_doctor_required
 def generate_printable_qr():
-    """Generate a printable template with QR code and doctor info (download)"""
+    """Printable template with QR code and doctor info (download)"""
     user = User.query.get(session['user_id'])
     doctor = user.doctor_profile
-
-    # Generate the profile URL
-    profile_url = url_for('doctor_profile', slug=doctor.slug, _external=True)
-
-    # Create QR code
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=2,
-    )
-    qr.add_data(profile_url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="#0D8ABC", back_color="white")
-
-    # Create a nice printable template
-    # A4 size at 300 DPI: 2480 x 3508 pixels, but we'll use 1240 x 1754 (half size for web)
-    width, height = 1240, 1754
-    template = Image.new('RGB', (width, height), 'white')
-    draw = ImageDraw.Draw(template)
-
-    # Try to load a nice font, fallback to default
-    try:
-        title_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 60)
-        name_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 50)
-        body_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 35)
-        small_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 28)
-    except:
-        title_font = ImageFont.load_default()
-        name_font = ImageFont.load_default()
-        body_font = ImageFont.load_default()
-        small_font = ImageFont.load_default()
-
-    # Add RankSewa branding at top
-    draw.text((620, 80), "RankSewa", font=title_font, fill='#0D8ABC', anchor='mm')
-    draw.text((620, 150), "Nepal's Doctor Directory", font=small_font, fill='#64748b', anchor='mm')
-
-    # Add decorative line
-    draw.rectangle([(120, 200), (1120, 205)], fill='#0D8ABC')
-
-    # Add doctor name
-    doctor_name = doctor.name if hasattr(doctor, 'name') else "Doctor"
-    draw.text((620, 280), doctor_name, font=name_font, fill='#0f172a', anchor='mm')
-
-    # Add specialty
-    specialty_text = f"{doctor.specialty.name} • {doctor.city.name}"
-    draw.text((620, 340), specialty_text, font=body_font, fill='#64748b', anchor='mm')
-
-    # Add QR code (resize to fit nicely)
-    qr_size = 600
-    qr_img_resized = qr_img.resize((qr_size, qr_size), Image.Resampling.LANCZOS)
-    qr_position = ((width - qr_size) // 2, 450)
-    template.paste(qr_img_resized, qr_position)
-
-    # Add call to action
-    draw.text((620, 1100), "Scan to Rate Your Experience", font=body_font, fill='#0f172a', anchor='mm')
-    draw.text((620, 1160), "Share your feedback and help other patients", font=small_font, fill='#64748b', anchor='mm')
-
-    # Add instructions
-    instructions = [
-        "1. Open your phone's camera app",
-        "2. Point it at this QR code",
-        "3. Tap the notification to visit profile",
-        "4. Write your review"
-    ]
-
-    y_offset = 1250
-    for instruction in instructions:
-        draw.text((620, y_offset), instruction, font=small_font, fill='#64748b', anchor='mm')
-        y_offset += 45
-
-    # Add footer
-    draw.rectangle([(120, 1550), (1120, 1555)], fill='#0D8ABC')
-    draw.text((620, 1620), "Thank you for your feedback!", font=body_font, fill='#0D8ABC', anchor='mm')
-    draw.text((620, 1680), f"{profile_url}", font=small_font, fill='#94a3b8', anchor='mm')
-
-    # Save to bytes
-    img_io = BytesIO()
-    template.save(img_io, 'PNG', quality=95)
-    img_io.seek(0)
-
-    response = make_response(img_io.getvalue())
-    response.headers['Content-Type'] = 'image/png'
-    response.headers['Content-Disposition'] = f'attachment; filename=review-qr-{doctor.slug}.png'
-
-    return response
+    return qr_codes.send(doctor, 'printable', download_name=f'review-qr-{doctor.slug}.png',
+                         as_attachment=True)
 
 
 @app.route('/doctor/visibility-guide')
@@ -6851,6 +6475,7 @@ def doctor_profile_edit():
                 # Delete old photo
                 upload_utils.delete_profile_photo(app.config['UPLOAD_FOLDER'], doctor.photo_url)
                 doctor.photo_url = None
+                doctor.photo_variants = False
                 flash('Profile photo removed.', 'info')
 
             # Handle photo upload
@@ -6858,18 +6483,10 @@ def doctor_profile_edit():
                 photo_file = request.files['profile_photo']
                 if photo_file and photo_file.filename:
                     try:
-                        # Delete old photo if exists
-                        if doctor.photo_url:
-                            upload_utils.delete_profile_photo(app.config['UPLOAD_FOLDER'], doctor.photo_url)
-
-                        # Save new photo
-                        photo_path = upload_utils.save_profile_photo(
-                            photo_file,
-                            app.config['UPLOAD_FOLDER'],
-                            doctor.id
-                        )
-                        doctor.photo_url = photo_path
-                        flash('Profile photo updated successfully!', 'success')
+                        # Processed off-request; the old photo is deleted once the new one replaces it
+                        upload_utils.validate_image_upload(photo_file, min_dimension=100)
+                        image_processing.submit('profile_photo', photo_file, doctor)
+                        flash('Profile photo uploaded. It will appear in a few seconds.', 'success')
 
                     except ValueError as e:
                         flash(f'Error uploading photo: {str(e)}', 'warning')
@@ -7400,8 +7017,10 @@ def user_profile():
         .order_by(BadgeDefinition.display_order).all()
 
     # Calculate gamification stats
+    from gamification import get_user_rank
     total_helpful_received = user.helpful_count
     total_points = user.points
+    leaderboard_rank = get_user_rank(user)
     tier = user.tier
     tier_name = user.tier_name
     tier_thresholds = {
@@ -7448,6 +7067,7 @@ def user_profile():
                          tier_name=tier_name,
                          next_tier=next_tier,
                          points_to_next=points_to_next,
+                         leaderboard_rank=leaderboard_rank,
                          activities=activities,
                          show_doctor_verification_reminder=show_doctor_verification_reminder)
 
@@ -8561,13 +8181,9 @@ def clinic_register():
             logo_file = request.files.get('logo')
             if logo_file and logo_file.filename:
                 try:
-                    logo_path = upload_utils.save_clinic_logo(
-                        logo_file,
-                        app.config['UPLOAD_FOLDER'],
-                        clinic.id
-                    )
-                    if logo_path:
-                        clinic.logo_url = logo_path
+                    # Resized and stored off-request; logo_url is set when done
+                    upload_utils.validate_image_upload(logo_file, min_dimension=50)
+                    image_processing.submit('clinic_logo', logo_file, clinic)
                 except Exception as e:
                     flash(f'Error uploading logo: {str(e)}', 'warning')
 
@@ -9541,11 +9157,11 @@ def send_appointment_cancellation_email(appointment, doctor, reason):
         "html": html
     }
     try:
-        resend.Emails.send(params)
-        print(f"✅ Cancellation email sent to {patient_email}")
+        queue_email(params, category='appointment')
+        print(f"✅ Cancellation email queued for {patient_email}")
         return True
     except Exception as e:
-        print(f"❌ Failed to send cancellation email: {e}")
+        print(f"❌ Failed to queue cancellation email: {e}")
         return False
 
 
@@ -0,0 +1,272 @@
+"""
+Appointment reminder emails
+
+A periodic job ('appointment_reminders', every REMINDER_SCAN_SECONDS) finds
+appointments that are due a reminder and queues the emails through mailer's
+outbox. Each reminder is recorded in appointment_reminders (migration 020),
+and the unique (appointment_id, reminder_type, schedule) index makes the scan
+idempotent across restarts and overlapping runs.
+
+For each offset in APPOINTMENT_REMINDER_OFFSETS (default "24h,2h") an
+appointment is due when it starts between now + the next smaller offset and
+now + this offset. An appointment booked 10 hours ahead therefore gets the
+24h reminder right away and the 2h reminder later. Nothing is sent for
+appointments starting within REMINDER_MIN_LEAD_MINUTES. Appointment dates and
+times are Nepal local time. An appointment without a time counts as starting
+at midnight.
+
+Each offset window is read with bounded queries on (appointment_date, status)
+in keyset batches of SCAN_BATCH_SIZE that skip already-reminded appointments.
+There is no polling per appointment. Reminders start as 'queued' and take
+the outbox email's final status ('sent' or 'failed') on the next scan.
+Appointments without a patient email get a 'skipped' row so later scans
+ignore them.
+
+    flask --app app reminders run
+    flask --app app reminders status
+"""
+import os
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from flask.cli import AppGroup
+from sqlalchemy import and_, exists, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+import jobs
+import mailer
+from models import db, Appointment, AppointmentReminder, ClinicDoctor, Doctor, OutboxEmail
+
+
+NEPAL_TZ = ZoneInfo('Asia/Kathmandu')
+REMINDER_OFFSETS_SETTING = os.getenv('APPOINTMENT_REMINDER_OFFSETS', '24h,2h')
+REMINDER_MIN_LEAD_MINUTES = int(os.getenv('APPOINTMENT_REMINDER_MIN_LEAD_MINUTES', '30'))
+REMINDER_SCAN_SECONDS = int(os.getenv('APPOINTMENT_REMINDER_SCAN_SECONDS', '300'))
+SCAN_BATCH_SIZE = 500
+REMINDABLE_STATUSES = ('booked', 'confirmed')
+REMINDER_TYPE = 'email'
+
+
+def parse_offsets(setting):
+    """'24h,2h,30m' -> [('24h', timedelta(hours=24)), ('2h', ...), ...], largest first"""
+    units = {'d': 'days', 'h': 'hours', 'm': 'minutes'}
+    offsets = []
+    for label in (part.strip().lower() for part in setting.split(',')):
+        if not label:
+            continue
+        if label[-1] not in units or not label[:-1].isdigit():
+            raise ValueError(f"Invalid reminder offset: {label!r} (use e.g. 24h, 90m, 1d)")
+        offsets.append((label, timedelta(**{units[label[-1]]: int(label[:-1])})))
+    return sorted(offsets, key=lambda offset: offset[1], reverse=True)
+
+
+REMINDER_OFFSETS = parse_offsets(REMINDER_OFFSETS_SETTING)
+
+
+def local_now():
+    """Current Nepal time as a naive datetime (how appointments are stored)"""
+    return datetime.now(NEPAL_TZ).replace(tzinfo=None)
+
+
+def reminder_windows(now=None):
+    """
+    Start-time window per offset
+
+    Returns:
+        list of (label, after, until): appointments starting in (after, until] are due
+    """
+    now = now or local_now()
+    windows = []
+    for index, (label, offset) in enumerate(REMINDER_OFFSETS):
+        if index + 1 < len(REMINDER_OFFSETS):
+            lead = REMINDER_OFFSETS[index + 1][1]
+        else:
+            lead = timedelta(minutes=REMINDER_MIN_LEAD_MINUTES)
+        if lead < offset:
+            windows.append((label, now + lead, now + offset))
+    return windows
+
+
+def _starts_after(moment):
+    return or_(
+        Appointment.appointment_date > moment.date(),
+        and_(Appointment.appointment_date == moment.date(), Appointment.appointment_time > moment.time()),
+    )
+
+
+def _starts_at_or_before(moment):
+    return or_(
+        Appointment.appointment_date < moment.date(),
+        and_(
+            Appointment.appointment_date == moment.date(),
+            or_(Appointment.appointment_time.is_(None), Appointment.appointment_time <= moment.time()),
+        ),
+    )
+
+
+def _due_batch(label, after, until, last_id):
+    already_reminded = exists().where(
+        AppointmentReminder.appointment_id == Appointment.id,
+        AppointmentReminder.reminder_type == REMINDER_TYPE,
+        AppointmentReminder.schedule == label,
+    )
+    return Appointment.query\
+        .options(joinedload(Appointment.clinic_doctor).joinedload(ClinicDoctor.clinic))\
+        .filter(
+            Appointment.appointment_date.between(after.date(), until.date()),
+            Appointment.status.in_(REMINDABLE_STATUSES),
+            _starts_after(after),
+            _starts_at_or_before(until),
+            Appointment.id > last_id,
+            ~already_reminded,
+        )\
+        .order_by(Appointment.id)\
+        .limit(SCAN_BATCH_SIZE)\
+        .all()
+
+
+def _reminder_email(appointment, label, doctor_name):
+    clinic = appointment.clinic_doctor.clinic if appointment.clinic_doctor else None
+    appointment_date = appointment.appointment_date.strftime('%B %d, %Y')
+    appointment_time = appointment.appointment_time.strftime('%I:%M %p') if appointment.appointment_time else None
+    return {
+        "from": "RankSewa <support@ranksewa.com>",
+        "to": [appointment.patient_email],
+        "subject": f"Reminder: Your appointment with {doctor_name} on {appointment_date}",
+        "html": mailer.render(
+            'appointment_reminder.html',
+            patient_name=appointment.patient_name or 'Patient',
+            doctor_name=doctor_name,
+            clinic=clinic,
+            appointment_date=appointment_date,
+            appointment_time=appointment_time,
+            booking_code=appointment.booking_code,
+        ),
+    }
+
+
+def _queue_batch(label, appointments):
+    """Queue reminder emails and record them in one transaction; returns (queued, skipped)"""
+    doctor_ids = {appointment.doctor_id for appointment in appointments if appointment.doctor_id}
+    doctor_names = dict(db.session.query(Doctor.id, Doctor.name).filter(Doctor.id.in_(doctor_ids)).all()) \
+        if doctor_ids else {}
+
+    messages = []
+    keys = []
+    for appointment in appointments:
+        if appointment.patient_email:
+            doctor_name = doctor_names.get(appointment.doctor_id, 'your doctor')
+            messages.append(_reminder_email(appointment, label, doctor_name))
+            keys.append(f'appointment-reminder:{appointment.id}:{label}')
+
+    # The reminder rows' unique index guards these keys: a conflict means another
+    # scan got here first and the whole batch rolls back
+    mailer.queue_messages(messages, category='appointment_reminder', dedupe_keys=keys, db_commit=False)
+    email_ids = dict(
+        db.session.query(OutboxEmail.dedupe_key, OutboxEmail.id).filter(OutboxEmail.dedupe_key.in_(keys)).all()
+    ) if keys else {}
+
+    now = datetime.utcnow()
+    reminders = []
+    for appointment in appointments:
+        email_id = email_ids.get(f'appointment-reminder:{appointment.id}:{label}')
+        reminders.append({
+            'appointment_id': appointment.id,
+            'reminder_type': REMINDER_TYPE,
+            'schedule': label,
+            'outbox_email_id': email_id,
+            'status': 'queued' if email_id else 'skipped',
+            'sent_at': now,
+            'response_received': False,
+        })
+    db.session.execute(AppointmentReminder.__table__.insert(), reminders)
+    db.session.commit()
+    return len(messages), len(appointments) - len(messages)
+
+
+def sync_delivery_status():
+    """Copy the final outbox status ('sent' / 'failed') onto queued reminders"""
+    outbox = select(OutboxEmail.status, OutboxEmail.sent_at)\
+        .where(OutboxEmail.id == AppointmentReminder.outbox_email_id)
+    result = db.session.execute(
+        update(AppointmentReminder)
+        .where(
+            AppointmentReminder.status == 'queued',
+            exists().where(
+                OutboxEmail.id == AppointmentReminder.outbox_email_id,
+                OutboxEmail.status.in_(('sent', 'failed')),
+            ),
+        )
+        .values(
+            status=outbox.with_only_columns(OutboxEmail.status).scalar_subquery(),
+            sent_at=func.coalesce(
+                outbox.with_only_columns(OutboxEmail.sent_at).scalar_subquery(), AppointmentReminder.sent_at
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount or 0
+
+
+def send_due_reminders(now=None):
+    """
+    Queue every reminder that is due now
+
+    Returns:
+        dict: {'queued', 'skipped', 'synced', 'batches'}
+    """
+    stats = {'queued': 0, 'skipped': 0, 'synced': sync_delivery_status(), 'batches': 0}
+    for label, after, until in reminder_windows(now):
+        last_id = 0
+        while True:
+            appointments = _due_batch(label, after, until, last_id)
+            if not appointments:
+                break
+            last_id = appointments[-1].id
+            stats['batches'] += 1
+            try:
+                queued, skipped = _queue_batch(label, appointments)
+            except IntegrityError:
+                # Another scan recorded some of these first; its emails are deduplicated too
+                db.session.rollback()
+                continue
+            stats['queued'] += queued
+            stats['skipped'] += skipped
+
+    if stats['queued'] or stats['skipped']:
+        print(f"[REMINDERS] {stats['queued']} reminders queued, {stats['skipped']} skipped (no email) "
+              f"in {stats['batches']} batches")
+    return stats
+
+
+@jobs.periodic_task('appointment_reminders', REMINDER_SCAN_SECONDS)
+def appointment_reminders_job():
+    send_due_reminders()
+
+
+reminders_cli = AppGroup('reminders', help='Appointment reminders')
+
+
+@reminders_cli.command('run')
+def run_command():
+    """Queue all reminders that are due now"""
+    stats = send_due_reminders()
+    print(f"{stats['queued']} queued, {stats['skipped']} skipped, {stats['synced']} delivery updates")
+
+
+@reminders_cli.command('status')
+def status_command():
+    """Reminder counts by offset and status"""
+    rows = db.session.query(AppointmentReminder.schedule, AppointmentReminder.status, func.count(AppointmentReminder.id))\
+        .group_by(AppointmentReminder.schedule, AppointmentReminder.status)\
+        .order_by(AppointmentReminder.schedule, AppointmentReminder.status).all()
+    for schedule, status, count in rows:
+        print(f"{schedule or '-':>5}  {status:<8} {count}")
+    for label, after, until in reminder_windows():
+        print(f"{label} window: appointments starting {after:%Y-%m-%d %H:%M} - {until:%Y-%m-%d %H:%M} (Nepal time)")
+
+
+def init_app(app):
+    app.cli.add_command(reminders_cli)
@@ -0,0 +1,111 @@
+"""
+Pre-rendered Markdown for Health Digest articles
+
+Article pages used to build a new markdown.Markdown instance and convert the
+whole article on every request. Rendered HTML and TOC are now stored on the
+Article row (content_html, content_toc) together with a SHA-256 of the source
+(content_hash), so article_detail never parses Markdown.
+
+Rendering happens on save: a before_insert/before_update listener re-renders
+whenever Article.content changes. That covers the admin article routes and the
+seed/publish scripts (they all import app, which imports this module). Content
+that was never pre-rendered (rows from before migration 014) goes through a
+per-process LRU cache instead.
+"""
+import hashlib
+import threading
+from functools import lru_cache
+
+import markdown
+from markupsafe import escape
+from sqlalchemy import event
+
+from models import Article
+
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'nl2br', 'toc']
+RENDER_CACHE_SIZE = 128  # Articles kept per worker process for the fallback path
+
+# markdown.Markdown instances are reusable (after reset()) but not thread-safe
+_local = threading.local()
+
+
+def _get_markdown():
+    md = getattr(_local, 'md', None)
+    if md is None:
+        md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+        _local.md = md
+    return md
+
+
+def content_hash(text):
+    """SHA-256 hex digest of article source text"""
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+
+def _toc_links(tokens):
+    """Flatten toc_tokens into the same links the article page's JS builds (h2/h3 only)"""
+    links = []
+    for token in tokens:
+        if token['level'] == 2:
+            links.append(f'<a href="#{token["id"]}">{escape(token["name"])}</a>')
+        elif token['level'] == 3:
+            links.append(f'<a href="#{token["id"]}" class="toc-indent">{escape(token["name"])}</a>')
+        links.extend(_toc_links(token['children']))
+    return links
+
+
+def render_markdown(text):
+    """
+    Convert Markdown to HTML
+
+    Returns:
+        tuple: (html, toc_html) - toc_html is '' when the article has no
+        Markdown h2/h3 headings (raw HTML headings are left to the page's JS)
+    """
+    if not text:
+        return '', ''
+
+    md = _get_markdown()
+    md.reset()
+    html = md.convert(text)
+    toc_html = ''.join(_toc_links(getattr(md, 'toc_tokens', [])))
+    return html, toc_html
+
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_markdown_cached(text):
+    """render_markdown() memoized per process (for content that isn't pre-rendered)"""
+    return render_markdown(text)
+
+
+def prerender_article(article):
+    """
+    Store rendered HTML/TOC on the article if its content changed
+
+    Returns:
+        bool: True if the article was (re-)rendered
+    """
+    digest = content_hash(article.content)
+    if article.content_hash == digest and article.content_html is not None:
+        return False
+
+    article.content_html, article.content_toc = render_markdown(article.content)
+    article.content_hash = digest
+    return True
+
+
+def get_article_html(article):
+    """
+    Rendered (html, toc_html) for an article - stored copy if current, else LRU fallback
+    """
+    if article.content_html is not None and article.content_hash == content_hash(article.content):
+        return article.content_html, article.content_toc or ''
+    return render_markdown_cached(article.content or '')
+
+
+@event.listens_for(Article, 'before_insert')
+@event.listens_for(Article, 'before_update')
+def _prerender_on_save(mapper, connection, article):
+    """Re-render whenever an article is saved with new content"""
+    prerender_article(article)
@@ -0,0 +1,95 @@
+"""
+Full-text search for Health Digest articles
+
+Uses a precomputed index instead of ILIKE scans over Article.content:
+- PostgreSQL: articles.search_vector (generated tsvector column) with a GIN index
+- SQLite: articles_fts (FTS5 external-content table kept in sync by triggers)
+
+The index is created by migration 013_add_article_search_index. If neither
+structure exists, apply_search() falls back to the old ILIKE scan so local
+databases created with db.create_all() keep working.
+"""
+import re
+from sqlalchemy import inspect, text, or_
+
+from models import db, Article
+
+
+# Detected once per process: 'postgresql', 'sqlite' or None (ILIKE fallback)
+_backend = {'checked': False, 'name': None}
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def reset_backend_cache():
+    """Forget the detected backend (e.g. after running the migration in-process)"""
+    _backend['checked'] = False
+    _backend['name'] = None
+
+
+def get_search_backend():
+    """Return 'postgresql' or 'sqlite' if the index exists, else None"""
+    if _backend['checked']:
+        return _backend['name']
+
+    name = None
+    try:
+        inspector = inspect(db.engine)
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            columns = {col['name'] for col in inspector.get_columns('articles')}
+            if 'search_vector' in columns:
+                name = 'postgresql'
+        elif dialect == 'sqlite':
+            if 'articles_fts' in inspector.get_table_names():
+                name = 'sqlite'
+    except Exception as e:
+        print(f"[ARTICLE SEARCH] Could not detect search index: {e}")
+
+    _backend['name'] = name
+    _backend['checked'] = True
+    return name
+
+
+def _fts5_query(search_query):
+    """Build a safe FTS5 MATCH expression: every word must match (prefix match)"""
+    tokens = _TOKEN_RE.findall(search_query)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def apply_search(query, search_query):
+    """
+    Restrict an Article query to articles matching search_query
+
+    Args:
+        query: Article query to filter
+        search_query: Raw text from the ?q= parameter
+
+    Returns:
+        Filtered query (unchanged if the search text has no searchable words)
+    """
+    backend = get_search_backend()
+
+    if backend == 'postgresql':
+        return query.filter(
+            text("articles.search_vector @@ websearch_to_tsquery('english', :search_q)")
+            .bindparams(search_q=search_query)
+        )
+
+    if backend == 'sqlite':
+        match = _fts5_query(search_query)
+        if not match:
+            return query
+        matching_ids = text("SELECT rowid FROM articles_fts WHERE articles_fts MATCH :search_q")\
+            .bindparams(search_q=match)
+        return query.filter(Article.id.in_(matching_ids))
+
+    # No index yet - fall back to the original pattern scan
+    search_pattern = f'%{search_query}%'
+    return query.filter(
+        or_(
+            Article.title.ilike(search_pattern),
+            Article.summary.ilike(search_pattern),
+            Article.content.ilike(search_pattern)
+        )
+    )
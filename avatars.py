@@ -0,0 +1,79 @@
+"""
+Initials avatars for doctors without a photo
+
+Most doctors (the NMC imports) have no photo. Their avatar used to be a
+DiceBear URL, so every results page made dozens of third-party requests.
+It also ran the title-stripping regexes on every render. The avatar is now
+a small SVG served by our own /avatars/<initials>/<colour>.svg route:
+
+- same palette as before, colour keyed by doctor id
+- initials: first letters of the first and last word of the name, after
+  leading titles (Dr., Prof. ...) are stripped; memoized per name
+- the SVG is rendered once per (initials, colour) and memoized. The URL
+  fully determines the image, so responses are immutable and browsers and
+  CDNs cache them for a year.
+"""
+import hashlib
+import re
+from functools import lru_cache
+from html import escape
+
+
+# Color palette - professional medical colors
+AVATAR_COLORS = (
+    '0D8ABC',  # Medical blue
+    '2a9d8f',  # Teal
+    'e76f51',  # Coral
+    'f4a261',  # Sandy brown
+    '264653',  # Dark blue-green
+    '9b59b6',  # Purple
+    '3498db',  # Sky blue
+    '16a085',  # Green sea
+)
+FALLBACK_INITIALS = 'DR'
+AVATAR_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+INITIALS_CACHE_SIZE = 65536  # about twice the number of doctors
+
+TITLE_PATTERN = re.compile(r'^\s*(dr|mr|mrs|ms|prof|professor|asst|assistant|assoc|associate)\.?\s+', re.IGNORECASE)
+
+SVG_TEMPLATE = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="128" height="128" viewBox="0 0 128 128">'
+    '<rect width="128" height="128" fill="#{color}"/>'
+    '<text x="64" y="64" dy=".35em" fill="#fff" text-anchor="middle" font-size="52" font-weight="600" '
+    'font-family="-apple-system,BlinkMacSystemFont,\'Segoe UI\',Roboto,Helvetica,Arial,sans-serif">'
+    '{initials}</text></svg>'
+)
+
+
+@lru_cache(maxsize=INITIALS_CACHE_SIZE)
+def initials_for(name):
+    """'Dr. Ramesh Kumar Sharma' -> 'RS' (FALLBACK_INITIALS if nothing is left)"""
+    cleaned = name or ''
+    while TITLE_PATTERN.match(cleaned):
+        cleaned = TITLE_PATTERN.sub('', cleaned, count=1)
+    letters = [next((ch for ch in word if ch.isalnum()), '') for word in cleaned.split()]
+    letters = [letter for letter in letters if letter]
+    if not letters:
+        return FALLBACK_INITIALS
+    return (letters[0] + (letters[-1] if len(letters) > 1 else '')).upper()
+
+
+def color_for(doctor_id):
+    """Palette colour for a doctor (stable per id)"""
+    return AVATAR_COLORS[(doctor_id or 0) % len(AVATAR_COLORS)]
+
+
+def is_valid(initials, color):
+    """Whether a route's (initials, colour) is one this module generates"""
+    return color in AVATAR_COLORS and 1 <= len(initials) <= 2 and initials.isalnum() and initials == initials.upper()
+
+
+@lru_cache(maxsize=4096)
+def render_svg(initials, color):
+    """SVG bytes for (initials, colour)"""
+    return SVG_TEMPLATE.format(color=color, initials=escape(initials)).encode('utf-8')
+
+
+@lru_cache(maxsize=4096)
+def etag_for(initials, color):
+    return hashlib.sha1(render_svg(initials, color)).hexdigest()[:16]
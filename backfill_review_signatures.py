@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Build MinHash signatures for existing reviews
+
+Indexes every review that has no review_signatures row yet (reviews created
+before migration 017). New reviews are indexed by rate_doctor.
+
+Usage:
+    python backfill_review_signatures.py              # index missing reviews
+    python backfill_review_signatures.py --rebuild    # clear and re-index everything
+"""
+import argparse
+import time
+
+from app import app, db
+from models import Rating, ReviewSignature, ReviewSignatureBucket
+import review_dedup
+
+
+BATCH_SIZE = 500
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build MinHash signatures for existing reviews')
+    parser.add_argument('--rebuild', action='store_true', help='delete all signatures first')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if not review_dedup.index_available():
+            print("review_signatures table not found - run the migrations first (flask db upgrade)")
+            return
+
+        if args.rebuild:
+            ReviewSignatureBucket.query.delete()
+            ReviewSignature.query.delete()
+            db.session.commit()
+
+        started = time.perf_counter()
+        indexed = skipped = 0
+        last_id = 0
+        while True:
+            rows = db.session.query(Rating.id, Rating.comment)\
+                .outerjoin(ReviewSignature, ReviewSignature.rating_id == Rating.id)\
+                .filter(ReviewSignature.rating_id.is_(None), Rating.id > last_id)\
+                .order_by(Rating.id).limit(BATCH_SIZE).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            signatures = []
+            buckets = []
+            for rating_id, comment in rows:
+                signature = review_dedup.signature_for_text(comment)
+                if signature is None:
+                    skipped += 1
+                    continue
+                signatures.append({'rating_id': rating_id, 'signature': review_dedup.pack_signature(signature)})
+                buckets.extend({'rating_id': rating_id, 'bucket': bucket}
+                               for bucket in review_dedup.band_buckets(signature))
+
+            if signatures:
+                db.session.execute(ReviewSignature.__table__.insert(), signatures)
+                db.session.execute(ReviewSignatureBucket.__table__.insert(), buckets)
+            db.session.commit()
+            indexed += len(signatures)
+
+            elapsed = time.perf_counter() - started
+            print(f"[REVIEW DEDUP] {indexed} indexed, {skipped} too short ({(indexed + skipped) / elapsed:.0f} reviews/s)")
+
+        review_dedup.reset_index()
+        copied = review_dedup.find_copied_reviews()
+        print(f"Done: {indexed} reviews indexed, {len(copied)} near-copies of earlier reviews found")
+
+
+if __name__ == '__main__':
+    main()
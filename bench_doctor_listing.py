@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark /doctors serialization: ORM entity path vs column-projection path
+
+The old path hydrated Doctor entities with five selectinloads, called url_for()
+per photo and went through jsonify(). The current path selects plain columns,
+joins display names in SQL, formats photo URLs from a precomputed prefix and
+encodes with orjson (when installed).
+
+Usage:
+    python bench_doctor_listing.py                  # against the configured database
+    python bench_doctor_listing.py --pages 20 --per-page 50 --repeat 3
+"""
+import argparse
+import time
+
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from flask import jsonify, url_for
+
+from app import (app, build_doctor_ranking_subqueries, DOCTOR_LISTING_COLUMNS,
+                 serialize_doctor_listing_rows, photo_url_prefix, fast_json_response)
+from models import db, Doctor, User, City, Clinic, Specialty
+
+
+def _order(rating_stats):
+    return (
+        rating_stats.c.sort_rank.asc(),
+        (rating_stats.c.profile_score + rating_stats.c.rating_score * 20 + rating_stats.c.review_bonus).desc(),
+        rating_stats.c.rating_score.desc(),
+        Doctor.name.asc()
+    )
+
+
+def orm_page(offset, limit):
+    """Previous implementation: full entities + relationship loads + url_for per row"""
+    rating_stats, response_counts = build_doctor_ranking_subqueries()
+    rows = db.session.query(
+        Doctor,
+        rating_stats.c.avg_rating,
+        rating_stats.c.rating_count,
+        rating_stats.c.profile_score,
+        func.coalesce(response_counts.c.response_count, 0).label('response_count')
+    ).join(rating_stats, Doctor.id == rating_stats.c.doctor_id).outerjoin(
+        response_counts, Doctor.id == response_counts.c.doctor_id
+    ).options(
+        selectinload(Doctor.city),
+        selectinload(Doctor.local_level),
+        selectinload(Doctor.specialty),
+        selectinload(Doctor.clinic),
+        selectinload(Doctor.user_account)
+    ).filter(Doctor.is_active.is_(True)).order_by(*_order(rating_stats)).offset(offset).limit(limit).all()
+
+    doctors_list = []
+    for d, avg_rating_value, rating_count_value, profile_score_value, response_count_value in rows:
+        photo_url = None
+        if d.photo_url:
+            if d.photo_url.count('/') > 1:
+                photo_path = d.photo_url.replace('photos/', '')
+            else:
+                photo_path = d.photo_url.split('/')[-1]
+            photo_url = url_for('serve_photo', filename=photo_path, _external=False)
+
+        rating_count_int = int(rating_count_value or 0)
+        response_count_int = int(response_count_value or 0)
+        response_rate = (response_count_int / rating_count_int * 100) if rating_count_int > 0 else 0
+
+        doctors_list.append({
+            'id': d.id, 'name': d.name, 'slug': d.slug, 'city_id': d.city_id,
+            'city_name': d.city.name if d.city else 'Unknown',
+            'clinic_name': d.clinic.name if d.clinic else None,
+            'clinic_slug': d.clinic.slug if d.clinic else None,
+            'specialty_id': d.specialty_id, 'specialty_name': d.specialty.name,
+            'nmc_number': d.nmc_number, 'workplace': d.workplace, 'experience': d.experience,
+            'education': d.education, 'college': d.college, 'description': d.description,
+            'photo_url': photo_url, 'is_featured': d.is_featured, 'is_verified': d.is_verified,
+            'specialty_verified': d.specialty_verified,
+            'is_claimed': d.user_account is not None,
+            'avg_rating': float(avg_rating_value or 0), 'rating_count': rating_count_int,
+            'profile_completion': int(profile_score_value or 0),
+            'response_rate': int(response_rate), 'profile_views': d.profile_views or 0
+        })
+    db.session.expunge_all()
+    return jsonify({'doctors': doctors_list}).get_data()
+
+
+def projection_page(offset, limit):
+    """Current implementation used by get_doctors()"""
+    rating_stats, response_counts = build_doctor_ranking_subqueries()
+    is_claimed = db.session.query(User.id).filter(User.doctor_id == Doctor.id).exists().label('is_claimed')
+    rows = db.session.query(
+        *DOCTOR_LISTING_COLUMNS,
+        City.name, Clinic.name, Clinic.slug, Specialty.name,
+        is_claimed,
+        rating_stats.c.avg_rating,
+        rating_stats.c.rating_count,
+        rating_stats.c.profile_score,
+        func.coalesce(response_counts.c.response_count, 0)
+    ).join(rating_stats, Doctor.id == rating_stats.c.doctor_id).outerjoin(
+        response_counts, Doctor.id == response_counts.c.doctor_id
+    ).outerjoin(City, Doctor.city_id == City.id)\
+     .outerjoin(Specialty, Doctor.specialty_id == Specialty.id)\
+     .outerjoin(Clinic, Doctor.clinic_id == Clinic.id)\
+     .filter(Doctor.is_active.is_(True)).order_by(*_order(rating_stats)).offset(offset).limit(limit).all()
+
+    doctors_list = serialize_doctor_listing_rows(rows, photo_url_prefix())
+    return fast_json_response({'doctors': doctors_list}).get_data()
+
+
+def run(label, page_fn, pages, per_page, repeat):
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        rows = 0
+        start = time.perf_counter()
+        for page in range(pages):
+            body = page_fn(page * per_page, per_page)
+            rows += body.count(b'"slug"')
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    rate = rows / best if best else 0
+    print(f"{label:<12} {rows:>7} rows  {best * 1000:>9.1f} ms  {rate:>10.0f} rows/s")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--per-page', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with app.test_request_context('/doctors'):
+        total = Doctor.query.filter_by(is_active=True).count()
+        print(f"Active doctors: {total}  pages={args.pages}  per_page={args.per_page}")
+        if not total:
+            print("No doctors in the database - nothing to benchmark.")
+            return
+
+        orm_rate = run('orm', orm_page, args.pages, args.per_page, args.repeat)
+        lean_rate = run('projection', projection_page, args.pages, args.per_page, args.repeat)
+        if orm_rate:
+            print(f"Speedup: {lean_rate / orm_rate:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
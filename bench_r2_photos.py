@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark photo-serve latency through /uploads/photos/ against an S3 endpoint
+
+per-call: a new R2Storage (new boto3 client and connection pool) per request,
+          as the r2_storage helpers used to do
+pooled:   the process-wide r2_storage.get_storage() client
+
+Without --endpoint a local S3-compatible stub is started on 127.0.0.1 that
+answers every GET with a ~40 KB JPEG-sized body (keep-alive, like R2), so the
+numbers measure client creation and connection reuse, not R2 itself. Pass the
+real R2_* settings with --endpoint to measure against R2 (the photo must exist).
+
+Usage:
+    python bench_r2_photos.py
+    python bench_r2_photos.py --requests 200
+    python bench_r2_photos.py --endpoint https://<account>.r2.cloudflarestorage.com --photo 12/abc.jpg
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault('SECRET_KEY', 'bench')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault('MEDIA_DELIVERY', 'proxy')  # measure the proxied path, not redirects
+
+import r2_storage
+from app import app, limiter
+from models import db
+
+
+PHOTO_BYTES = b'\xff\xd8\xff\xe0' + os.urandom(40 * 1024)
+
+
+class StubS3Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(PHOTO_BYTES)))
+        self.send_header('ETag', '"bench"')
+        self.end_headers()
+        self.wfile.write(PHOTO_BYTES)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PerCallStorage:
+    """Builds a new R2Storage for every read, like the old helpers"""
+
+    def __init__(self, *settings):
+        self.settings = settings
+
+    def get_file_object(self, object_name):
+        return r2_storage.R2Storage(*self.settings).get_file_object(object_name)
+
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubS3Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def run(label, client, path, count):
+    client.get(path)  # warm up
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get(path)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    timings.sort()
+    mean = sum(timings) / len(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<9} mean {mean * 1000:>7.2f} ms   p50 {timings[len(timings) // 2] * 1000:>7.2f} ms   "
+          f"p95 {p95 * 1000:>7.2f} ms")
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--endpoint', help='S3/R2 endpoint URL (default: local stub)')
+    parser.add_argument('--photo', default='1/bench.jpg', help='path under photos/ in the bucket')
+    args = parser.parse_args()
+
+    if args.endpoint:
+        access_key_id, secret_access_key, _, bucket_name = r2_storage._credentials()
+        endpoint = args.endpoint
+    else:
+        server, endpoint = start_stub()
+        access_key_id, secret_access_key, bucket_name = 'bench', 'bench', 'bench'
+    settings = (access_key_id, secret_access_key, endpoint, bucket_name)
+
+    with app.app_context():
+        db.create_all()
+    limiter.enabled = False  # the default 200/hour limit would end the run
+    client = app.test_client()
+    path = f"/uploads/photos/{args.photo}"
+    print(f"{args.requests} requests to {path} via {endpoint}")
+
+    r2_storage.set_storage(PerCallStorage(*settings))
+    per_call = run('per-call', client, path, args.requests)
+
+    r2_storage.set_storage(r2_storage.R2Storage(*settings))
+    pooled = run('pooled', client, path, args.requests)
+
+    r2_storage.set_storage(None)
+    print(f"Speedup: {per_call / pooled:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark review text checks on long reviews (near the 2000-character limit)
+
+legacy:   better_profanity contains_profanity() + censor(), two splits and the
+          five uncompiled specificity regexes (the pre-review_analysis path)
+analyzer: review_analysis.analyze_review()
+
+Also checks that both paths agree on issues, censored text and specificity.
+
+Usage:
+    python bench_review_analysis.py
+    python bench_review_analysis.py --reviews 200 --length 1990
+"""
+import argparse
+import random
+import re
+import time
+
+from better_profanity import profanity
+
+import review_analysis
+
+
+LEGACY_SPECIFICITY_PATTERNS = [
+    r'\b(diagnosis|treatment|medication|prescription|symptoms?|test|x-ray|scan|surgery)\b',
+    r'\b(minutes?|hours?|days?|weeks?|months?|waited|appointment)\b',
+    r'\b(i|my|me|felt|experienced|visited|went|saw|told)\b',
+    r'\b(staff|nurse|reception|clinic|office|waiting room|consultation)\b',
+    r'\d+\s*(minutes?|hours?|rupees?|days?)',
+]
+
+SAMPLE_WORDS = (
+    "the doctor was very kind and patient I waited about 30 minutes at the clinic before my "
+    "consultation the staff at reception were helpful and the nurse explained my prescription "
+    "clearly after the x-ray and blood test the diagnosis was quick treatment cost 1500 rupees "
+    "overall a good experience would recommend to family and friends in Kathmandu"
+).split()
+
+
+def legacy_check(text):
+    issues = []
+    if profanity.contains_profanity(text):
+        issues.append('contains_profanity')
+    words = [w for w in text.strip().split() if w]
+    if len(words) < 2:
+        issues.append('too_short')
+    if len(text) > 2000:
+        issues.append('too_long')
+    if text.isupper() and len(text) > 20:
+        issues.append('all_caps')
+    words = text.split()
+    if len(words) > 5 and len(set(words)) / len(words) < 0.3:
+        issues.append('repetitive')
+    if 'http://' in text.lower() or 'https://' in text.lower() or 'www.' in text.lower():
+        issues.append('contains_url')
+    censored = profanity.censor(text)
+    specificity = sum(1 for pattern in LEGACY_SPECIFICITY_PATTERNS if re.search(pattern, text.lower()))
+    return issues, censored, specificity
+
+
+def build_reviews(count, length, seed):
+    rng = random.Random(seed)
+    profane = [str(word) for word in profanity.CENSOR_WORDSET]
+    reviews = []
+    for i in range(count):
+        words = []
+        while len(' '.join(words)) < length - 20:
+            words.append(rng.choice(SAMPLE_WORDS))
+            if i % 4 == 0 and rng.random() < 0.01:
+                words.append(rng.choice(profane))
+        reviews.append(' '.join(words)[:length])
+    return reviews
+
+
+def run(label, check, reviews, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in reviews:
+            check(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<10} {best * 1000:>9.1f} ms  {best / len(reviews) * 1000:>8.3f} ms/review")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--reviews', type=int, default=20)
+    parser.add_argument('--length', type=int, default=1990)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    reviews = build_reviews(args.reviews, args.length, args.seed)
+    print(f"{len(reviews)} reviews, ~{args.length} chars each")
+
+    mismatches = 0
+    for text in reviews:
+        issues, censored, specificity = legacy_check(text)
+        analysis = review_analysis.analyze_review(text)
+        if (issues, censored, specificity) != (analysis['issues'], analysis['censored_text'], analysis['specificity']):
+            mismatches += 1
+    print(f"Mismatches between paths: {mismatches}")
+
+    legacy = run('legacy', legacy_check, reviews, args.repeat)
+    analyzer = run('analyzer', review_analysis.analyze_review, reviews, args.repeat)
+    if analyzer:
+        print(f"Speedup: {legacy / analyzer:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
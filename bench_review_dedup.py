@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark near-duplicate review detection on a synthetic spam corpus
+
+Builds genuine reviews from random vocabulary plus copy-paste campaigns (one
+template posted on many doctors with a few words changed), then checks each
+campaign review against everything posted before it with:
+
+- window:  credibility.is_duplicate_content's rule (same doctor, 50 reviews, word-set Jaccard > 0.8)
+- exact:   exact shingle Jaccard against the whole corpus (ground truth, linear scan)
+- lsh:     review_dedup's MinHash/LSH index
+
+No database needed.
+
+Usage:
+    python bench_review_dedup.py
+    python bench_review_dedup.py --genuine 20000 --campaigns 40 --copies 25
+"""
+import argparse
+import random
+import time
+
+from credibility import normalize_text, calculate_similarity, DUPLICATE_SIMILARITY, DUPLICATE_WINDOW
+import review_dedup
+
+
+def build_corpus(genuine, campaigns, copies, doctors, seed):
+    rng = random.Random(seed)
+    vocabulary = [f'word{i}' for i in range(3000)]
+    reviews = []  # (doctor_id, text, campaign or None)
+
+    def text(length):
+        return ' '.join(rng.choice(vocabulary) for _ in range(length))
+
+    for _ in range(genuine):
+        reviews.append((rng.randrange(doctors), text(rng.randint(20, 120)), None))
+
+    for campaign in range(campaigns):
+        template = text(rng.randint(40, 100)).split()
+        for _ in range(copies):
+            words = list(template)
+            for _ in range(rng.randint(1, 3)):
+                words[rng.randrange(len(words))] = rng.choice(vocabulary)
+            reviews.append((rng.randrange(doctors), ' '.join(words), campaign))
+
+    rng.shuffle(reviews)
+    return reviews
+
+
+def exact_jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--genuine', type=int, default=5000)
+    parser.add_argument('--campaigns', type=int, default=20)
+    parser.add_argument('--copies', type=int, default=20)
+    parser.add_argument('--doctors', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    reviews = build_corpus(args.genuine, args.campaigns, args.copies, args.doctors, args.seed)
+    print(f"Corpus: {len(reviews)} reviews, {args.campaigns} campaigns x {args.copies} copies, {args.doctors} doctors")
+
+    # Campaign copies that follow an earlier copy of the same campaign should be caught
+    seen_campaigns = set()
+    expected = set()
+    for position, (_, _, campaign) in enumerate(reviews):
+        if campaign is not None:
+            if campaign in seen_campaigns:
+                expected.add(position)
+            seen_campaigns.add(campaign)
+
+    # window: per-doctor latest 50
+    started = time.perf_counter()
+    by_doctor = {}
+    window_hits = set()
+    for position, (doctor_id, text, _) in enumerate(reviews):
+        normalized = normalize_text(text)
+        earlier = by_doctor.setdefault(doctor_id, [])
+        if any(calculate_similarity(normalized, other) > DUPLICATE_SIMILARITY for other in earlier[-DUPLICATE_WINDOW:]):
+            window_hits.add(position)
+        earlier.append(normalized)
+    window_time = time.perf_counter() - started
+
+    # exact: linear scan over every earlier review (shingle Jaccard)
+    shingles = [review_dedup.shingle_hashes(text) for _, text, _ in reviews]
+    started = time.perf_counter()
+    exact_hits = set()
+    for position in range(len(reviews)):
+        if any(exact_jaccard(shingles[position], shingles[other]) >= review_dedup.NEAR_DUPLICATE_THRESHOLD
+               for other in range(position)):
+            exact_hits.add(position)
+    exact_time = time.perf_counter() - started
+
+    # lsh: signature + query + add, as rate_doctor does per review
+    index = review_dedup.SignatureIndex()
+    started = time.perf_counter()
+    lsh_hits = set()
+    for position, (_, text, _) in enumerate(reviews):
+        signature = review_dedup.minhash(shingles[position]) if shingles[position] else None
+        if signature is None:
+            continue
+        if index.query(signature):
+            lsh_hits.add(position)
+        index.add(position, signature)
+    lsh_time = time.perf_counter() - started
+
+    def report(label, hits, elapsed):
+        recall = len(hits & expected) / len(expected) if expected else 0
+        false_positives = len(hits - expected)
+        per_review = elapsed / len(reviews) * 1e6
+        print(f"{label:<8} recall {recall:6.1%}  false positives {false_positives:>5}  "
+              f"{elapsed * 1000:>9.1f} ms total  {per_review:>8.1f} us/review")
+
+    report('window', window_hits, window_time)
+    report('exact', exact_hits, exact_time)
+    report('lsh', lsh_hits, lsh_time)
+    if lsh_time:
+        print(f"LSH vs exact scan: {exact_time / lsh_time:.1f}x faster, "
+              f"agreement {len(lsh_hits & exact_hits) / max(len(exact_hits), 1):.1%} of exact hits")
+
+
+if __name__ == '__main__':
+    main()
@@ -41,7 +41,7 @@ def check_user(email):
         if newly_awarded:
             print(f"✅ Awarded {len(newly_awarded)} new badges:")
             for badge in newly_awarded:
-                print(f"   - {badge.badge_definition.icon} {badge.badge_definition.name}")
+                print(f"   - {badge['icon']} {badge['name']}")
         else:
             print("ℹ️  No new badges to award (already has all qualifying badges)")
 
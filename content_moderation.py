@@ -1,13 +1,11 @@
 #!/usr/bin/env python3
 """
 Simple content moderation for reviews
-English-only profanity detection and quality checks
+English-only profanity detection and quality checks (see review_analysis.py)
 """
 
-from better_profanity import profanity
+import review_analysis
 
-# Initialize profanity filter
-profanity.load_censor_words()
 
 def check_review_content(text):
     """
@@ -20,38 +18,11 @@ def check_review_content(text):
             'censored_text': text with profanity censored (for logging)
         }
     """
-    issues = []
-
-    # Check for profanity
-    if profanity.contains_profanity(text):
-        issues.append('contains_profanity')
-
-    # Check minimum length (prevent spam)
-    words = [w for w in text.strip().split() if w]
-    if len(words) < 2:
-        issues.append('too_short')
-
-    # Check maximum length (prevent spam)
-    if len(text) > 2000:
-        issues.append('too_long')
-
-    # Check for all caps (usually spam/rant)
-    if text.isupper() and len(text) > 20:
-        issues.append('all_caps')
-
-    # Check for excessive repetition (spam detection)
-    words = text.split()
-    if len(words) > 5 and len(set(words)) / len(words) < 0.3:
-        issues.append('repetitive')
-
-    # Check for URL spam
-    if 'http://' in text.lower() or 'https://' in text.lower() or 'www.' in text.lower():
-        issues.append('contains_url')
-
+    analysis = review_analysis.analyze_review(text)
     return {
-        'is_clean': len(issues) == 0,
-        'issues': issues,
-        'censored_text': profanity.censor(text)
+        'is_clean': analysis['approved'],
+        'issues': analysis['issues'],
+        'censored_text': analysis['censored_text']
     }
 
 
@@ -85,22 +56,7 @@ def moderate_review(rating_text, comment_text=''):
     approved = len(all_issues) == 0
 
     # Generate user-friendly message
-    message = ''
-    if not approved:
-        if 'contains_profanity' in all_issues:
-            message = 'Please keep your review professional and avoid inappropriate language.'
-        elif 'too_short' in all_issues:
-            message = 'Please write at least a few words about your experience.'
-        elif 'too_long' in all_issues:
-            message = 'Your review is too long. Please keep it under 2000 characters.'
-        elif 'all_caps' in all_issues:
-            message = 'Please don\'t write in all capital letters.'
-        elif 'repetitive' in all_issues:
-            message = 'Your review appears repetitive. Please write a genuine experience.'
-        elif 'contains_url' in all_issues:
-            message = 'Please don\'t include links in your review.'
-        else:
-            message = 'Your review doesn\'t meet our community guidelines.'
+    message = review_analysis.moderation_message(all_issues)
 
     return {
         'approved': approved,
@@ -3,8 +3,14 @@ Credibility scoring system for reviews
 Based on community signals to identify authentic patient experiences
 """
 from datetime import datetime, timedelta
+from itertools import groupby
 from models import Rating, User
+from sqlalchemy import func, update
 import re
+import time
+
+import review_analysis
+import review_dedup
 
 
 # Scoring matrix based on community signals
@@ -22,6 +28,15 @@ CREDIBILITY_POINTS = {
     'duplicate_content': -50,        # Similar to existing reviews
 }
 
+# Duplicate check: compare against up to DUPLICATE_WINDOW other reviews of the
+# same doctor; word-set Jaccard above DUPLICATE_SIMILARITY counts as a copy
+DUPLICATE_MIN_LENGTH = 20
+DUPLICATE_WINDOW = 50
+DUPLICATE_SIMILARITY = 0.8
+
+# Rows per bulk UPDATE in recalculate_all_credibility_scores()
+RECALCULATE_BATCH_SIZE = 1000
+
 # Thresholds for credibility tiers
 CREDIBILITY_TIERS = {
     'verified_patient': 40,   # High credibility - show badge
@@ -31,22 +46,44 @@ CREDIBILITY_TIERS = {
 }
 
 
-def calculate_credibility_score(review, user):
+def calculate_credibility_score(review, user, analysis=None):
     """
     Calculate credibility score for a review
 
     Args:
         review: Rating object
         user: User object who wrote the review
+        analysis: review_analysis.analyze_review() result for review.comment, if already computed
 
     Returns:
         int: Credibility score (-100 to 100+)
     """
+    review_count = Rating.query.filter_by(user_id=user.id).count()
+    return score_review_signals(
+        appointment_id=review.appointment_id,
+        comment=review.comment,
+        review_count=review_count,
+        account_created_at=user.created_at,
+        is_duplicate=is_duplicate_content(review) or review_dedup.is_near_duplicate(review),
+        is_specific=analysis['is_specific'] if analysis else None,
+    )
+
+
+def score_review_signals(appointment_id, comment, review_count, account_created_at, is_duplicate,
+                         is_specific=None, now=None):
+    """
+    Score a review from precomputed inputs (no database access)
+
+    Shared by calculate_credibility_score() and the batch scorer.
+
+    Returns:
+        tuple: (score, signals)
+    """
     score = 0
     signals = []
 
     # 1. Verified Interaction (+30)
-    if review.appointment_id:
+    if appointment_id:
         score += CREDIBILITY_POINTS['verified_interaction']
         signals.append('verified_interaction')
     else:
@@ -55,7 +92,6 @@ def calculate_credibility_score(review, user):
         signals.append('unverified_interaction')
 
     # 2. Account History (>3 reviews) (+15)
-    review_count = Rating.query.filter_by(user_id=user.id).count()
     if review_count >= 3:
         score += CREDIBILITY_POINTS['account_history_3plus']
         signals.append('account_history_3plus')
@@ -65,30 +101,34 @@ def calculate_credibility_score(review, user):
         score += CREDIBILITY_POINTS['first_time_reviewer']
         signals.append('first_time_reviewer')
 
-    # 4. Account Age (>6 months) (+10)
-    account_age = datetime.utcnow() - user.created_at
-    if account_age > timedelta(days=180):  # 6 months
-        score += CREDIBILITY_POINTS['account_age_6months']
-        signals.append('account_age_6months')
+    if account_created_at:
+        account_age = (now or datetime.utcnow()) - account_created_at
+
+        # 4. Account Age (>6 months) (+10)
+        if account_age > timedelta(days=180):  # 6 months
+            score += CREDIBILITY_POINTS['account_age_6months']
+            signals.append('account_age_6months')
 
-    # 5. New Account (<24h) (-15)
-    if account_age < timedelta(hours=24):
-        score += CREDIBILITY_POINTS['new_account_24h']
-        signals.append('new_account_24h')
+        # 5. New Account (<24h) (-15)
+        if account_age < timedelta(hours=24):
+            score += CREDIBILITY_POINTS['new_account_24h']
+            signals.append('new_account_24h')
 
     # 6. Review Length (>50 chars) (+5)
-    if review.comment and len(review.comment.strip()) > 50:
+    if comment and len(comment.strip()) > 50:
         score += CREDIBILITY_POINTS['review_length_50plus']
         signals.append('review_length_50plus')
 
     # 7. Content Specificity (+10)
     # Check for specific medical terms, visit details, or personal experience markers
-    if review.comment and has_specific_content(review.comment):
+    if is_specific is None:
+        is_specific = has_specific_content(comment)
+    if comment and is_specific:
         score += CREDIBILITY_POINTS['content_specificity']
         signals.append('content_specificity')
 
     # 8. Duplicate Content (-50)
-    if is_duplicate_content(review):
+    if is_duplicate:
         score += CREDIBILITY_POINTS['duplicate_content']
         signals.append('duplicate_content')
 
@@ -103,35 +143,10 @@ def has_specific_content(comment):
         comment: Review text
 
     Returns:
-        bool: True if content appears specific/detailed
+        bool: True if content appears specific/detailed (3+ indicator types,
+        see review_analysis.SPECIFICITY_WORDS)
     """
-    if not comment:
-        return False
-
-    comment_lower = comment.lower()
-
-    # Indicators of specific, detailed reviews
-    specificity_indicators = [
-        # Medical terms
-        r'\b(diagnosis|treatment|medication|prescription|symptoms?|test|x-ray|scan|surgery)\b',
-        # Time references
-        r'\b(minutes?|hours?|days?|weeks?|months?|waited|appointment)\b',
-        # Personal experience markers
-        r'\b(i|my|me|felt|experienced|visited|went|saw|told)\b',
-        # Specific details
-        r'\b(staff|nurse|reception|clinic|office|waiting room|consultation)\b',
-        # Numbers/measurements
-        r'\d+\s*(minutes?|hours?|rupees?|days?)',
-    ]
-
-    # Count how many types of indicators are present
-    indicator_count = 0
-    for pattern in specificity_indicators:
-        if re.search(pattern, comment_lower):
-            indicator_count += 1
-
-    # If 3+ different types of indicators, consider it specific
-    return indicator_count >= 3
+    return review_analysis.is_specific(comment)
 
 
 def is_duplicate_content(review):
@@ -144,7 +159,7 @@ def is_duplicate_content(review):
     Returns:
         bool: True if appears to be duplicate content
     """
-    if not review.comment or len(review.comment.strip()) < 20:
+    if not review.comment or len(review.comment.strip()) < DUPLICATE_MIN_LENGTH:
         return False
 
     # Get other reviews for the same doctor
@@ -152,7 +167,7 @@ def is_duplicate_content(review):
         Rating.doctor_id == review.doctor_id,
         Rating.id != review.id,
         Rating.comment.isnot(None)
-    ).limit(50).all()
+    ).order_by(Rating.id).limit(DUPLICATE_WINDOW).all()
 
     # Simple similarity check - normalize and compare
     review_normalized = normalize_text(review.comment)
@@ -162,7 +177,7 @@ def is_duplicate_content(review):
 
         # If 80%+ of text is identical, flag as duplicate
         similarity = calculate_similarity(review_normalized, other_normalized)
-        if similarity > 0.8:
+        if similarity > DUPLICATE_SIMILARITY:
             return True
 
     return False
@@ -258,42 +273,153 @@ def update_review_credibility(review_id):
     }
 
 
-def recalculate_all_credibility_scores():
+def _jaccard(words1, words2):
+    """calculate_similarity() on precomputed word sets"""
+    if not words1 or not words2:
+        return 0.0
+    return len(words1 & words2) / len(words1 | words2)
+
+
+def find_duplicate_reviews(reviews):
+    """
+    Duplicate flags for all reviews of one doctor, same rule as is_duplicate_content()
+
+    Each text is normalized and split once; every review is compared with the
+    first DUPLICATE_WINDOW other commented reviews (by id) of the doctor.
+
+    Args:
+        reviews: list of (review_id, comment) for a single doctor, ordered by id
+
+    Returns:
+        set of review ids that count as duplicate content
+    """
+    commented = [(review_id, set(normalize_text(comment).split()))
+                 for review_id, comment in reviews if comment is not None]
+    window = commented[:DUPLICATE_WINDOW + 1]
+
+    duplicates = set()
+    for review_id, comment in reviews:
+        if not comment or len(comment.strip()) < DUPLICATE_MIN_LENGTH:
+            continue
+        words = set(normalize_text(comment).split())
+        others = [other_words for other_id, other_words in window if other_id != review_id][:DUPLICATE_WINDOW]
+        if any(_jaccard(words, other_words) > DUPLICATE_SIMILARITY for other_words in others):
+            duplicates.add(review_id)
+    return duplicates
+
+
+def _write_scores(db, scores, suspicious_ids):
+    """Bulk UPDATE credibility_score by primary key, then flag suspicious reviews"""
+    if scores:
+        db.session.execute(
+            update(Rating),
+            [{'id': review_id, 'credibility_score': score} for review_id, score in scores]
+        )
+    if suspicious_ids:
+        db.session.execute(
+            update(Rating).where(Rating.id.in_(suspicious_ids)).values(is_suspected=True)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+
+def recalculate_all_credibility_scores(progress=True):
     """
     Recalculate credibility scores for all existing reviews
     Useful for initial migration or periodic updates
 
+    Reviewer stats come from one GROUP BY. Reviews are loaded a batch of
+    doctors at a time (about RECALCULATE_BATCH_SIZE reviews), duplicate
+    detection runs per doctor in memory (plus cross-doctor copies from the
+    review_dedup index), and scores are written back with one executemany
+    UPDATE per batch.
+
+    Args:
+        progress: Print a progress/throughput line after each batch
+
     Returns:
         dict: Statistics about the update
     """
     from app import db, app
 
     with app.app_context():
-        reviews = Rating.query.all()
+        started = time.perf_counter()
+        now = datetime.utcnow()
+
+        reviewers = {
+            user_id: (review_count, created_at)
+            for user_id, review_count, created_at in db.session.query(
+                User.id, func.count(Rating.id), User.created_at
+            ).join(Rating, Rating.user_id == User.id).group_by(User.id, User.created_at)
+        }
+
+        doctor_counts = db.session.query(Rating.doctor_id, func.count(Rating.id))\
+            .group_by(Rating.doctor_id).order_by(Rating.doctor_id).all()
 
         stats = {
-            'total': len(reviews),
+            'total': sum(count for _, count in doctor_counts),
             'verified_patient': 0,
             'trusted': 0,
             'neutral': 0,
             'suspicious': 0,
         }
 
-        for review in reviews:
-            score, signals = calculate_credibility_score(review, review.user)
-            tier = get_credibility_tier(score)
-
-            review.credibility_score = score
-
-            if tier == 'suspicious':
-                review.is_suspected = True
-
-            stats[tier] += 1
-
-            # Commit every 100 reviews
-            if stats['total'] > 0 and stats['total'] % 100 == 0:
-                db.session.commit()
+        # Near-copies of earlier reviews anywhere in the corpus (MinHash index)
+        copied_ids = review_dedup.find_copied_reviews()
+
+        processed = 0
+        for doctor_ids in _doctor_batches(doctor_counts):
+            rows = db.session.query(
+                Rating.id, Rating.doctor_id, Rating.user_id, Rating.appointment_id, Rating.comment
+            ).filter(Rating.doctor_id.in_(doctor_ids)).order_by(Rating.doctor_id, Rating.id).all()
+
+            scores = []
+            suspicious_ids = []
+            for _, doctor_rows in groupby(rows, key=lambda row: row.doctor_id):
+                doctor_rows = list(doctor_rows)
+                duplicates = find_duplicate_reviews([(row.id, row.comment) for row in doctor_rows])
+
+                for row in doctor_rows:
+                    review_count, created_at = reviewers.get(row.user_id, (0, None))
+                    score, _ = score_review_signals(
+                        appointment_id=row.appointment_id,
+                        comment=row.comment,
+                        review_count=review_count,
+                        account_created_at=created_at,
+                        is_duplicate=row.id in duplicates or row.id in copied_ids,
+                        now=now,
+                    )
+                    tier = get_credibility_tier(score)
+                    stats[tier] += 1
+                    scores.append((row.id, score))
+                    if tier == 'suspicious':
+                        suspicious_ids.append(row.id)
+
+            _write_scores(db, scores, suspicious_ids)
+            processed += len(scores)
+            if progress:
+                _report_progress(processed, stats['total'], started)
+
+        stats['seconds'] = round(time.perf_counter() - started, 2)
+        return stats
 
-        db.session.commit()
 
-        return stats
+def _doctor_batches(doctor_counts):
+    """Group doctor ids so each batch holds roughly RECALCULATE_BATCH_SIZE reviews"""
+    batch = []
+    batch_reviews = 0
+    for doctor_id, review_count in doctor_counts:
+        batch.append(doctor_id)
+        batch_reviews += review_count
+        if batch_reviews >= RECALCULATE_BATCH_SIZE:
+            yield batch
+            batch = []
+            batch_reviews = 0
+    if batch:
+        yield batch
+
+
+def _report_progress(processed, total, started):
+    elapsed = time.perf_counter() - started
+    rate = processed / elapsed if elapsed else 0
+    print(f"[CREDIBILITY] {processed}/{total} reviews scored ({rate:.0f} reviews/s)")
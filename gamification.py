@@ -2,7 +2,13 @@
 Gamification system for RankSewa
 Handles badge awards and point calculations
 """
-from models import db, User, UserBadge, BadgeDefinition, Rating, ReviewHelpful
+import os
+import threading
+import time
+from datetime import datetime
+
+from models import db, User, UserBadge, BadgeDefinition, Rating, ReviewHelpful, LeaderboardSnapshot, Doctor
+from sqlalchemy import func, literal, update
 from sqlalchemy.exc import IntegrityError
 
 
@@ -15,6 +21,8 @@ POINTS = {
     'first_review_bonus': 5,  # Bonus for being first to review a doctor
 }
 
+DETAILED_REVIEW_LENGTH = 100  # Characters - detailed_review points and badge
+
 
 def award_points(user, points, db_commit=True):
     """
@@ -34,6 +42,78 @@ def award_points(user, points, db_commit=True):
         db.session.commit()
 
 
+# Badge rules evaluated against the stored reputation counters:
+# (slug, User column, minimum, below) - "below" caps a tier so only the highest
+# Community Champion tier reached is awarded, as before
+BADGE_RULES = (
+    ('first_review', 'review_count', 1, None),
+    ('helpful_reviewer', 'helpful_received', 5, None),
+    ('detailed_reviewer', 'has_detailed_review', True, None),
+    ('champion_25', 'review_count', 25, None),
+    ('champion_10', 'review_count', 10, 25),
+    ('champion_5', 'review_count', 5, 10),
+    ('specialty_explorer', 'distinct_specialties', 3, None),
+    ('city_guide', 'distinct_cities', 3, None),
+)
+
+_badge_registry = {
+    'data': None,
+    'expires_at': None
+}
+BADGE_REGISTRY_TTL = 600  # 10 minutes
+
+
+def get_badge_registry():
+    """
+    Active badge definitions as plain dicts, ordered for display (cached per process)
+
+    Returns:
+        list of dicts with id, slug, name, description, icon, tier
+    """
+    now = time.time()
+    if _badge_registry['data'] is not None and now < _badge_registry['expires_at']:
+        return _badge_registry['data']
+
+    badges = [
+        {'id': b.id, 'slug': b.slug, 'name': b.name, 'description': b.description, 'icon': b.icon, 'tier': b.tier}
+        for b in BadgeDefinition.query.filter_by(is_active=True).order_by(BadgeDefinition.display_order).all()
+    ]
+    _badge_registry['data'] = badges
+    _badge_registry['expires_at'] = now + BADGE_REGISTRY_TTL
+    return badges
+
+
+def invalidate_badge_registry():
+    """Drop the cached badge definitions (after adding/editing BadgeDefinition rows)"""
+    _badge_registry['data'] = None
+    _badge_registry['expires_at'] = None
+
+
+def _badges_by_slug():
+    return {badge['slug']: badge for badge in get_badge_registry()}
+
+
+def _insert_user_badges(pairs):
+    """
+    Insert (user_id, badge_id) rows in one executemany INSERT
+
+    Runs in a savepoint: if a concurrent request awarded one of the badges
+    first, nothing is inserted and False is returned.
+    """
+    if not pairs:
+        return True
+    now = datetime.utcnow()
+    try:
+        with db.session.begin_nested():
+            db.session.execute(
+                UserBadge.__table__.insert(),
+                [{'user_id': user_id, 'badge_id': badge_id, 'earned_at': now} for user_id, badge_id in pairs]
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
 def award_badge(user, badge_slug, db_commit=True):
     """
     Award a badge to a user
@@ -44,104 +124,73 @@ def award_badge(user, badge_slug, db_commit=True):
         db_commit: Whether to commit the transaction (default True)
 
     Returns:
-        UserBadge object if awarded, None if already has badge or badge doesn't exist
+        Badge dict (see get_badge_registry) if awarded, None if already has badge or badge doesn't exist
     """
-    # Get badge definition
-    badge = BadgeDefinition.query.filter_by(slug=badge_slug, is_active=True).first()
+    badge = _badges_by_slug().get(badge_slug)
     if not badge:
         return None
 
-    # Check if user already has this badge
-    existing = UserBadge.query.filter_by(user_id=user.id, badge_id=badge.id).first()
-    if existing:
+    existing = db.session.query(UserBadge.id).filter_by(user_id=user.id, badge_id=badge['id']).first()
+    if existing or not _insert_user_badges([(user.id, badge['id'])]):
         return None
 
-    # Award the badge
-    user_badge = UserBadge(user_id=user.id, badge_id=badge.id)
-    db.session.add(user_badge)
-
     if db_commit:
-        try:
-            db.session.commit()
-            return user_badge
-        except IntegrityError:
-            db.session.rollback()
-            return None
+        db.session.commit()
+    return badge
+
+
+def _rule_matches(user, attribute, minimum, below):
+    value = getattr(user, attribute)
+    if isinstance(minimum, bool):
+        return bool(value) is minimum
+    value = value or 0
+    return value >= minimum and (below is None or value < below)
+
+
+def _rule_condition(attribute, minimum, below):
+    """SQL equivalent of _rule_matches() for set-based awarding"""
+    column = getattr(User, attribute)
+    if isinstance(minimum, bool):
+        return column.is_(minimum)
+    condition = column >= minimum
+    if below is not None:
+        condition = condition & (column < below)
+    return condition
 
-    return user_badge
+
+def earned_badge_slugs(user):
+    """
+    Badge slugs a user qualifies for, from the stored reputation counters
+
+    Pure rule check - reads only columns on the User row (no relationship loads).
+    """
+    return [slug for slug, attribute, minimum, below in BADGE_RULES
+            if _rule_matches(user, attribute, minimum, below)]
 
 
 def check_and_award_badges(user, db_commit=True):
     """
     Check user's stats and award any badges they've earned
 
+    One query for the user's current badges and one INSERT for the new ones;
+    badge definitions come from the cached registry.
+
     Args:
         user: User object
         db_commit: Whether to commit the transaction (default True)
 
     Returns:
-        List of newly awarded badges
-    """
-    newly_awarded = []
-
-    # Get user stats
-    review_count = user.review_count
-    helpful_count = user.helpful_count
-
-    # Count specialties and cities reviewed
-    specialties = set()
-    cities = set()
-    for rating in user.ratings:
-        if rating.doctor.specialty_id:
-            specialties.add(rating.doctor.specialty_id)
-        if rating.doctor.city_id:
-            cities.add(rating.doctor.city_id)
-
-    # Check for "First Review" badge
-    if review_count >= 1:
-        badge = award_badge(user, 'first_review', db_commit=False)
-        if badge:
-            newly_awarded.append(badge)
-
-    # Check for "Helpful Reviewer" badge
-    if helpful_count >= 5:
-        badge = award_badge(user, 'helpful_reviewer', db_commit=False)
-        if badge:
-            newly_awarded.append(badge)
-
-    # Check for "Detailed Reviewer" badge
-    # (At least one review with 100+ words)
-    has_detailed = any(len(r.comment or '') >= 100 for r in user.ratings)
-    if has_detailed:
-        badge = award_badge(user, 'detailed_reviewer', db_commit=False)
-        if badge:
-            newly_awarded.append(badge)
-
-    # Check for "Community Champion" badges (5, 10, 25 reviews)
-    if review_count >= 25:
-        badge = award_badge(user, 'champion_25', db_commit=False)
-        if badge:
-            newly_awarded.append(badge)
-    elif review_count >= 10:
-        badge = award_badge(user, 'champion_10', db_commit=False)
-        if badge:
-            newly_awarded.append(badge)
-    elif review_count >= 5:
-        badge = award_badge(user, 'champion_5', db_commit=False)
-        if badge:
-            newly_awarded.append(badge)
-
-    # Check for "Specialty Explorer" badge (3+ specialties)
-    if len(specialties) >= 3:
-        badge = award_badge(user, 'specialty_explorer', db_commit=False)
-        if badge:
-            newly_awarded.append(badge)
-
-    # Check for "City Guide" badge (3+ cities)
-    if len(cities) >= 3:
-        badge = award_badge(user, 'city_guide', db_commit=False)
-        if badge:
-            newly_awarded.append(badge)
+        List of newly awarded badge dicts (see get_badge_registry)
+    """
+    registry = _badges_by_slug()
+    candidates = [registry[slug] for slug in earned_badge_slugs(user) if slug in registry]
+    if not candidates:
+        return []
+
+    held = {badge_id for (badge_id,) in db.session.query(UserBadge.badge_id).filter(UserBadge.user_id == user.id)}
+    newly_awarded = [badge for badge in candidates if badge['id'] not in held]
+    if not _insert_user_badges([(user.id, badge['id']) for badge in newly_awarded]):
+        return []
 
     if db_commit and newly_awarded:
         db.session.commit()
@@ -149,39 +198,194 @@ def check_and_award_badges(user, db_commit=True):
     return newly_awarded
 
 
-def process_new_review(user, rating, is_first_for_doctor=False):
+def award_badges_bulk(user_ids=None):
     """
-    Process a new review submission and award points/badges
+    Award every qualifying badge to many users with one INSERT ... SELECT per rule
+
+    Reads the stored counters, so run recalculate_user_counters() first when
+    they may be stale. Does not commit.
 
     Args:
-        user: User who wrote the review
-        rating: Rating object
-        is_first_for_doctor: Whether this is the first review for this doctor
+        user_ids: Iterable of user ids to consider (None = every user)
 
     Returns:
-        dict with points awarded and badges earned
+        dict: badge slug -> number of users newly awarded
+    """
+    registry = _badges_by_slug()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+
+    now = datetime.utcnow()
+    awarded = {}
+    for slug, attribute, minimum, below in BADGE_RULES:
+        badge = registry.get(slug)
+        if not badge:
+            continue
+
+        already_held = db.session.query(UserBadge.id).filter(
+            UserBadge.user_id == User.id, UserBadge.badge_id == badge['id']
+        ).exists()
+        eligible = db.session.query(
+            User.id, literal(badge['id']), literal(now, type_=db.DateTime)
+        ).filter(_rule_condition(attribute, minimum, below), ~already_held)
+        if user_ids is not None:
+            eligible = eligible.filter(User.id.in_(user_ids))
+
+        result = db.session.execute(
+            UserBadge.__table__.insert().from_select(['user_id', 'badge_id', 'earned_at'], eligible)
+        )
+        awarded[slug] = result.rowcount
+
+    return awarded
+
+
+def _reviewed_before(user_id, rating_id, column, value):
+    """Whether the user has another review of a doctor with doctors.<column> == value"""
+    return db.session.query(
+        db.session.query(Rating.id)
+        .join(Doctor, Rating.doctor_id == Doctor.id)
+        .filter(Rating.user_id == user_id, Rating.id != rating_id, column == value)
+        .exists()
+    ).scalar()
+
+
+def _increment_counters(user_id, **deltas):
+    """
+    Atomically apply counter changes on the users row (UPDATE ... SET col = col + n)
+
+    Boolean flags are passed as True/False and only ever switch on.
     """
+    values = {}
+    for name, delta in deltas.items():
+        column = getattr(User, name)
+        if isinstance(delta, bool):
+            if delta:
+                values[column] = True
+        elif delta:
+            values[column] = func.coalesce(column, 0) + delta
+    if values:
+        db.session.execute(
+            update(User).where(User.id == user_id).values(values)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def _refresh_counters(user):
+    """Reload the counter columns after an UPDATE so badge rules see current values"""
+    db.session.refresh(user, attribute_names=[
+        'review_count', 'helpful_received', 'distinct_specialties', 'distinct_cities', 'has_detailed_review'
+    ])
+
+
+def record_review_counters(user, rating):
+    """
+    Update a user's reputation counters for a newly added (flushed) review
+
+    Distinct specialty/city counters only move when no earlier review of the
+    user's covers the new doctor's specialty/city.
+    """
+    doctor = rating.doctor or Doctor.query.get(rating.doctor_id)
+    new_specialty = bool(doctor and doctor.specialty_id) and not _reviewed_before(
+        user.id, rating.id, Doctor.specialty_id, doctor.specialty_id)
+    new_city = bool(doctor and doctor.city_id) and not _reviewed_before(
+        user.id, rating.id, Doctor.city_id, doctor.city_id)
+
+    _increment_counters(
+        user.id,
+        review_count=1,
+        distinct_specialties=1 if new_specialty else 0,
+        distinct_cities=1 if new_city else 0,
+        has_detailed_review=len(rating.comment or '') >= DETAILED_REVIEW_LENGTH,
+    )
+    _refresh_counters(user)
+
+
+def recalculate_user_counters(user_ids=None):
+    """
+    Recompute reputation counters from ratings/review_helpful in one UPDATE
+
+    Use after reviews or helpful votes are removed in bulk, or to backfill.
+
+    Args:
+        user_ids: Iterable of user ids to recompute (None = every user)
+
+    Returns:
+        int: number of users updated
+    """
+    own_ratings = Rating.user_id == User.id
+    reviewed_doctors = db.session.query(Rating).join(Doctor, Doctor.id == Rating.doctor_id).filter(own_ratings)
+
+    values = {
+        User.review_count: db.session.query(func.count(Rating.id))
+            .filter(own_ratings).scalar_subquery(),
+        User.helpful_received: db.session.query(func.count(ReviewHelpful.id))
+            .join(Rating, Rating.id == ReviewHelpful.rating_id)
+            .filter(own_ratings).scalar_subquery(),
+        User.distinct_specialties: reviewed_doctors
+            .with_entities(func.count(func.distinct(Doctor.specialty_id))).scalar_subquery(),
+        User.distinct_cities: reviewed_doctors
+            .with_entities(func.count(func.distinct(Doctor.city_id))).scalar_subquery(),
+        User.has_detailed_review: db.session.query(Rating.id)
+            .filter(own_ratings, func.length(Rating.comment) >= DETAILED_REVIEW_LENGTH).exists(),
+    }
+
+    stmt = update(User).values(values).execution_options(synchronize_session=False)
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return 0
+        stmt = stmt.where(User.id.in_(user_ids))
+
+    result = db.session.execute(stmt)
+    db.session.expire_all()
+    return result.rowcount
+
+
+def review_points(comment, is_first_for_doctor=False):
+    """Points a new review earns (known before the review is processed)"""
     total_points = 0
 
     # Base points for writing a review
     total_points += POINTS['review']
 
     # Bonus for detailed review (100+ words)
-    if rating.comment and len(rating.comment) >= 100:
+    if comment and len(comment) >= DETAILED_REVIEW_LENGTH:
         total_points += POINTS['detailed_review']
 
     # Bonus for first review on this doctor
     if is_first_for_doctor:
         total_points += POINTS['first_review_bonus']
 
+    return total_points
+
+
+def process_new_review(user, rating, is_first_for_doctor=False, db_commit=True):
+    """
+    Process a new review submission and award points/badges
+
+    Args:
+        user: User who wrote the review
+        rating: Rating object
+        is_first_for_doctor: Whether this is the first review for this doctor
+        db_commit: Whether to commit the transaction (default True)
+
+    Returns:
+        dict with points awarded and badges earned
+    """
+    total_points = review_points(rating.comment, is_first_for_doctor)
+
     # Award points
     award_points(user, total_points, db_commit=False)
 
-    # Check and award badges
+    # Update stored counters, then check badges against them
+    record_review_counters(user, rating)
     badges_earned = check_and_award_badges(user, db_commit=False)
 
     # Commit all changes together
-    db.session.commit()
+    if db_commit:
+        db.session.commit()
 
     return {
         'points': total_points,
@@ -204,6 +408,8 @@ def process_helpful_vote(review_author, rating):
     """
     # Award points to review author
     award_points(review_author, POINTS['helpful_vote'], db_commit=False)
+    _increment_counters(review_author.id, helpful_received=1)
+    _refresh_counters(review_author)
 
     # Check if this unlocks any badges
     badges_earned = check_and_award_badges(review_author, db_commit=False)
@@ -218,6 +424,18 @@ def process_helpful_vote(review_author, rating):
     }
 
 
+def process_helpful_vote_removed(review_author):
+    """
+    Process when a helpful vote is withdrawn (toggled off)
+    Points already awarded are kept; only the stored counter goes down
+
+    Args:
+        review_author: User who wrote the review
+    """
+    _increment_counters(review_author.id, helpful_received=-1)
+    db.session.commit()
+
+
 def process_doctor_response(review_author):
     """
     Process when a doctor responds to a user's review
@@ -238,6 +456,115 @@ def process_doctor_response(review_author):
     }
 
 
+# --- Leaderboard snapshot ---
+LEADERBOARD_SIZE = 50
+LEADERBOARD_REFRESH_SECONDS = int(os.getenv('LEADERBOARD_REFRESH_SECONDS', '300'))
+LEADERBOARD_BOARDS = ('points', 'reviews', 'helpful')
+
+_leaderboard_lock = threading.Lock()
+
+
+def rebuild_leaderboard_snapshot():
+    """
+    Recompute the top-50 lists and replace the leaderboard_snapshot rows
+
+    Returns:
+        int: number of snapshot rows written (0 if another worker won the race)
+    """
+    def top(column):
+        return [
+            user_id for (user_id,) in db.session.query(User.id)
+            .filter(column > 0)
+            .order_by(column.desc(), User.id.asc())
+            .limit(LEADERBOARD_SIZE)
+        ]
+
+    rankings = {
+        'points': top(User.points),
+        'reviews': top(User.review_count),
+        'helpful': top(User.helpful_received),
+    }
+
+    listed_ids = set().union(*rankings.values())
+    users = {
+        row.id: row
+        for row in db.session.query(User.id, User.name, User.points, User.review_count, User.helpful_received)
+        .filter(User.id.in_(listed_ids))
+    } if listed_ids else {}
+
+    now = datetime.utcnow()
+    rows = []
+    for board, user_ids in rankings.items():
+        for rank, user_id in enumerate(user_ids, start=1):
+            user = users[user_id]
+            rows.append({
+                'board': board,
+                'rank': rank,
+                'user_id': user_id,
+                'name': user.name,
+                'points': user.points or 0,
+                'review_count': user.review_count or 0,
+                'helpful_count': user.helpful_received or 0,
+                'refreshed_at': now,
+            })
+
+    try:
+        LeaderboardSnapshot.query.delete()
+        if rows:
+            db.session.execute(LeaderboardSnapshot.__table__.insert(), rows)
+        db.session.commit()
+    except IntegrityError:
+        # Another worker rebuilt the snapshot concurrently - keep theirs
+        db.session.rollback()
+        return 0
+
+    return len(rows)
+
+
+def get_leaderboard():
+    """
+    Get pre-ranked leaderboard lists
+
+    The snapshot is rebuilt every LEADERBOARD_REFRESH_SECONDS by the
+    'rebuild_leaderboard' maintenance task; a request only builds it when
+    there is none yet (fresh database).
+
+    Returns:
+        dict: board name -> list of LeaderboardSnapshot rows ordered by rank
+    """
+    rows = LeaderboardSnapshot.query.order_by(LeaderboardSnapshot.board, LeaderboardSnapshot.rank).all()
+
+    # Only one thread per worker builds; the others serve the empty boards
+    if not rows and _leaderboard_lock.acquire(blocking=False):
+        try:
+            rebuild_leaderboard_snapshot()
+            rows = LeaderboardSnapshot.query.order_by(LeaderboardSnapshot.board, LeaderboardSnapshot.rank).all()
+        finally:
+            _leaderboard_lock.release()
+
+    boards = {board: [] for board in LEADERBOARD_BOARDS}
+    for row in rows:
+        boards.setdefault(row.board, []).append(row)
+    return boards
+
+
+def get_user_rank(user):
+    """
+    Get a user's overall rank by points (1 = most points)
+
+    Returns:
+        int or None if the user has no points yet
+    """
+    if not user.points:
+        return None
+    return User.query.filter(User.points > user.points).count() + 1
+
+
+def get_active_badges():
+    """Get active badge definitions for display (cached plain dicts)"""
+    return get_badge_registry()
+
+
 def initialize_badges():
     """
     Initialize the badge definitions in the database
@@ -319,6 +646,7 @@ def initialize_badges():
 
     try:
         db.session.commit()
+        invalidate_badge_registry()
         print(f"✅ Initialized {len(badges)} badge definitions")
     except Exception as e:
         db.session.rollback()
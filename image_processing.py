@@ -0,0 +1,286 @@
+"""
+Off-request processing of uploaded images
+
+Profile photos, clinic logos and article images used to be decoded, resized
+with LANCZOS, re-encoded with optimize=True and uploaded to R2 inside the
+HTTP request. A 10 MB camera photo held one of the two gunicorn threads for
+seconds. Now the request only validates the upload (type, size and the
+dimensions from the header) and stages it:
+
+    image_processing.submit('profile_photo', photo_file, doctor)
+
+submit() writes the file plus a small JSON manifest to
+UPLOAD_FOLDER/staging/ and, once the request has finished (and committed),
+hands it to a per-process pool of IMAGE_WORKERS threads. Pillow releases the
+GIL while decoding, resizing and encoding, so the pool works alongside the
+request threads. The processor registered for the kind
+(@image_processing.processor) produces the final file. The record is then
+switched to it with a compare-and-swap UPDATE. submit() stores the upload's
+staging token in the record's token column (committed with the view), and
+the UPDATE only applies while that token is still there and the column
+still holds the value it had at submit time. Of two uploads in flight the
+one submitted last wins, whichever finishes first, and an upload whose
+image was removed in the meantime is discarded. After a successful switch
+the previous file is deleted.
+
+The pool runs in the web process rather than on the jobs worker: local
+photo/logo fallbacks and article images are written to the web container's
+disk, which the worker may not share.
+
+Manifests are claimed by renaming them to .working. The maintenance thread
+resubmits manifests that nobody picked up within STAGING_RETRY_SECONDS (for
+example the process was restarted). It also releases .working claims older
+than STAGING_STALE_SECONDS.
+
+Set IMAGE_PROCESSING=inline to process right after the response instead of
+on the pool (tests, scripts).
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import after_this_request, has_request_context
+
+import maintenance
+from models import db
+
+
+IMAGE_PROCESSING = os.getenv('IMAGE_PROCESSING', 'pool')  # 'pool' or 'inline'
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+STAGING_RETRY_SECONDS = 120
+STAGING_STALE_SECONDS = 900
+STAGING_SCAN_INTERVAL = 60
+MANIFEST_SUFFIX = '.json'
+CLAIMED_SUFFIX = '.working'
+
+# kind -> {'func', 'model', 'column', 'token_column', 'discard', 'after'}
+_processors = {}
+_state = {'app': None, 'executor': None, 'pid': None}
+_inflight = set()
+_lock = threading.Lock()
+_stats = {'submitted': 0, 'processed': 0, 'superseded': 0, 'failed': 0}
+
+
+def processor(kind, model, column, token_column, discard=None, after=None):
+    """
+    Register the processing function for uploads of `kind`
+
+    The function is called as func(staged_path, record_id) inside an app
+    context and returns {column: value, ...} to write to the record; `column`
+    must be among them.
+
+    Args:
+        model / column: the record and column the upload ends up in
+        token_column: column holding the latest submitted upload's token
+        discard: discard(value) deletes a produced or replaced file
+        after: after(record_id) runs once the record has been updated
+    """
+    def decorator(func):
+        _processors[kind] = {'func': func, 'model': model, 'column': column, 'token_column': token_column,
+                             'discard': discard, 'after': after}
+        return func
+    return decorator
+
+
+def staging_dir():
+    return os.path.join(_state['app'].config['UPLOAD_FOLDER'], 'staging')
+
+
+def submit(kind, file, record):
+    """
+    Stage an uploaded file for `record` and process it off-request
+
+    Call after validating the upload. The record must have an id (flush
+    first). Its column is left unchanged until processing finishes; the
+    upload's token is set on the record and must be committed with it
+    (processing starts once the request has finished).
+
+    Returns:
+        str: staging token
+    """
+    registered = _processors[kind]
+    directory = staging_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    token = uuid.uuid4().hex
+    extension = os.path.splitext(file.filename or '')[1].lower()[:10]
+    staged_path = os.path.join(directory, token + extension)
+    file.seek(0)
+    file.save(staged_path)
+
+    manifest = {
+        'kind': kind,
+        'record_id': record.id,
+        'previous': getattr(record, registered['column']),
+        'staged': os.path.basename(staged_path),
+    }
+    setattr(record, registered['token_column'], token)
+    manifest_path = os.path.join(directory, token + MANIFEST_SUFFIX)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    _count('submitted')
+
+    if has_request_context():
+        # Start after the view has committed, so the worker sees the record
+        @after_this_request
+        def start_processing(response):
+            _dispatch(token)
+            return response
+    else:
+        _dispatch(token)
+    return token
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _executor():
+    """The process's thread pool (recreated after a fork)"""
+    pid = os.getpid()
+    with _lock:
+        if _state['executor'] is None or _state['pid'] != pid:
+            _state['executor'] = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image')
+            _state['pid'] = pid
+        return _state['executor']
+
+
+def _dispatch(token):
+    if IMAGE_PROCESSING == 'inline':
+        process(token)
+        return
+    with _lock:
+        if token in _inflight:
+            return
+        _inflight.add(token)
+    _executor().submit(_run_in_app, token)
+
+
+def _run_in_app(token):
+    try:
+        with _state['app'].app_context():
+            try:
+                process(token)
+            finally:
+                db.session.remove()
+    finally:
+        with _lock:
+            _inflight.discard(token)
+
+
+def process(token):
+    """
+    Process one staged upload and switch its record over
+
+    Returns:
+        str: 'processed', 'superseded', 'failed', or None if another thread
+        or process has claimed it
+    """
+    directory = staging_dir()
+    manifest_path = os.path.join(directory, token + MANIFEST_SUFFIX)
+    claimed_path = manifest_path + CLAIMED_SUFFIX
+    try:
+        os.rename(manifest_path, claimed_path)
+    except FileNotFoundError:
+        return None
+
+    with open(claimed_path) as f:
+        manifest = json.load(f)
+    staged_path = os.path.join(directory, manifest['staged'])
+    registered = _processors.get(manifest['kind'])
+    record_id = manifest['record_id']
+    start = time.perf_counter()
+
+    try:
+        if registered is None:
+            raise ValueError(f"No processor for {manifest['kind']}")
+        values = registered['func'](staged_path, record_id)
+    except Exception as e:
+        db.session.rollback()
+        print(f"[IMAGES] {manifest['kind']} for record {record_id} failed: {type(e).__name__}: {e}")
+        _remove(staged_path, claimed_path)
+        _count('failed')
+        return 'failed'
+
+    model, column = registered['model'], registered['column']
+    current = getattr(model, column)
+    matches_previous = current.is_(None) if manifest['previous'] is None else current == manifest['previous']
+    latest = getattr(model, registered['token_column']) == token
+    updated = model.query.filter(model.id == record_id, matches_previous, latest)\
+        .update(dict(values, **{registered['token_column']: None}), synchronize_session=False)
+    db.session.commit()
+    _remove(staged_path, claimed_path)
+
+    discard = registered['discard']
+    if not updated:
+        # A later upload was submitted, the image was removed, or the record
+        # is gone
+        if discard:
+            discard(values[column])
+        _count('superseded')
+        print(f"[IMAGES] {manifest['kind']} for record {record_id} was superseded, discarded result")
+        return 'superseded'
+
+    if discard and manifest['previous']:
+        discard(manifest['previous'])
+    if registered['after']:
+        registered['after'](record_id)
+    _count('processed')
+    print(f"[IMAGES] {manifest['kind']} for record {record_id} processed in {time.perf_counter() - start:.2f}s")
+    return 'processed'
+
+
+def _remove(*paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@maintenance.process_task('image_staging', STAGING_SCAN_INTERVAL)
+def resubmit_orphaned():
+    """Resubmit staged uploads nobody is processing (e.g. after a restart)"""
+    directory = staging_dir()
+    if not os.path.isdir(directory):
+        return 0
+    now = time.time()
+    resubmitted = 0
+    for entry in os.scandir(directory):
+        if not entry.name.endswith((MANIFEST_SUFFIX, MANIFEST_SUFFIX + CLAIMED_SUFFIX)):
+            continue
+        try:
+            age = now - entry.stat().st_mtime
+        except FileNotFoundError:
+            continue  # finished while we were scanning
+        if entry.name.endswith(CLAIMED_SUFFIX) and age > STAGING_STALE_SECONDS:
+            # The claiming process died mid-way; make it claimable again
+            try:
+                os.rename(entry.path, entry.path[:-len(CLAIMED_SUFFIX)])
+            except FileNotFoundError:
+                pass
+        elif entry.name.endswith(MANIFEST_SUFFIX) and age > STAGING_RETRY_SECONDS:
+            token = entry.name[:-len(MANIFEST_SUFFIX)]
+            with _lock:
+                if token in _inflight:
+                    continue
+            _dispatch(token)
+            resubmitted += 1
+    if resubmitted:
+        print(f"[IMAGES] Resubmitted {resubmitted} staged uploads")
+    return resubmitted
+
+
+def processing_stats():
+    """Counts of submitted/processed/superseded/failed uploads in this process"""
+    with _lock:
+        return dict(_stats, inflight=len(_inflight))
+
+
+def init_app(app):
+    _state['app'] = app
@@ -0,0 +1,183 @@
+"""
+Responsive variants of doctor profile photos
+
+save_profile_photo stores one JPEG of up to 800x800 px, and the 80-140 px
+avatars on doctor cards, clinic pages and profiles downloaded all of it. Each
+upload now also stores a rendition per VARIANT_WIDTHS x VARIANT_FORMATS next
+to the photo, under keys derived from the photo's own key:
+
+    photos/12/<uuid>.jpg          the photo itself (unchanged; og:image etc.)
+    photos/12/<uuid>_64.jpg
+    photos/12/<uuid>_64.webp
+    ...
+    photos/12/<uuid>_800.webp
+
+Local photos (photos/<uuid>.jpg) get photos/<uuid>_64.jpg and so on. Photos
+are never upscaled: for a 300 px photo the 400 and 800 renditions are 300 px
+wide.
+
+Doctor.photo_variants records that a photo's renditions exist. Templates and
+the /doctors JSON only emit srcset for those doctors. Photos uploaded before
+renditions existed are served as before until the backfill has run:
+
+    flask --app app media backfill-variants [--workers 4] [--force]
+
+AVIF is not produced: the pinned Pillow (10.2) has no AVIF encoder.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+from PIL import Image
+
+import r2_storage
+
+
+VARIANT_WIDTHS = (64, 160, 400, 800)
+VARIANT_FORMATS = ('jpeg', 'webp')
+FORMAT_EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+CONTENT_TYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+SAVE_OPTIONS = {
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+}
+BACKFILL_WORKERS = min(4, os.cpu_count() or 1)
+BACKFILL_COMMIT_EVERY = 50
+
+
+def variant_key(photo_path, width, fmt):
+    """Storage key of one rendition: photos/12/abc.jpg -> photos/12/abc_160.webp"""
+    root = os.path.splitext(photo_path)[0]
+    return f"{root}_{width}.{FORMAT_EXTENSIONS[fmt]}"
+
+
+def variant_keys(photo_path):
+    return [variant_key(photo_path, width, fmt) for width in VARIANT_WIDTHS for fmt in VARIANT_FORMATS]
+
+
+def is_r2_path(photo_path):
+    """R2 photos are photos/{doctor_id}/{filename}; local ones photos/{filename}"""
+    return photo_path.count('/') > 1
+
+
+def render_variants(img):
+    """
+    Encode every rendition of an RGB image
+
+    Widths are produced largest first, each resized from the previous one, so
+    the small renditions don't resample the full photo again.
+
+    Returns:
+        dict: {(width, fmt): bytes}
+    """
+    renditions = {}
+    current = img
+    for width in sorted(VARIANT_WIDTHS, reverse=True):
+        if current.width > width:
+            height = max(1, round(current.height * width / current.width))
+            current = current.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt in VARIANT_FORMATS:
+            buffer = BytesIO()
+            current.save(buffer, **SAVE_OPTIONS[fmt])
+            renditions[(width, fmt)] = buffer.getvalue()
+    return renditions
+
+
+def store_variants(renditions, photo_path, upload_folder):
+    """
+    Write renditions next to a stored photo (R2 or local, like the photo)
+
+    Raises:
+        ValueError: if a rendition could not be stored
+    """
+    for (width, fmt), data in renditions.items():
+        key = variant_key(photo_path, width, fmt)
+        if is_r2_path(photo_path):
+            _, doctor_id, filename = key.split('/', 2)
+            if not r2_storage.save_profile_photo(BytesIO(data), doctor_id, filename, CONTENT_TYPES[fmt]):
+                raise ValueError(f"Could not upload photo variant {key}")
+        else:
+            with open(os.path.join(upload_folder, key), 'wb') as f:
+                f.write(data)
+
+
+def delete_variants(photo_path, upload_folder):
+    """Remove a photo's renditions (missing ones are ignored)"""
+    for key in variant_keys(photo_path):
+        if is_r2_path(photo_path):
+            r2_storage.delete_profile_photo(key)
+            continue
+        try:
+            os.remove(os.path.join(upload_folder, key))
+        except FileNotFoundError:
+            pass
+
+
+def load_photo(photo_path, upload_folder):
+    """Bytes of a stored photo or rendition (R2 or local, like the photo)"""
+    if is_r2_path(photo_path):
+        data = r2_storage.get_profile_photo(photo_path)
+        if not data:
+            raise ValueError(f"{photo_path} not found in R2")
+        return data
+    with open(os.path.join(upload_folder, 'photos', photo_path.split('/')[-1]), 'rb') as f:
+        return f.read()
+
+
+def generate_for_photo(photo_path, upload_folder):
+    """Load a stored photo and store its renditions (a backfill worker's unit of work)"""
+    img = Image.open(BytesIO(load_photo(photo_path, upload_folder)))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    store_variants(render_variants(img), photo_path, upload_folder)
+    return photo_path
+
+
+def backfill(upload_folder, workers=BACKFILL_WORKERS, force=False, limit=None):
+    """
+    Generate renditions for stored photos that don't have them yet
+
+    Decoding and encoding are CPU-bound, so photos are spread over a process
+    pool. Workers only touch storage; this process marks doctors as done in
+    batches of BACKFILL_COMMIT_EVERY.
+
+    Returns:
+        (done, failed) counts
+    """
+    from models import db, Doctor
+
+    query = db.session.query(Doctor.id, Doctor.photo_url)\
+        .filter(Doctor.photo_url.isnot(None), Doctor.photo_url != '')
+    if not force:
+        query = query.filter(Doctor.photo_variants.isnot(True))
+    photos = query.order_by(Doctor.id).limit(limit).all()
+    db.session.commit()  # don't hold a transaction open while the pool works
+    if not photos:
+        return 0, 0
+
+    done, failed, pending = 0, 0, []
+
+    def mark_done():
+        Doctor.query.filter(Doctor.id.in_(pending)).update({'photo_variants': True}, synchronize_session=False)
+        db.session.commit()
+        pending.clear()
+
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(generate_for_photo, photo_url, upload_folder): doctor_id
+                   for doctor_id, photo_url in photos}
+        for future in as_completed(futures):
+            doctor_id = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[VARIANTS] Doctor {doctor_id}: {type(e).__name__}: {e}")
+                continue
+            done += 1
+            pending.append(doctor_id)
+            if len(pending) >= BACKFILL_COMMIT_EVERY:
+                mark_done()
+                print(f"[VARIANTS] {done + failed}/{len(photos)} photos processed")
+    if pending:
+        mark_done()
+    return done, failed
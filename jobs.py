@@ -0,0 +1,374 @@
+"""
+Database-backed background job queue
+
+Side effects that don't need to finish before the response (sending email,
+scoring and indexing a new review, awarding points and badges) are stored as
+rows in the jobs table (migration 018) and run by a separate worker process:
+
+    flask --app app jobs worker            # run until SIGTERM
+    flask --app app jobs worker --once     # drain what's due, then exit
+    flask --app app jobs status
+    flask --app app jobs prune --days 7
+
+Tasks are plain functions registered with @jobs.task('name') and called with
+the job's JSON payload as keyword arguments inside an app context. The worker
+commits the task's session changes together with the job's 'done' status.
+
+- claiming: on PostgreSQL due rows are locked with SELECT ... FOR UPDATE SKIP
+  LOCKED so several workers never pick the same job. SQLite (local
+  development) has no row locks; each candidate is claimed with a conditional
+  UPDATE ... WHERE status = 'pending' instead, which SQLite serializes.
+- retries: a failing job goes back to 'pending' with exponential backoff
+  (30s, 60s, 120s ... capped at an hour, plus jitter) until max_attempts,
+  then stays 'failed' with the last error for an admin to look at.
+- idempotency: enqueue() with an idempotency_key stores the job once; a
+  second enqueue with the same key returns the existing row.
+- crashed workers: 'running' rows locked longer than JOB_LOCK_TIMEOUT_SECONDS
+  are put back in the queue.
+- periodic tasks: @jobs.periodic_task('name', seconds) tasks are enqueued by
+  the worker once per time bucket, keyed 'name:<bucket>', so restarts and
+  several workers never run the same bucket twice.
+
+Set JOBS_MODE=inline to run each job immediately inside enqueue() instead
+(no worker needed, e.g. a quick local setup).
+"""
+import json
+import os
+import random
+import signal
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Job
+
+
+JOBS_MODE = os.getenv('JOBS_MODE', 'queue')  # 'queue' or 'inline'
+DEFAULT_MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+JOB_LOCK_TIMEOUT_SECONDS = int(os.getenv('JOB_LOCK_TIMEOUT_SECONDS', '900'))
+WORKER_BATCH_SIZE = 10
+WORKER_IDLE_SLEEP = 2.0  # seconds between polls when the queue is empty
+PRUNE_AFTER_DAYS = 7
+MAX_ERROR_LENGTH = 4000
+
+# name -> {'func': callable, 'max_attempts': int}
+_tasks = {}
+# name -> seconds between runs
+_periodic = {}
+_last_bucket = {}
+
+
+def task(name, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Register a function as a job task under name"""
+    def decorator(func):
+        _tasks[name] = {'func': func, 'max_attempts': max_attempts}
+        return func
+    return decorator
+
+
+def periodic_task(name, every_seconds, max_attempts=1):
+    """Register a task that the worker enqueues every `every_seconds` (takes no arguments)"""
+    def decorator(func):
+        task(name, max_attempts=max_attempts)(func)
+        _periodic[name] = every_seconds
+        return func
+    return decorator
+
+
+def enqueue_periodic():
+    """Enqueue each periodic task for the current time bucket (idempotent)"""
+    now = time.time()
+    queued = 0
+    for name, every_seconds in _periodic.items():
+        bucket = int(now // every_seconds)
+        if _last_bucket.get(name) == bucket:
+            continue
+        run_at = datetime.utcfromtimestamp(bucket * every_seconds)
+        enqueue(name, idempotency_key=f'{name}:{bucket}', run_at=run_at)
+        _last_bucket[name] = bucket
+        queued += 1
+    return queued
+
+
+def enqueue(name, payload=None, idempotency_key=None, run_at=None, delay_seconds=None, db_commit=True):
+    """
+    Queue a job for the worker
+
+    Args:
+        name: registered task name
+        payload: dict of JSON-serializable keyword arguments for the task
+        idempotency_key: if set, a job with the same key is only stored once
+        run_at / delay_seconds: earliest time to run (default: now)
+        db_commit: commit the session (set False to commit with the caller's changes)
+
+    Returns:
+        Job: the new job, or the existing one with the same idempotency_key
+    """
+    if name not in _tasks:
+        raise ValueError(f"Unknown job task: {name}")
+
+    if idempotency_key:
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing
+
+    if run_at is None:
+        run_at = datetime.utcnow()
+    if delay_seconds:
+        run_at += timedelta(seconds=delay_seconds)
+
+    job = Job(
+        name=name,
+        payload=json.dumps(payload or {}),
+        status='pending',
+        attempts=0,
+        max_attempts=_tasks[name]['max_attempts'],
+        idempotency_key=idempotency_key,
+        run_at=run_at,
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(job)
+    except IntegrityError:
+        # Enqueued concurrently by another request
+        return Job.query.filter_by(idempotency_key=idempotency_key).first()
+
+    if db_commit:
+        db.session.commit()
+        if JOBS_MODE == 'inline':
+            _run_inline(job)
+    return job
+
+
+def _run_inline(job):
+    job.status = 'running'
+    job.attempts += 1
+    job.locked_at = datetime.utcnow()
+    job.locked_by = 'inline'
+    db.session.commit()
+    execute_job(job.id)
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next try after `attempts` failed tries"""
+    delay = min(RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0)), RETRY_MAX_SECONDS)
+    return delay + random.uniform(0, delay * 0.1)
+
+
+def release_stale_jobs():
+    """Put 'running' jobs whose worker died back in the queue"""
+    cutoff = datetime.utcnow() - timedelta(seconds=JOB_LOCK_TIMEOUT_SECONDS)
+    result = db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.locked_at < cutoff)
+        .values(status='pending', locked_at=None, locked_by=None, last_error='Worker lock expired')
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount or 0
+
+
+def claim_rows(model, limit, due_column, **values):
+    """
+    Move up to `limit` due 'pending' rows of a queue table to a claimed state
+
+    Used for jobs and mailer's outbox; both tables have id, status and a due
+    time column. `values` are written to the claimed rows.
+
+    Returns:
+        list of claimed ids
+    """
+    due = db.session.query(model.id)\
+        .filter(model.status == 'pending', due_column <= datetime.utcnow())\
+        .order_by(due_column, model.id)\
+        .limit(limit)
+
+    if db.engine.dialect.name == 'postgresql':
+        ids = [row.id for row in due.with_for_update(skip_locked=True).all()]
+        if ids:
+            db.session.execute(
+                update(model).where(model.id.in_(ids)).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+    else:
+        ids = []
+        for row in due.all():
+            result = db.session.execute(
+                update(model).where(model.id == row.id, model.status == 'pending').values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                ids.append(row.id)
+    db.session.commit()
+    return ids
+
+
+def claim_jobs(limit=WORKER_BATCH_SIZE, worker=None):
+    """
+    Lock up to `limit` due jobs for this worker
+
+    Returns:
+        list of claimed job ids (status 'running', attempts incremented)
+    """
+    return claim_rows(
+        Job, limit, Job.run_at,
+        status='running', locked_at=datetime.utcnow(), locked_by=worker or worker_id(), attempts=Job.attempts + 1
+    )
+
+
+def execute_job(job_id):
+    """
+    Run one claimed job and record the outcome
+
+    Returns:
+        str: the job's new status ('done', 'pending' for a retry, or 'failed')
+    """
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return None
+
+    registered = _tasks.get(job.name)
+    if registered is None:
+        job.status = 'failed'
+        job.last_error = f"Unknown job task: {job.name}"
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        print(f"[JOBS] Job {job.id} failed: unknown task {job.name}")
+        return job.status
+
+    try:
+        registered['func'](**json.loads(job.payload or '{}'))
+        job.status = 'done'
+        job.finished_at = datetime.utcnow()
+        job.locked_at = None
+        job.last_error = None
+        db.session.commit()
+        return job.status
+    except Exception as e:
+        db.session.rollback()
+        error = traceback.format_exc()[-MAX_ERROR_LENGTH:]
+        message = str(e)
+
+    job = db.session.get(Job, job_id)
+    job.last_error = error
+    job.locked_at = None
+    job.locked_by = None
+    if job.attempts >= job.max_attempts:
+        job.status = 'failed'
+        job.finished_at = datetime.utcnow()
+        print(f"[JOBS] Job {job.id} ({job.name}) failed after {job.attempts} attempts: {message}")
+    else:
+        delay = retry_delay(job.attempts)
+        job.status = 'pending'
+        job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+        print(f"[JOBS] Job {job.id} ({job.name}) attempt {job.attempts} failed, retrying in {delay:.0f}s: {message}")
+    db.session.commit()
+    return job.status
+
+
+def run_worker(once=False, batch_size=WORKER_BATCH_SIZE, sleep=WORKER_IDLE_SLEEP):
+    """
+    Claim and run due jobs until stopped (or until the queue is empty with once=True)
+
+    Returns:
+        dict: counts of jobs per outcome
+    """
+    worker = worker_id()
+    stats = {'done': 0, 'pending': 0, 'failed': 0}
+    stopping = {'flag': False}
+
+    def stop(signum, frame):
+        stopping['flag'] = True
+
+    previous = signal.signal(signal.SIGTERM, stop)
+    print(f"[JOBS] Worker {worker} started")
+    try:
+        release_stale_jobs()
+        while not stopping['flag']:
+            enqueue_periodic()
+            ids = claim_jobs(batch_size, worker)
+            for job_id in ids:
+                status = execute_job(job_id)
+                if status in stats:
+                    stats[status] += 1
+            db.session.remove()
+
+            if not ids:
+                if once:
+                    break
+                time.sleep(sleep)
+                release_stale_jobs()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    print(f"[JOBS] Worker {worker} stopped: {stats['done']} done, {stats['pending']} retrying, {stats['failed']} failed")
+    return stats
+
+
+def queue_stats():
+    """Job counts by status, plus the oldest due pending job's age in seconds"""
+    counts = dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+    oldest = db.session.query(func.min(Job.run_at))\
+        .filter(Job.status == 'pending', Job.run_at <= datetime.utcnow()).scalar()
+    return {
+        'pending': counts.get('pending', 0),
+        'running': counts.get('running', 0),
+        'done': counts.get('done', 0),
+        'failed': counts.get('failed', 0),
+        'oldest_due_seconds': int((datetime.utcnow() - oldest).total_seconds()) if oldest else 0,
+    }
+
+
+def prune_jobs(days=PRUNE_AFTER_DAYS):
+    """Delete finished ('done') jobs older than `days`; failed jobs are kept"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = Job.query.filter(Job.status == 'done', Job.finished_at < cutoff)\
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+jobs_cli = AppGroup('jobs', help='Background job queue')
+
+
+@jobs_cli.command('worker')
+@click.option('--once', is_flag=True, help='Exit when no jobs are due')
+@click.option('--batch-size', default=WORKER_BATCH_SIZE, show_default=True)
+@click.option('--sleep', default=WORKER_IDLE_SLEEP, show_default=True, help='Seconds between polls when idle')
+def worker_command(once, batch_size, sleep):
+    """Run queued jobs"""
+    run_worker(once=once, batch_size=batch_size, sleep=sleep)
+
+
+@jobs_cli.command('status')
+def status_command():
+    """Show queue counts and recent failures"""
+    stats = queue_stats()
+    print(f"pending {stats['pending']}  running {stats['running']}  done {stats['done']}  failed {stats['failed']}")
+    if stats['oldest_due_seconds']:
+        print(f"Oldest due job has waited {stats['oldest_due_seconds']}s")
+    for job in Job.query.filter_by(status='failed').order_by(Job.id.desc()).limit(10):
+        last_line = (job.last_error or '').strip().splitlines()[-1:] or ['']
+        print(f"  #{job.id} {job.name} ({job.attempts} attempts): {last_line[0]}")
+
+
+@jobs_cli.command('prune')
+@click.option('--days', default=PRUNE_AFTER_DAYS, show_default=True)
+def prune_command(days):
+    """Delete finished jobs older than --days"""
+    print(f"Deleted {prune_jobs(days)} finished jobs")
+
+
+def init_app(app):
+    app.cli.add_command(jobs_cli)
@@ -0,0 +1,393 @@
+"""
+Outgoing email: persistent outbox, batched Resend delivery, cached templates
+
+Request handlers never talk to Resend. They add rows to email_outbox
+(migration 019) with queue_message() / queue_messages(), and a 'send_outbox'
+job drains the outbox from the job worker:
+
+- rows are claimed like jobs (FOR UPDATE SKIP LOCKED on PostgreSQL) and sent
+  BATCH_SIZE at a time through Resend's batch endpoint (max 100 per call) in
+  permissive mode, so one invalid address fails only its own row
+- API calls go through a token bucket (MAIL_REQUESTS_PER_SECOND, Resend's
+  default team limit is 2/s); the bucket is per process, so with several
+  workers set the rate per worker accordingly
+- a failed batch is retried with the job queue's backoff up to
+  MAX_SEND_ATTEMPTS, then left 'failed'
+- a periodic sweep (maintenance.send_outbox, every OUTBOX_SWEEP_SECONDS)
+  picks up rows whose backoff has passed and rows left 'sending' by a worker
+  that died, which no dispatch job would otherwise come back for
+- enqueues within the same DISPATCH_WINDOW_SECONDS share one dispatch job,
+  which runs when the window closes
+
+Templates live in email_templates/ and are rendered with a module-level Jinja
+environment (autoescaped, compiled on first use and kept, no reload checks).
+
+Without RESEND_API_KEY (or with MAIL_TRANSPORT=fake) a FakeTransport records
+messages in memory instead of sending; tests can install their own with
+set_transport().
+
+    flask --app app mail send      # drain the outbox now
+    flask --app app mail status
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+import resend
+from flask.cli import AppGroup
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+
+import jobs
+import maintenance
+from models import db, OutboxEmail
+
+
+BATCH_SIZE = 100  # Resend batch API limit
+MAIL_REQUESTS_PER_SECOND = float(os.getenv('MAIL_REQUESTS_PER_SECOND', '2'))
+MAIL_BURST = int(os.getenv('MAIL_BURST', '2'))
+MAX_SEND_ATTEMPTS = 5
+SENDING_TIMEOUT_SECONDS = 900  # 'sending' rows older than this are retried
+DISPATCH_WINDOW_SECONDS = 10
+OUTBOX_SWEEP_SECONDS = 60
+DEFAULT_FROM = "RankSewa <support@ranksewa.com>"
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'email_templates')
+
+_templates = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False,
+)
+
+
+def render(template_name, **context):
+    """Render an email_templates/ template (compiled once per process)"""
+    return _templates.get_template(template_name).render(**context)
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, bursting up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available; returns seconds waited"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class ResendTransport:
+    """Sends through Resend's batch endpoint"""
+    name = 'resend'
+
+    def send_batch(self, messages, idempotency_key=None):
+        """
+        Returns:
+            list of (provider_id, error) aligned with messages
+        """
+        options = {'batch_validation': 'permissive'}
+        if idempotency_key:
+            options['idempotency_key'] = idempotency_key
+        response = resend.Batch.send(messages, options)
+        errors = {error['index']: error['message'] for error in response.get('errors') or []}
+        sent = iter(response.get('data') or [])
+        results = []
+        for index in range(len(messages)):
+            if index in errors:
+                results.append((None, errors[index]))
+            else:
+                item = next(sent, None)
+                results.append(((item or {}).get('id'), None))
+        return results
+
+
+class FakeTransport:
+    """Records messages instead of sending them (local development and tests)"""
+    name = 'fake'
+
+    def __init__(self, verbose=True):
+        self.sent = []
+        self.batches = 0
+        self.verbose = verbose
+
+    def send_batch(self, messages, idempotency_key=None):
+        self.batches += 1
+        results = []
+        for message in messages:
+            self.sent.append(message)
+            results.append((f"fake-{len(self.sent)}", None))
+            if self.verbose:
+                print(f"[DEV] Would send email to {', '.join(message['to'])}: {message['subject']}")
+        return results
+
+
+_transport = {'current': None}
+_bucket = TokenBucket(MAIL_REQUESTS_PER_SECOND, MAIL_BURST)
+
+
+def get_transport():
+    if _transport['current'] is None:
+        use_fake = os.getenv('MAIL_TRANSPORT') == 'fake' or not os.getenv('RESEND_API_KEY')
+        _transport['current'] = FakeTransport() if use_fake else ResendTransport()
+    return _transport['current']
+
+
+def set_transport(transport):
+    """Replace the transport (None goes back to the environment default); returns the previous one"""
+    previous = _transport['current']
+    _transport['current'] = transport
+    return previous
+
+
+def _row_values(params, category, dedupe_key=None, send_after=None):
+    to = params['to']
+    return {
+        'category': category,
+        'from_email': params.get('from') or DEFAULT_FROM,
+        'recipients': json.dumps([to] if isinstance(to, str) else list(to)),
+        'subject': params['subject'],
+        'html': params['html'],
+        'reply_to': params.get('reply_to'),
+        'dedupe_key': dedupe_key,
+        'status': 'pending',
+        'attempts': 0,
+        'send_after': send_after or datetime.utcnow(),
+        'created_at': datetime.utcnow(),
+    }
+
+
+def schedule_dispatch(db_commit=True):
+    """Queue the dispatch job for the current window (one per window)"""
+    if jobs.JOBS_MODE == 'inline':
+        jobs.enqueue('send_outbox', db_commit=db_commit)
+        return
+    window_end = (int(time.time()) // DISPATCH_WINDOW_SECONDS + 1) * DISPATCH_WINDOW_SECONDS
+    jobs.enqueue(
+        'send_outbox',
+        idempotency_key=f'send_outbox:{window_end}',
+        run_at=datetime.utcfromtimestamp(window_end),
+        db_commit=db_commit
+    )
+
+
+def queue_message(params, category=None, dedupe_key=None, send_after=None, dispatch=True, db_commit=True):
+    """
+    Add one email to the outbox
+
+    Args:
+        params: Resend-style dict with from, to, subject, html and optional reply_to
+        category: short label for throttling and stats ('verification', 'announcement', ...)
+        dedupe_key: if set, an email with the same key is only queued once
+        dispatch: queue the dispatch job (bulk callers call schedule_dispatch() once instead)
+        db_commit: commit the session (set False to commit with the caller's changes)
+
+    Returns:
+        OutboxEmail: the new row, or the existing one with the same dedupe_key
+    """
+    if dedupe_key:
+        existing = OutboxEmail.query.filter_by(dedupe_key=dedupe_key).first()
+        if existing:
+            return existing
+
+    email = OutboxEmail(**_row_values(params, category, dedupe_key, send_after))
+    try:
+        with db.session.begin_nested():
+            db.session.add(email)
+    except IntegrityError:
+        return OutboxEmail.query.filter_by(dedupe_key=dedupe_key).first()
+
+    if dispatch:
+        schedule_dispatch(db_commit=db_commit)
+    elif db_commit:
+        db.session.commit()
+    return email
+
+
+def queue_messages(messages, category=None, dedupe_keys=None, db_commit=True):
+    """
+    Add many emails to the outbox with one multi-row INSERT (e.g. announcements)
+
+    dedupe_keys (one per message) are stored as-is; a key that already exists
+    raises IntegrityError, so callers must only pass keys they own.
+
+    Returns:
+        int: number of emails queued
+    """
+    if not messages:
+        return 0
+    keys = dedupe_keys or [None] * len(messages)
+    db.session.execute(
+        OutboxEmail.__table__.insert(),
+        [_row_values(params, category, key) for params, key in zip(messages, keys)]
+    )
+    schedule_dispatch(db_commit=db_commit)
+    return len(messages)
+
+
+def recent_count(category, seconds):
+    """Emails of a category queued in the last `seconds`"""
+    since = datetime.utcnow() - timedelta(seconds=seconds)
+    return db.session.query(func.count(OutboxEmail.id))\
+        .filter(OutboxEmail.category == category, OutboxEmail.created_at >= since).scalar() or 0
+
+
+def _as_params(email):
+    params = {
+        'from': email.from_email,
+        'to': json.loads(email.recipients),
+        'subject': email.subject,
+        'html': email.html,
+    }
+    if email.reply_to:
+        params['reply_to'] = email.reply_to
+    return params
+
+
+def release_stale_sending():
+    """Put rows stuck in 'sending' (worker died mid-batch) back in the outbox"""
+    cutoff = datetime.utcnow() - timedelta(seconds=SENDING_TIMEOUT_SECONDS)
+    result = db.session.execute(
+        update(OutboxEmail)
+        .where(OutboxEmail.status == 'sending', OutboxEmail.locked_at < cutoff)
+        .values(status='pending', locked_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount or 0
+
+
+def _fail_batch(emails, error):
+    """Retry a batch that could not be sent at all, with the job queue's backoff"""
+    now = datetime.utcnow()
+    for email in emails:
+        email.last_error = error
+        email.locked_at = None
+        if email.attempts >= MAX_SEND_ATTEMPTS:
+            email.status = 'failed'
+        else:
+            email.status = 'pending'
+            email.send_after = now + timedelta(seconds=jobs.retry_delay(email.attempts))
+    db.session.commit()
+
+
+def dispatch_outbox(max_batches=None, transport=None, bucket=None):
+    """
+    Send due outbox emails in batches
+
+    Stops when the outbox is empty, after max_batches, or after a batch that
+    failed as a whole (the provider is down or rejecting us; backoff applies).
+
+    Returns:
+        dict: {'sent', 'failed', 'retrying', 'batches', 'throttled_seconds'}
+    """
+    transport = transport or get_transport()
+    bucket = bucket or _bucket
+    stats = {'sent': 0, 'failed': 0, 'retrying': 0, 'batches': 0, 'throttled_seconds': 0.0}
+
+    release_stale_sending()
+    while max_batches is None or stats['batches'] < max_batches:
+        ids = jobs.claim_rows(
+            OutboxEmail, BATCH_SIZE, OutboxEmail.send_after,
+            status='sending', locked_at=datetime.utcnow(), attempts=OutboxEmail.attempts + 1
+        )
+        if not ids:
+            break
+        emails = OutboxEmail.query.filter(OutboxEmail.id.in_(ids)).order_by(OutboxEmail.id).all()
+        stats['batches'] += 1
+        stats['throttled_seconds'] += bucket.acquire()
+
+        # The key depends only on which rows are in the batch (not on attempts,
+        # which every claim increments), so when a timed-out or abandoned batch
+        # is claimed again as the same rows, Resend recognises the repeat and
+        # doesn't send it twice
+        key_source = ','.join(str(email.id) for email in emails)
+        idempotency_key = 'outbox-' + hashlib.sha256(key_source.encode()).hexdigest()[:32]
+        try:
+            results = transport.send_batch([_as_params(email) for email in emails], idempotency_key)
+        except Exception as e:
+            print(f"[MAILER] Batch of {len(emails)} failed: {e}")
+            _fail_batch(emails, str(e))
+            stats['retrying'] += sum(1 for email in emails if email.status == 'pending')
+            stats['failed'] += sum(1 for email in emails if email.status == 'failed')
+            break
+
+        now = datetime.utcnow()
+        for email, (provider_id, error) in zip(emails, results):
+            email.locked_at = None
+            if error:
+                # Rejected by validation (bad address etc.): retrying won't help
+                email.status = 'failed'
+                email.last_error = error
+                stats['failed'] += 1
+            else:
+                email.status = 'sent'
+                email.provider_id = provider_id
+                email.sent_at = now
+                email.last_error = None
+                stats['sent'] += 1
+        db.session.commit()
+
+    if stats['batches']:
+        print(f"[MAILER] {stats['sent']} sent, {stats['failed']} failed, {stats['retrying']} retrying "
+              f"in {stats['batches']} batches ({stats['throttled_seconds']:.1f}s throttled)")
+    return stats
+
+
+@jobs.task('send_outbox')
+def send_outbox_job():
+    dispatch_outbox()
+
+
+@maintenance.database_task('send_outbox', OUTBOX_SWEEP_SECONDS)
+def sweep_outbox():
+    """Send retries that came due and release stale 'sending' rows"""
+    dispatch_outbox()
+
+
+def outbox_stats():
+    counts = dict(db.session.query(OutboxEmail.status, func.count(OutboxEmail.id)).group_by(OutboxEmail.status).all())
+    return {status: counts.get(status, 0) for status in ('pending', 'sending', 'sent', 'failed')}
+
+
+mail_cli = AppGroup('mail', help='Outgoing email outbox')
+
+
+@mail_cli.command('send')
+@click.option('--max-batches', type=int, default=None)
+def send_command(max_batches):
+    """Send due outbox emails now"""
+    stats = dispatch_outbox(max_batches=max_batches)
+    print(f"{stats['sent']} sent, {stats['failed']} failed, {stats['retrying']} retrying")
+
+
+@mail_cli.command('status')
+def status_command():
+    """Show outbox counts and recent failures"""
+    stats = outbox_stats()
+    print('  '.join(f"{status} {count}" for status, count in stats.items()))
+    for email in OutboxEmail.query.filter_by(status='failed').order_by(OutboxEmail.id.desc()).limit(10):
+        print(f"  #{email.id} {email.subject[:50]} -> {', '.join(json.loads(email.recipients))}: {email.last_error}")
+
+
+def init_app(app):
+    app.cli.add_command(mail_cli)
@@ -0,0 +1,216 @@
+"""
+Periodic maintenance
+
+Housekeeping used to run inside user requests: get_doctors() and
+doctor_profile() expired subscriptions (gated by a per-process timestamp),
+anti_scrape cleaned its request history from track_request(), /sitemap.xml
+loaded every doctor and article, the leaderboard was rebuilt by whichever
+request found it stale, and caches were refilled by the first request after
+they expired. All of it is now scheduled here, in two kinds of task:
+
+- database tasks (@maintenance.database_task) change shared state, so one run
+  per interval is enough for the whole deployment. Each is a jobs periodic
+  task named 'maintenance.<name>'. The job worker enqueues it once per time
+  bucket with idempotency key 'maintenance.<name>:<bucket>', and that unique
+  key does the work of a leader lock: however many workers run, one job row
+  exists per bucket and one worker claims it.
+- process tasks (@maintenance.process_task) look after one process's memory
+  (pending view counts, anti-scrape history, in-memory caches), so every web
+  process runs its own on a daemon thread. The thread starts on the first
+  request after gunicorn forks.
+
+With JOBS_MODE=inline there is no worker, so the web processes' maintenance
+threads enqueue the periodic jobs instead (they run inline; the idempotency
+key still allows one run per bucket).
+
+    flask --app app maintenance list
+    flask --app app maintenance run                     # every database task now
+    flask --app app maintenance run expire_subscriptions
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func
+
+import anti_scrape
+import gamification
+import jobs
+import sitemap
+import view_counter
+from models import db, Job, OutboxEmail
+
+
+SITEMAP_REFRESH_SECONDS = int(os.getenv('SITEMAP_REFRESH_SECONDS', '3600'))
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', '30'))
+PRUNE_INTERVAL_SECONDS = 86400
+PRUNE_BATCH_SIZE = 5000
+INLINE_PERIODIC_SECONDS = 30  # how often web processes enqueue periodic jobs with JOBS_MODE=inline
+MAX_THREAD_SLEEP = 5.0
+
+# name -> {'func': callable, 'every': seconds}
+_database_tasks = {}
+_process_tasks = {}
+_state = {'app': None, 'thread_pid': None}
+_lock = threading.Lock()
+
+
+def database_task(name, every_seconds):
+    """Register a task that runs once per `every_seconds` across all processes (via the job worker)"""
+    def decorator(func):
+        _database_tasks[name] = {'func': func, 'every': every_seconds}
+        jobs.periodic_task(f'maintenance.{name}', every_seconds)(func)
+        return func
+    return decorator
+
+
+def process_task(name, every_seconds):
+    """Register a task that every web process runs every `every_seconds` on its maintenance thread"""
+    def decorator(func):
+        _process_tasks[name] = {'func': func, 'every': every_seconds}
+        return func
+    return decorator
+
+
+# --- Process tasks ---
+
+process_task('flush_views', view_counter.VIEW_FLUSH_INTERVAL)(view_counter.flush_views)
+process_task('anti_scrape_history', anti_scrape.HISTORY_CLEANUP_INTERVAL)(anti_scrape.cleanup_request_history)
+
+
+@process_task('inline_periodic_jobs', INLINE_PERIODIC_SECONDS)
+def inline_periodic_jobs():
+    if jobs.JOBS_MODE == 'inline':
+        jobs.enqueue_periodic()
+
+
+def _run_process_task(name, task):
+    try:
+        task['func']()
+    except Exception as e:
+        db.session.rollback()
+        print(f"[MAINTENANCE] {name} failed: {e}")
+    finally:
+        db.session.remove()
+
+
+def _maintenance_loop():
+    app = _state['app']
+    next_run = {name: time.monotonic() for name in _process_tasks}
+    while True:
+        now = time.monotonic()
+        for name, task in _process_tasks.items():
+            if now >= next_run[name]:
+                next_run[name] = now + task['every']
+                with app.app_context():
+                    _run_process_task(name, task)
+        time.sleep(min(MAX_THREAD_SLEEP, max(0.1, min(next_run.values()) - time.monotonic())))
+
+
+def _ensure_thread():
+    """Start the maintenance thread once per process (after gunicorn forks workers)"""
+    pid = os.getpid()
+    if _state['thread_pid'] == pid or _state['app'] is None:
+        return
+    with _lock:
+        if _state['thread_pid'] == pid:
+            return
+        _state['thread_pid'] = pid
+    threading.Thread(target=_maintenance_loop, name='maintenance', daemon=True).start()
+
+
+# --- Database tasks ---
+
+@database_task('rebuild_leaderboard', gamification.LEADERBOARD_REFRESH_SECONDS)
+def rebuild_leaderboard():
+    gamification.rebuild_leaderboard_snapshot()
+
+
+@database_task('regenerate_sitemap', SITEMAP_REFRESH_SECONDS)
+def regenerate_sitemap():
+    sitemap.store_sitemap(current_app, db)
+
+
+def _delete_in_batches(model, created_column, cutoff, *criteria):
+    """
+    Delete rows created before cutoff in primary key ranges of PRUNE_BATCH_SIZE
+
+    Rows are inserted in created order, so everything older than cutoff has an
+    id at or below the newest old row's id. Deleting by id range keeps each
+    statement (and its locks) small and uses the primary key index.
+    """
+    filters = (created_column < cutoff, *criteria)
+    first_id, last_id = db.session.query(func.min(model.id), func.max(model.id)).filter(*filters).one()
+    if first_id is None:
+        return 0
+
+    deleted = 0
+    for start in range(first_id, last_id + 1, PRUNE_BATCH_SIZE):
+        end = min(start + PRUNE_BATCH_SIZE - 1, last_id)
+        deleted += model.query.filter(model.id.between(start, end), *filters)\
+            .delete(synchronize_session=False)
+        db.session.commit()
+    return deleted
+
+
+@database_task('prune_outbox', PRUNE_INTERVAL_SECONDS)
+def prune_outbox(days=OUTBOX_RETENTION_DAYS):
+    """Delete sent emails older than OUTBOX_RETENTION_DAYS; failed ones are kept"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = _delete_in_batches(OutboxEmail, OutboxEmail.created_at, cutoff, OutboxEmail.status == 'sent')
+    if deleted:
+        print(f"[MAINTENANCE] Pruned {deleted} sent emails older than {days} days")
+    return deleted
+
+
+@database_task('prune_jobs', PRUNE_INTERVAL_SECONDS)
+def prune_jobs():
+    deleted = jobs.prune_jobs()
+    if deleted:
+        print(f"[MAINTENANCE] Pruned {deleted} finished jobs")
+    return deleted
+
+
+# --- CLI ---
+
+maintenance_cli = AppGroup('maintenance', help='Periodic maintenance tasks')
+
+
+@maintenance_cli.command('list')
+def list_command():
+    """Registered tasks and their intervals"""
+    last_runs = dict(
+        db.session.query(Job.name, func.max(Job.finished_at))
+        .filter(Job.name.like('maintenance.%'), Job.status == 'done')
+        .group_by(Job.name).all()
+    )
+    for name, task in sorted(_database_tasks.items()):
+        last_run = last_runs.get(f'maintenance.{name}')
+        print(f"database  {name:<24} every {task['every']:>6}s  last run {last_run or '-'}")
+    for name, task in sorted(_process_tasks.items()):
+        print(f"process   {name:<24} every {task['every']:>6}s")
+
+
+@maintenance_cli.command('run')
+@click.argument('names', nargs=-1)
+def run_command(names):
+    """Run database tasks now (all of them if no NAMES are given)"""
+    unknown = [name for name in names if name not in _database_tasks]
+    if unknown:
+        raise click.BadParameter(f"Unknown task(s): {', '.join(unknown)}. "
+                                 f"Choose from: {', '.join(sorted(_database_tasks))}")
+    for name in names or sorted(_database_tasks):
+        start = time.perf_counter()
+        result = _database_tasks[name]['func']()
+        print(f"{name}: {result if result is not None else 'ok'} ({time.perf_counter() - start:.2f}s)")
+
+
+def init_app(app):
+    """Start the per-process maintenance thread with the first request and add the CLI"""
+    _state['app'] = app
+    app.before_request(_ensure_thread)
+    app.cli.add_command(maintenance_cli)
@@ -0,0 +1,199 @@
+"""
+Local disk cache for proxied R2 photos and clinic logos
+
+When media_delivery has to proxy an object (MEDIA_DELIVERY=proxy, or no URL
+could be produced), the bytes used to be fetched from R2 on every request
+that missed the browser cache. They are now kept under
+instance/media_cache/, keyed by R2 object key:
+
+- files are named by the key's SHA-1 (two-level fan-out), written to a
+  temporary file in the same directory and renamed into place, so a reader
+  never sees a partial file
+- size-bounded LRU: a hit bumps the file's mtime. When the cache grows past
+  MEDIA_CACHE_MAX_MB, the least recently used files are removed down to
+  EVICT_TO_RATIO of the limit. The mtimes live on disk, so every worker
+  process shares one LRU order.
+- hits are served with send_from_directory, which hands the open file to
+  the WSGI server's file_wrapper (sendfile under gunicorn)
+- r2_storage invalidates a key whenever a photo or logo is saved or deleted
+
+Hit/miss counters are per process; media_delivery logs them periodically and
+`flask media status` shows the disk usage.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+from flask import send_from_directory
+
+
+MEDIA_CACHE_ENABLED = os.getenv('MEDIA_CACHE', '1') != '0'
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_MB', '256')) * 1024 * 1024
+EVICT_TO_RATIO = 0.9
+TEMP_PREFIX = '.tmp-'
+
+_state = {'dir': None, 'bytes': None}
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'invalidations': 0}
+_lock = threading.Lock()
+
+
+def init_app(app):
+    """Keep the cache under the app's instance folder"""
+    _state['dir'] = os.path.join(app.instance_path, 'media_cache')
+
+
+def cache_dir():
+    return _state['dir']
+
+
+def _relative_path(object_key):
+    digest = hashlib.sha1(object_key.encode('utf-8')).hexdigest()
+    extension = os.path.splitext(object_key)[1].lower()[:10]
+    return os.path.join(digest[:2], digest + extension)
+
+
+def _count(name, amount=1):
+    with _lock:
+        _stats[name] += amount
+
+
+def lookup(object_key):
+    """
+    Relative path of a cached object (and mark it recently used)
+
+    Returns:
+        str or None on a miss (or when the cache is disabled)
+    """
+    if not MEDIA_CACHE_ENABLED or not _state['dir']:
+        return None
+    relative = _relative_path(object_key)
+    try:
+        os.utime(os.path.join(_state['dir'], relative))
+    except FileNotFoundError:
+        _count('misses')
+        return None
+    _count('hits')
+    return relative
+
+
+def store(object_key, data):
+    """
+    Write an object's bytes to the cache atomically
+
+    Returns:
+        str: relative path, or None if the cache is disabled or the write failed
+    """
+    if not MEDIA_CACHE_ENABLED or not _state['dir']:
+        return None
+    relative = _relative_path(object_key)
+    path = os.path.join(_state['dir'], relative)
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except OSError as e:
+        print(f"[MEDIA CACHE] Could not cache {object_key}: {e}")
+        return None
+
+    _count('stores')
+    with _lock:
+        if _state['bytes'] is not None:
+            _state['bytes'] += len(data)
+        # The first store in a process scans the directory to learn its size
+        over_limit = _state['bytes'] is None or _state['bytes'] > MEDIA_CACHE_MAX_BYTES
+    if over_limit:
+        evict()
+    return relative
+
+
+def _entries():
+    """[(mtime, size, path)] of cached files"""
+    entries = []
+    root = _state['dir']
+    if not root or not os.path.isdir(root):
+        return entries
+    for fan_out in os.scandir(root):
+        if not fan_out.is_dir():
+            continue
+        for entry in os.scandir(fan_out.path):
+            if entry.name.startswith(TEMP_PREFIX) or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    return entries
+
+
+def evict(max_bytes=None):
+    """
+    Remove least recently used files until the cache is within bounds
+
+    Returns:
+        int: files removed
+    """
+    max_bytes = MEDIA_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = _entries()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    if total > max_bytes:
+        target = max_bytes * EVICT_TO_RATIO
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+    with _lock:
+        _state['bytes'] = total
+        _stats['evictions'] += removed
+    return removed
+
+
+def invalidate(object_key):
+    """Drop a cached object (after it is replaced or deleted in R2)"""
+    if not _state['dir']:
+        return False
+    try:
+        os.unlink(os.path.join(_state['dir'], _relative_path(object_key)))
+    except FileNotFoundError:
+        return False
+    _count('invalidations')
+    return True
+
+
+def clear():
+    """Remove every cached file; returns how many were removed"""
+    return evict(max_bytes=-1)
+
+
+def send(relative, mimetype):
+    """Response streaming a cached file (zero-copy where the server supports it)"""
+    return send_from_directory(_state['dir'], relative, mimetype=mimetype, etag=False)
+
+
+def stats():
+    """This process's hit/miss counters plus the hit ratio"""
+    with _lock:
+        counters = dict(_stats)
+    lookups = counters['hits'] + counters['misses']
+    counters['hit_ratio'] = round(counters['hits'] / lookups, 3) if lookups else None
+    return counters
+
+
+def disk_usage():
+    """{'files', 'bytes', 'max_bytes'} from a directory scan"""
+    entries = _entries()
+    return {'files': len(entries), 'bytes': sum(size for _, size, _ in entries), 'max_bytes': MEDIA_CACHE_MAX_BYTES}
@@ -0,0 +1,206 @@
+"""
+Delivery of R2-backed photos and clinic logos
+
+serve_photo and serve_clinic_logo used to download each object from R2 into
+memory and stream it back through a gunicorn thread. A page of doctor cards
+could tie up both threads with these proxy requests. serve_r2_object() now
+picks a delivery mode from MEDIA_DELIVERY:
+
+- 'public':    302 to R2_PUBLIC_URL/<key> (public bucket or CDN domain)
+- 'presigned': 302 to a presigned GET URL valid for PRESIGNED_URL_SECONDS.
+               URLs are cached per object key and reused until half their
+               lifetime is left. Signing is local, so no request goes to R2.
+- 'proxy':     bytes fetched from R2 through media_cache's disk cache
+- 'auto' (default): public if R2_PUBLIC_URL is set, otherwise presigned
+  (proxy with the in-memory R2 backend)
+
+Every mode falls back to proxying if it can't produce a URL.
+
+Uploads get a new unique filename, so the bytes under an object key never
+change. The ETag is derived from the key alone, and a matching
+If-None-Match gets a 304 without touching R2.
+"""
+import hashlib
+import os
+import threading
+import time
+from io import BytesIO
+
+import click
+from flask import current_app, make_response, redirect, request, send_file
+from flask.cli import AppGroup
+
+import image_variants
+import maintenance
+import media_cache
+import r2_storage
+
+
+MEDIA_DELIVERY = os.getenv('MEDIA_DELIVERY', 'auto').strip().lower()  # auto, public, presigned, proxy
+PRESIGNED_URL_SECONDS = int(os.getenv('PRESIGNED_URL_SECONDS', '3600'))
+PRESIGNED_CACHE_SIZE = 10000
+MEDIA_MAX_AGE = 604800  # 7 days; object keys are immutable
+STATS_LOG_SECONDS = 900
+IMMUTABLE_CACHE_CONTROL = f'public, max-age={MEDIA_MAX_AGE}, immutable'
+
+# object key -> (url, expires_at monotonic)
+_presigned = {}
+_presigned_lock = threading.Lock()
+_stats = {'not_modified': 0, 'redirects': 0, 'proxied': 0}
+
+
+def delivery_mode():
+    """The effective mode for this configuration: 'public', 'presigned' or 'proxy'"""
+    if MEDIA_DELIVERY in ('proxy', 'presigned'):
+        return MEDIA_DELIVERY
+    if r2_storage.R2_PUBLIC_URL:
+        return 'public'
+    storage = r2_storage.get_storage()
+    if MEDIA_DELIVERY == 'auto' and storage and not isinstance(storage.s3_client, r2_storage.MemoryS3Client):
+        return 'presigned'
+    return 'proxy'  # 'public' without R2_PUBLIC_URL, or the in-memory backend (its URLs aren't fetchable)
+
+
+def etag_for(object_key):
+    """Strong ETag for an object key (content under a key never changes)"""
+    return hashlib.sha1(object_key.encode('utf-8')).hexdigest()[:20]
+
+
+def presigned_url(object_key):
+    """
+    Cached presigned URL for object_key
+
+    Returns:
+        (url, seconds the URL stays valid), or (None, 0) if R2 is unavailable
+    """
+    now = time.monotonic()
+    with _presigned_lock:
+        cached = _presigned.get(object_key)
+    if cached and cached[1] - now > PRESIGNED_URL_SECONDS / 2:
+        return cached[0], int(cached[1] - now)
+
+    storage = r2_storage.get_storage()
+    url = storage.presigned_url(object_key, PRESIGNED_URL_SECONDS) if storage else None
+    if not url:
+        return None, 0
+    with _presigned_lock:
+        if len(_presigned) >= PRESIGNED_CACHE_SIZE:
+            _presigned.clear()
+        _presigned[object_key] = (url, now + PRESIGNED_URL_SECONDS)
+    return url, PRESIGNED_URL_SECONDS
+
+
+def _not_modified(etag):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def _redirect_url(mode, object_key):
+    """(url, max_age) for a redirect, or (None, 0) to proxy instead"""
+    if mode == 'public':
+        url = r2_storage.public_url(object_key)
+        return (url, MEDIA_MAX_AGE) if url else (None, 0)
+    if mode == 'presigned':
+        url, valid_for = presigned_url(object_key)
+        # The browser may reuse the redirect only while the signature is valid
+        return url, max(0, valid_for - 60)
+    return None, 0
+
+
+def serve_r2_object(object_key, mimetype):
+    """
+    Response for an R2 object (304, redirect or proxied bytes)
+
+    Returns:
+        Response, or None if R2 is not configured or the object is missing
+        (the caller then tries local storage)
+    """
+    if not r2_storage.is_configured():
+        return None
+
+    etag = etag_for(object_key)
+    if request.if_none_match.contains(etag):
+        _stats['not_modified'] += 1
+        return _not_modified(etag)
+
+    url, max_age = _redirect_url(delivery_mode(), object_key)
+    if url:
+        _stats['redirects'] += 1
+        response = redirect(url, code=302)
+        response.headers['Cache-Control'] = f'public, max-age={max_age}'
+        return response
+
+    _stats['proxied'] += 1
+    cached = media_cache.lookup(object_key)
+    if cached is None:
+        storage = r2_storage.get_storage()
+        data = storage.get_file_object(object_key) if storage else None
+        if not data:
+            return None
+        cached = media_cache.store(object_key, data)
+        if cached is None:
+            response = make_response(send_file(BytesIO(data), mimetype=mimetype, as_attachment=False))
+    if cached is not None:
+        response = make_response(media_cache.send(cached, mimetype))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def delivery_stats():
+    """Counts of 304s, redirects and proxied responses in this process"""
+    return dict(_stats, mode=delivery_mode(), presigned_cached=len(_presigned))
+
+
+_last_logged = {'stats': None}
+
+
+@maintenance.process_task('media_stats', STATS_LOG_SECONDS)
+def log_stats():
+    """Log this process's delivery counts and disk cache hit ratio when they changed"""
+    current = (dict(_stats), media_cache.stats())
+    if current == _last_logged['stats'] or not any(current[0].values()):
+        return
+    _last_logged['stats'] = current
+    delivery, cache = current
+    print(f"[MEDIA] {delivery['redirects']} redirects, {delivery['proxied']} proxied, "
+          f"{delivery['not_modified']} not modified; disk cache hit ratio {cache['hit_ratio']} "
+          f"({cache['hits']} hits, {cache['misses']} misses, {cache['evictions']} evicted)")
+
+
+media_cli = AppGroup('media', help='Photo and logo delivery')
+
+
+@media_cli.command('status')
+def status_command():
+    """Delivery mode and disk cache usage"""
+    usage = media_cache.disk_usage()
+    print(f"Delivery mode: {delivery_mode()}")
+    print(f"Disk cache: {usage['files']} files, {usage['bytes'] / 1048576:.1f} of "
+          f"{usage['max_bytes'] / 1048576:.0f} MB in {media_cache.cache_dir()}")
+
+
+@media_cli.command('clear')
+def clear_command():
+    """Empty the disk cache"""
+    print(f"Removed {media_cache.clear()} cached files")
+
+
+@media_cli.command('backfill-variants')
+@click.option('--workers', type=int, default=image_variants.BACKFILL_WORKERS, show_default=True,
+              help='Worker processes')
+@click.option('--force', is_flag=True, help='Regenerate renditions for photos that already have them')
+@click.option('--limit', type=int, default=None, help='Process at most this many photos')
+def backfill_variants_command(workers, force, limit):
+    """Generate responsive renditions for existing profile photos"""
+    start = time.perf_counter()
+    done, failed = image_variants.backfill(current_app.config['UPLOAD_FOLDER'], workers=workers,
+                                           force=force, limit=limit)
+    print(f"Generated renditions for {done} photos ({failed} failed) in {time.perf_counter() - start:.1f}s")
+
+
+def init_app(app):
+    media_cache.init_app(app)
+    app.cli.add_command(media_cli)
@@ -0,0 +1,86 @@
+"""Add full-text search index for health digest articles
+
+Revision ID: 013_add_article_search_index
+Revises: 012_add_specialty_verified
+Create Date: 2026-10-19 00:00:00
+
+PostgreSQL gets a generated tsvector column (articles.search_vector) with a GIN index.
+SQLite gets an FTS5 external-content table (articles_fts) kept in sync by triggers.
+Used by article_search.apply_search() for the /health-digest ?q= search.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '013_add_article_search_index'
+down_revision = '012_add_specialty_verified'
+branch_labels = None
+depends_on = None
+
+
+# Weighted document: title matters most, then summary, then body
+POSTGRES_DDL = [
+    """
+    ALTER TABLE articles ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(summary, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(content, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_articles_search_vector ON articles USING GIN (search_vector)",
+]
+
+# Triggers only fire on text columns so view_count updates don't rewrite the index
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+        title, summary, content, content='articles', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS articles_fts_ai AFTER INSERT ON articles BEGIN
+        INSERT INTO articles_fts(rowid, title, summary, content)
+        VALUES (new.id, new.title, new.summary, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS articles_fts_ad AFTER DELETE ON articles BEGIN
+        INSERT INTO articles_fts(articles_fts, rowid, title, summary, content)
+        VALUES ('delete', old.id, old.title, old.summary, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS articles_fts_au AFTER UPDATE OF title, summary, content ON articles BEGIN
+        INSERT INTO articles_fts(articles_fts, rowid, title, summary, content)
+        VALUES ('delete', old.id, old.title, old.summary, old.content);
+        INSERT INTO articles_fts(rowid, title, summary, content)
+        VALUES (new.id, new.title, new.summary, new.content);
+    END
+    """,
+    "INSERT INTO articles_fts(articles_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade():
+    conn = op.get_bind()
+    if conn.dialect.name == 'postgresql':
+        statements = POSTGRES_DDL
+    elif conn.dialect.name == 'sqlite':
+        statements = SQLITE_DDL
+    else:
+        return
+
+    for statement in statements:
+        conn.execute(sa.text(statement))
+
+
+def downgrade():
+    conn = op.get_bind()
+    if conn.dialect.name == 'postgresql':
+        conn.execute(sa.text("DROP INDEX IF EXISTS ix_articles_search_vector"))
+        conn.execute(sa.text("ALTER TABLE articles DROP COLUMN IF EXISTS search_vector"))
+    elif conn.dialect.name == 'sqlite':
+        for trigger in ('articles_fts_ai', 'articles_fts_ad', 'articles_fts_au'):
+            conn.execute(sa.text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        conn.execute(sa.text("DROP TABLE IF EXISTS articles_fts"))
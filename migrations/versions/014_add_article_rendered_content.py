@@ -0,0 +1,41 @@
+"""Add pre-rendered Markdown columns to articles
+
+Revision ID: 014_add_article_rendered_content
+Revises: 013_add_article_search_index
+Create Date: 2026-10-19 00:00:00
+
+content_html/content_toc hold the rendered article, content_hash the SHA-256 of the
+content they were built from. Existing rows are filled by prerender_articles.py
+(until then they are rendered through the per-process LRU fallback).
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '014_add_article_rendered_content'
+down_revision = '013_add_article_search_index'
+branch_labels = None
+depends_on = None
+
+
+def column_exists(table_name, column_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    columns = [col['name'] for col in inspector.get_columns(table_name)]
+    return column_name in columns
+
+
+def upgrade():
+    if not column_exists('articles', 'content_html'):
+        op.add_column('articles', sa.Column('content_html', sa.Text(), nullable=True))
+    if not column_exists('articles', 'content_toc'):
+        op.add_column('articles', sa.Column('content_toc', sa.Text(), nullable=True))
+    if not column_exists('articles', 'content_hash'):
+        op.add_column('articles', sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    for column in ('content_hash', 'content_toc', 'content_html'):
+        if column_exists('articles', column):
+            op.drop_column('articles', column)
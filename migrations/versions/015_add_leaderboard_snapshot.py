@@ -0,0 +1,57 @@
+"""Add leaderboard snapshot table and users.points index
+
+Revision ID: 015_add_leaderboard_snapshot
+Revises: 014_add_article_rendered_content
+Create Date: 2026-10-19 00:00:00
+
+leaderboard_snapshot holds the pre-ranked top-50 lists served by /leaderboard.
+ix_users_points makes the per-user rank lookup on profile pages an index scan.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '015_add_leaderboard_snapshot'
+down_revision = '014_add_article_rendered_content'
+branch_labels = None
+depends_on = None
+
+
+def table_exists(table_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return table_name in inspector.get_table_names()
+
+
+def index_exists(table_name, index_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return any(idx['name'] == index_name for idx in inspector.get_indexes(table_name))
+
+
+def upgrade():
+    if not table_exists('leaderboard_snapshot'):
+        op.create_table(
+            'leaderboard_snapshot',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('board', sa.String(length=20), nullable=False),
+            sa.Column('rank', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('users.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('name', sa.String(length=200), nullable=False),
+            sa.Column('points', sa.Integer(), nullable=True),
+            sa.Column('review_count', sa.Integer(), nullable=True),
+            sa.Column('helpful_count', sa.Integer(), nullable=True),
+            sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+            sa.UniqueConstraint('board', 'rank', name='unique_leaderboard_board_rank'),
+        )
+
+    if not index_exists('users', 'ix_users_points'):
+        op.create_index('ix_users_points', 'users', ['points'])
+
+
+def downgrade():
+    if index_exists('users', 'ix_users_points'):
+        op.drop_index('ix_users_points', table_name='users')
+    if table_exists('leaderboard_snapshot'):
+        op.drop_table('leaderboard_snapshot')
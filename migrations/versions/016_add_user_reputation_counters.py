@@ -0,0 +1,73 @@
+"""Add denormalized reputation counters to users
+
+Revision ID: 016_add_user_reputation_counters
+Revises: 015_add_leaderboard_snapshot
+Create Date: 2026-10-19 00:00:00
+
+review_count, helpful_received, distinct_specialties, distinct_cities and
+has_detailed_review replace the per-request walks over user.ratings in badge
+checks. Existing users are backfilled from ratings/review_helpful.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '016_add_user_reputation_counters'
+down_revision = '015_add_leaderboard_snapshot'
+branch_labels = None
+depends_on = None
+
+
+COUNTER_COLUMNS = ('review_count', 'helpful_received', 'distinct_specialties', 'distinct_cities')
+
+BACKFILL_SQL = """
+UPDATE users SET
+    review_count = (
+        SELECT COUNT(*) FROM ratings WHERE ratings.user_id = users.id
+    ),
+    helpful_received = (
+        SELECT COUNT(*) FROM review_helpful
+        JOIN ratings ON ratings.id = review_helpful.rating_id
+        WHERE ratings.user_id = users.id
+    ),
+    distinct_specialties = (
+        SELECT COUNT(DISTINCT doctors.specialty_id) FROM ratings
+        JOIN doctors ON doctors.id = ratings.doctor_id
+        WHERE ratings.user_id = users.id
+    ),
+    distinct_cities = (
+        SELECT COUNT(DISTINCT doctors.city_id) FROM ratings
+        JOIN doctors ON doctors.id = ratings.doctor_id
+        WHERE ratings.user_id = users.id
+    ),
+    has_detailed_review = EXISTS (
+        SELECT 1 FROM ratings
+        WHERE ratings.user_id = users.id AND LENGTH(ratings.comment) >= 100
+    )
+WHERE EXISTS (SELECT 1 FROM ratings WHERE ratings.user_id = users.id)
+"""
+
+
+def column_exists(table_name, column_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return any(col['name'] == column_name for col in inspector.get_columns(table_name))
+
+
+def upgrade():
+    for column_name in COUNTER_COLUMNS:
+        if not column_exists('users', column_name):
+            op.add_column('users', sa.Column(column_name, sa.Integer(), nullable=False, server_default='0'))
+
+    if not column_exists('users', 'has_detailed_review'):
+        op.add_column('users', sa.Column('has_detailed_review', sa.Boolean(), nullable=False,
+                                         server_default=sa.false()))
+
+    op.execute(BACKFILL_SQL)
+
+
+def downgrade():
+    for column_name in ('has_detailed_review',) + COUNTER_COLUMNS:
+        if column_exists('users', column_name):
+            op.drop_column('users', column_name)
@@ -0,0 +1,52 @@
+"""Add MinHash signature tables for near-duplicate review detection
+
+Revision ID: 017_add_review_signatures
+Revises: 016_add_user_reputation_counters
+Create Date: 2026-10-19 00:00:00
+
+review_signatures holds one MinHash signature per review and
+review_signature_buckets its LSH band buckets. Populate existing reviews with
+`python backfill_review_signatures.py`.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '017_add_review_signatures'
+down_revision = '016_add_user_reputation_counters'
+branch_labels = None
+depends_on = None
+
+
+def table_exists(table_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade():
+    if not table_exists('review_signatures'):
+        op.create_table(
+            'review_signatures',
+            sa.Column('rating_id', sa.Integer(), sa.ForeignKey('ratings.id', ondelete='CASCADE'), primary_key=True),
+            sa.Column('signature', sa.LargeBinary(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+        )
+
+    if not table_exists('review_signature_buckets'):
+        op.create_table(
+            'review_signature_buckets',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('rating_id', sa.Integer(), sa.ForeignKey('ratings.id', ondelete='CASCADE'), nullable=False),
+            sa.Column('bucket', sa.BigInteger(), nullable=False),
+        )
+        op.create_index('ix_review_signature_buckets_rating_id', 'review_signature_buckets', ['rating_id'])
+        op.create_index('ix_review_signature_buckets_bucket', 'review_signature_buckets', ['bucket'])
+
+
+def downgrade():
+    if table_exists('review_signature_buckets'):
+        op.drop_table('review_signature_buckets')
+    if table_exists('review_signatures'):
+        op.drop_table('review_signatures')
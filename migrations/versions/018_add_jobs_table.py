@@ -0,0 +1,51 @@
+"""Add jobs table for the background job queue
+
+Revision ID: 018_add_jobs_table
+Revises: 017_add_review_signatures
+Create Date: 2026-10-19 00:00:00
+
+Workers (`flask jobs worker`) claim pending rows ordered by run_at, so the
+(status, run_at) index covers the claim query. idempotency_key is unique so a
+side effect enqueued twice is stored once.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '018_add_jobs_table'
+down_revision = '017_add_review_signatures'
+branch_labels = None
+depends_on = None
+
+
+def table_exists(table_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade():
+    if not table_exists('jobs'):
+        op.create_table(
+            'jobs',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('payload', sa.Text(), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='5'),
+            sa.Column('idempotency_key', sa.String(length=200), nullable=True, unique=True),
+            sa.Column('run_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+            sa.Column('locked_at', sa.DateTime(), nullable=True),
+            sa.Column('locked_by', sa.String(length=100), nullable=True),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_jobs_status_run_at', 'jobs', ['status', 'run_at'])
+
+
+def downgrade():
+    if table_exists('jobs'):
+        op.drop_table('jobs')
@@ -0,0 +1,55 @@
+"""Add email_outbox table for batched outgoing email
+
+Revision ID: 019_add_email_outbox
+Revises: 018_add_jobs_table
+Create Date: 2026-10-19 00:00:00
+
+mailer.py claims pending rows by (status, send_after) and sends them through
+Resend's batch API. (category, created_at) backs the global verification
+email limit, which used to count security_events rows.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '019_add_email_outbox'
+down_revision = '018_add_jobs_table'
+branch_labels = None
+depends_on = None
+
+
+def table_exists(table_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade():
+    if not table_exists('email_outbox'):
+        op.create_table(
+            'email_outbox',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('category', sa.String(length=50), nullable=True),
+            sa.Column('from_email', sa.String(length=200), nullable=False),
+            sa.Column('recipients', sa.Text(), nullable=False),
+            sa.Column('subject', sa.String(length=500), nullable=False),
+            sa.Column('html', sa.Text(), nullable=False),
+            sa.Column('reply_to', sa.String(length=200), nullable=True),
+            sa.Column('dedupe_key', sa.String(length=200), nullable=True, unique=True),
+            sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+            sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('send_after', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+            sa.Column('locked_at', sa.DateTime(), nullable=True),
+            sa.Column('provider_id', sa.String(length=100), nullable=True),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('sent_at', sa.DateTime(), nullable=True),
+        )
+        op.create_index('ix_email_outbox_status_send_after', 'email_outbox', ['status', 'send_after'])
+        op.create_index('ix_email_outbox_category_created', 'email_outbox', ['category', 'created_at'])
+
+
+def downgrade():
+    if table_exists('email_outbox'):
+        op.drop_table('email_outbox')
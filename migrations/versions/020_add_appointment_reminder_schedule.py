@@ -0,0 +1,54 @@
+"""Add reminder schedule tracking and the appointment date/status index
+
+Revision ID: 020_add_appointment_reminder_schedule
+Revises: 019_add_email_outbox
+Create Date: 2026-10-19 00:00:00
+
+appointment_reminders.schedule ('24h', '2h') plus a unique index on
+(appointment_id, reminder_type, schedule) make reminder scans idempotent.
+The scanner reads upcoming appointments by (appointment_date, status).
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '020_add_appointment_reminder_schedule'
+down_revision = '019_add_email_outbox'
+branch_labels = None
+depends_on = None
+
+
+def column_exists(table_name, column_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return any(col['name'] == column_name for col in inspector.get_columns(table_name))
+
+
+def index_exists(table_name, index_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return any(idx['name'] == index_name for idx in inspector.get_indexes(table_name))
+
+
+def upgrade():
+    if not column_exists('appointment_reminders', 'schedule'):
+        op.add_column('appointment_reminders', sa.Column('schedule', sa.String(length=10), nullable=True))
+    if not column_exists('appointment_reminders', 'outbox_email_id'):
+        op.add_column('appointment_reminders', sa.Column('outbox_email_id', sa.Integer(), nullable=True))
+    if not index_exists('appointment_reminders', 'uq_appointment_reminder'):
+        op.create_index('uq_appointment_reminder', 'appointment_reminders',
+                        ['appointment_id', 'reminder_type', 'schedule'], unique=True)
+
+    if not index_exists('appointments', 'idx_appointment_date_status'):
+        op.create_index('idx_appointment_date_status', 'appointments', ['appointment_date', 'status'])
+
+
+def downgrade():
+    if index_exists('appointments', 'idx_appointment_date_status'):
+        op.drop_index('idx_appointment_date_status', table_name='appointments')
+    if index_exists('appointment_reminders', 'uq_appointment_reminder'):
+        op.drop_index('uq_appointment_reminder', table_name='appointment_reminders')
+    for column_name in ('outbox_email_id', 'schedule'):
+        if column_exists('appointment_reminders', column_name):
+            op.drop_column('appointment_reminders', column_name)
@@ -0,0 +1,40 @@
+"""Add cached_documents table for pre-generated documents
+
+Revision ID: 021_add_cached_documents
+Revises: 020_add_appointment_reminder_schedule
+Create Date: 2026-10-19 00:00:00
+
+The sitemap is regenerated by a maintenance task (maintenance.py) and stored
+here, so /sitemap.xml no longer loads every doctor and article per request.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '021_add_cached_documents'
+down_revision = '020_add_appointment_reminder_schedule'
+branch_labels = None
+depends_on = None
+
+
+def table_exists(table_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade():
+    if not table_exists('cached_documents'):
+        op.create_table(
+            'cached_documents',
+            sa.Column('name', sa.String(length=100), primary_key=True),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('content_type', sa.String(length=100), nullable=False),
+            sa.Column('generated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        )
+
+
+def downgrade():
+    if table_exists('cached_documents'):
+        op.drop_table('cached_documents')
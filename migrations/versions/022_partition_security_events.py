@@ -0,0 +1,163 @@
+"""Partition security_events by month, add limiter indexes and hourly rollups
+
+Revision ID: 022_partition_security_events
+Revises: 021_add_cached_documents
+Create Date: 2026-10-19 00:00:00
+
+- security_event_rollups: hourly counts per (event_type, ip), see
+  security_events.py
+- composite indexes matching the rate limiters' lookups:
+  (event_type, ip, created_at), (event_type, email, created_at),
+  (event_type, created_at); created_at keeps migration 011's
+  ix_security_events_created_at (recreated on the partitioned table)
+- PostgreSQL: security_events becomes a table range-partitioned by month on
+  created_at. The rows are copied into monthly partitions (covering the
+  oldest event up to three months ahead), and the id sequence is kept. The
+  primary key becomes (id, created_at), because PostgreSQL requires the
+  partition key in it. security_events_default catches rows outside every
+  monthly partition, so an insert never fails for want of one. Downgrade
+  keeps the partitioned table.
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '022_partition_security_events'
+down_revision = '021_add_cached_documents'
+branch_labels = None
+depends_on = None
+
+PARTITIONS_AHEAD = 3
+DEFAULT_PARTITION = 'security_events_default'
+EVENT_INDEXES = (
+    ('ix_security_events_type_ip_created', ['event_type', 'ip', 'created_at']),
+    ('ix_security_events_type_email_created', ['event_type', 'email', 'created_at']),
+    ('ix_security_events_type_created', ['event_type', 'created_at']),
+)
+# Created by migration 011; only missing on the rebuilt partitioned table
+CREATED_AT_INDEX = ('ix_security_events_created_at', ['created_at'])
+
+
+def table_exists(table_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return table_name in inspector.get_table_names()
+
+
+def index_exists(table_name, index_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return index_name in {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def is_partitioned(conn):
+    return bool(conn.execute(sa.text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'security_events' AND pg_table_is_visible(c.oid)"
+    )).scalar())
+
+
+def next_month(month):
+    return datetime(month.year + (month.month == 12), month.month % 12 + 1, 1)
+
+
+def partition_security_events(conn):
+    """Rebuild security_events as a monthly range-partitioned table (PostgreSQL)"""
+    sequence = conn.execute(sa.text("SELECT pg_get_serial_sequence('security_events', 'id')")).scalar()
+    oldest = conn.execute(sa.text("SELECT min(created_at) FROM security_events")).scalar()
+
+    op.execute("ALTER TABLE security_events RENAME TO security_events_unpartitioned")
+    op.execute("ALTER TABLE security_events_unpartitioned RENAME CONSTRAINT security_events_pkey "
+               "TO security_events_unpartitioned_pkey")
+    if sequence:
+        # Keep the sequence when the old table is dropped
+        op.execute(f"ALTER SEQUENCE {sequence} OWNED BY NONE")
+        id_default = f"DEFAULT nextval('{sequence}'::regclass)"
+    else:
+        op.execute("CREATE SEQUENCE security_events_id_seq")
+        sequence = 'security_events_id_seq'
+        id_default = "DEFAULT nextval('security_events_id_seq'::regclass)"
+
+    op.execute(f"""
+        CREATE TABLE security_events (
+            id INTEGER NOT NULL {id_default},
+            event_type VARCHAR(50) NOT NULL,
+            user_id INTEGER REFERENCES users (id),
+            email VARCHAR(200),
+            ip VARCHAR(64),
+            user_agent VARCHAR(255),
+            path VARCHAR(255),
+            method VARCHAR(10),
+            meta TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+
+    now = datetime.utcnow()
+    month = datetime((oldest or now).year, (oldest or now).month, 1)
+    last = datetime(now.year, now.month, 1)
+    for _ in range(PARTITIONS_AHEAD):
+        last = next_month(last)
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE security_events_{month.year:04d}_{month.month:02d} "
+            f"PARTITION OF security_events FOR VALUES FROM ('{month:%Y-%m-%d}') "
+            f"TO ('{next_month(month):%Y-%m-%d}')"
+        )
+        month = next_month(month)
+    op.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF security_events DEFAULT")
+
+    op.execute("""
+        INSERT INTO security_events (id, event_type, user_id, email, ip, user_agent, path, method, meta, created_at)
+        SELECT id, event_type, user_id, email, ip, user_agent, path, method, meta,
+               COALESCE(created_at, now() AT TIME ZONE 'utc')
+        FROM security_events_unpartitioned
+    """)
+    op.execute("DROP TABLE security_events_unpartitioned")
+    op.execute(f"ALTER SEQUENCE {sequence} OWNED BY security_events.id")
+    op.execute(f"SELECT setval('{sequence}', COALESCE((SELECT max(id) FROM security_events), 0) + 1, false)")
+
+
+def upgrade():
+    conn = op.get_bind()
+
+    if not table_exists('security_event_rollups'):
+        op.create_table(
+            'security_event_rollups',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('hour', sa.DateTime(), nullable=False),
+            sa.Column('event_type', sa.String(length=50), nullable=False),
+            sa.Column('ip', sa.String(length=64), nullable=False, server_default=''),
+            sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+        )
+        op.create_index('uq_security_event_rollup', 'security_event_rollups',
+                        ['hour', 'event_type', 'ip'], unique=True)
+
+    if not table_exists('security_events'):
+        return
+
+    if conn.dialect.name == 'postgresql':
+        if not is_partitioned(conn):
+            partition_security_events(conn)
+        elif not table_exists(DEFAULT_PARTITION):
+            op.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF security_events DEFAULT")
+
+    for index_name, columns in EVENT_INDEXES + (CREATED_AT_INDEX,):
+        if not index_exists('security_events', index_name):
+            op.create_index(index_name, 'security_events', columns)
+    if index_exists('security_events', 'ix_security_events_created'):
+        # Duplicate of ix_security_events_created_at from an earlier version of this migration
+        op.drop_index('ix_security_events_created', table_name='security_events')
+
+
+def downgrade():
+    if table_exists('security_events'):
+        for index_name, _ in EVENT_INDEXES:
+            if index_exists('security_events', index_name):
+                op.drop_index(index_name, table_name='security_events')
+    if table_exists('security_event_rollups'):
+        op.drop_table('security_event_rollups')
@@ -0,0 +1,36 @@
+"""Record which doctor photos have responsive renditions
+
+Revision ID: 023_add_photo_variants
+Revises: 022_partition_security_events
+Create Date: 2026-10-19 00:00:00
+
+doctors.photo_variants is set once image_variants has stored a photo's
+width/format renditions, so templates only emit srcset for those photos.
+Existing photos start without; `flask media backfill-variants` fills them in.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '023_add_photo_variants'
+down_revision = '022_partition_security_events'
+branch_labels = None
+depends_on = None
+
+
+def column_exists(table_name, column_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return any(col['name'] == column_name for col in inspector.get_columns(table_name))
+
+
+def upgrade():
+    if not column_exists('doctors', 'photo_variants'):
+        op.add_column('doctors', sa.Column('photo_variants', sa.Boolean(), nullable=False,
+                                           server_default=sa.false()))
+
+
+def downgrade():
+    if column_exists('doctors', 'photo_variants'):
+        op.drop_column('doctors', 'photo_variants')
@@ -0,0 +1,45 @@
+"""Add stored_objects table for content-addressed uploads
+
+Revision ID: 024_add_stored_objects
+Revises: 023_add_photo_variants
+Create Date: 2026-10-19 00:00:00
+
+Verification documents are stored once per SHA-256 of their content
+(object_store.py). Each row records where the object lives and how many
+verification requests reference it, so identical resubmissions share one
+object and it is only deleted when the last reference goes.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '024_add_stored_objects'
+down_revision = '023_add_photo_variants'
+branch_labels = None
+depends_on = None
+
+
+def table_exists(table_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return table_name in inspector.get_table_names()
+
+
+def upgrade():
+    if not table_exists('stored_objects'):
+        op.create_table(
+            'stored_objects',
+            sa.Column('sha256', sa.String(length=64), primary_key=True),
+            sa.Column('object_key', sa.String(length=255), nullable=False, unique=True),
+            sa.Column('backend', sa.String(length=10), nullable=False),
+            sa.Column('size', sa.BigInteger(), nullable=False),
+            sa.Column('content_type', sa.String(length=100), nullable=True),
+            sa.Column('refcount', sa.Integer(), nullable=False, server_default='1'),
+            sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        )
+
+
+def downgrade():
+    if table_exists('stored_objects'):
+        op.drop_table('stored_objects')
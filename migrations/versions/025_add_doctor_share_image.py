@@ -0,0 +1,36 @@
+"""Record each doctor's generated Open Graph share image
+
+Revision ID: 025_add_doctor_share_image
+Revises: 024_add_stored_objects
+Create Date: 2026-10-19 00:00:00
+
+doctors.share_image holds the storage key of the 1200x630 card rendered by
+share_images.py (share/<doctor_id>/<fingerprint>.jpg). doctor_profile.html
+uses it for og:image and twitter:image; until a doctor's card exists the
+profile photo or logo is used as before.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '025_add_doctor_share_image'
+down_revision = '024_add_stored_objects'
+branch_labels = None
+depends_on = None
+
+
+def column_exists(table_name, column_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return any(col['name'] == column_name for col in inspector.get_columns(table_name))
+
+
+def upgrade():
+    if not column_exists('doctors', 'share_image'):
+        op.add_column('doctors', sa.Column('share_image', sa.String(length=120), nullable=True))
+
+
+def downgrade():
+    if column_exists('doctors', 'share_image'):
+        op.drop_column('doctors', 'share_image')
@@ -0,0 +1,45 @@
+"""Record the latest staged image upload on its record
+
+Revision ID: 026_add_upload_tokens
+Revises: 025_add_doctor_share_image
+Create Date: 2026-10-19 00:00:00
+
+image_processing.submit() stores the staging token of an upload on the
+record (doctors.photo_upload_token, clinics.logo_upload_token,
+articles.featured_image_upload_token). The processed image is only switched
+in while the token still matches, so of two uploads in flight the one
+submitted last wins, whichever finishes first.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.engine.reflection import Inspector
+
+
+revision = '026_add_upload_tokens'
+down_revision = '025_add_doctor_share_image'
+branch_labels = None
+depends_on = None
+
+TOKEN_COLUMNS = (
+    ('doctors', 'photo_upload_token'),
+    ('clinics', 'logo_upload_token'),
+    ('articles', 'featured_image_upload_token'),
+)
+
+
+def column_exists(table_name, column_name):
+    conn = op.get_bind()
+    inspector = Inspector.from_engine(conn)
+    return any(col['name'] == column_name for col in inspector.get_columns(table_name))
+
+
+def upgrade():
+    for table_name, column_name in TOKEN_COLUMNS:
+        if not column_exists(table_name, column_name):
+            op.add_column(table_name, sa.Column(column_name, sa.String(length=32), nullable=True))
+
+
+def downgrade():
+    for table_name, column_name in TOKEN_COLUMNS:
+        if column_exists(table_name, column_name):
+            op.drop_column(table_name, column_name)
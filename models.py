@@ -4,6 +4,28 @@ from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
 
+# Reviewer tiers by points (shared by User and LeaderboardSnapshot)
+TIER_NAMES = {
+    'bronze': 'Basic Contributor',
+    'silver': 'Trusted Reviewer',
+    'gold': 'Expert Reviewer',
+    'platinum': 'Community Leader'
+}
+
+
+def points_tier(points):
+    """Get reviewer tier for a points total"""
+    points = points or 0
+    if points >= 300:
+        return 'platinum'
+    elif points >= 151:
+        return 'gold'
+    elif points >= 51:
+        return 'silver'
+    else:
+        return 'bronze'
+
+
 class City(db.Model):
     __tablename__ = 'cities'
 
@@ -113,6 +135,7 @@ class Clinic(db.Model):
     website = db.Column(db.String(200), nullable=True)
     description = db.Column(db.Text, nullable=True)
     logo_url = db.Column(db.String(500), nullable=True)
+    logo_upload_token = db.Column(db.String(32), nullable=True)  # Latest staged logo (see image_processing.py)
 
     # Clinic type and status
     clinic_type = db.Column(db.String(50), default='clinic')  # hospital, clinic, nursing_home, private_practice, polyclinic
@@ -175,6 +198,9 @@ class Doctor(db.Model):
     workplace = db.Column(db.Text)  # Where they work (e.g., "B&C Medical College")
     description = db.Column(db.Text)
     photo_url = db.Column(db.Text)  # URL to doctor's photo
+    photo_variants = db.Column(db.Boolean, default=False)  # Responsive renditions stored (see image_variants.py)
+    photo_upload_token = db.Column(db.String(32), nullable=True)  # Latest staged photo (see image_processing.py)
+    share_image = db.Column(db.String(120), nullable=True)  # Open Graph card key, share/<id>/<fingerprint>.jpg (see share_images.py)
     is_featured = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
     is_verified = db.Column(db.Boolean, default=False)
@@ -257,7 +283,15 @@ class User(db.Model):
     is_doctor_intent = db.Column(db.Boolean, default=False)  # True if user checked "I am a doctor" during registration
 
     # Gamification
-    points = db.Column(db.Integer, default=0)
+    points = db.Column(db.Integer, default=0, index=True)
+
+    # Reputation counters - maintained by the gamification hooks so badge checks
+    # don't walk the user's ratings (see gamification.recalculate_user_counters)
+    review_count = db.Column(db.Integer, default=0, nullable=False)
+    helpful_received = db.Column(db.Integer, default=0, nullable=False)
+    distinct_specialties = db.Column(db.Integer, default=0, nullable=False)
+    distinct_cities = db.Column(db.Integer, default=0, nullable=False)
+    has_detailed_review = db.Column(db.Boolean, default=False, nullable=False)
 
     # Activity tracking
     last_login_at = db.Column(db.DateTime, nullable=True)
@@ -285,38 +319,17 @@ class User(db.Model):
     @property
     def tier(self):
         """Get user tier based on points"""
-        if self.points >= 300:
-            return 'platinum'
-        elif self.points >= 151:
-            return 'gold'
-        elif self.points >= 51:
-            return 'silver'
-        else:
-            return 'bronze'
+        return points_tier(self.points)
 
     @property
     def tier_name(self):
         """Get display name for user tier"""
-        tier_names = {
-            'bronze': 'Basic Contributor',
-            'silver': 'Trusted Reviewer',
-            'gold': 'Expert Reviewer',
-            'platinum': 'Community Leader'
-        }
-        return tier_names.get(self.tier, 'Basic Contributor')
-
-    @property
-    def review_count(self):
-        """Get total number of reviews written"""
-        return len(self.ratings)
+        return TIER_NAMES.get(self.tier, 'Basic Contributor')
 
     @property
     def helpful_count(self):
         """Get total number of helpful votes received on reviews"""
-        count = 0
-        for rating in self.ratings:
-            count += len(rating.helpful_votes)
-        return count
+        return self.helpful_received or 0
 
 
 class BlockedIdentity(db.Model):
@@ -337,7 +350,18 @@ class BlockedIdentity(db.Model):
 
 
 class SecurityEvent(db.Model):
+    """
+    Auth, blocklist, email and booking events (see security_events.py)
+    Partitioned by month on created_at on PostgreSQL (migration 022); the
+    indexes match the rate limiters' (event_type, ip/email, time window) lookups
+    """
     __tablename__ = 'security_events'
+    __table_args__ = (
+        db.Index('ix_security_events_type_ip_created', 'event_type', 'ip', 'created_at'),
+        db.Index('ix_security_events_type_email_created', 'event_type', 'email', 'created_at'),
+        db.Index('ix_security_events_type_created', 'event_type', 'created_at'),
+        db.Index('ix_security_events_created_at', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     event_type = db.Column(db.String(50), nullable=False)
@@ -383,6 +407,26 @@ class SecurityEvent(db.Model):
         return f'<User {self.email}>'
 
 
+class SecurityEventRollup(db.Model):
+    """
+    Hourly security event counts per (event_type, ip)
+    Kept after the raw events expire; the admin charts read these
+    """
+    __tablename__ = 'security_event_rollups'
+    __table_args__ = (
+        db.Index('uq_security_event_rollup', 'hour', 'event_type', 'ip', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    hour = db.Column(db.DateTime, nullable=False)  # UTC, start of the hour
+    event_type = db.Column(db.String(50), nullable=False)
+    ip = db.Column(db.String(64), nullable=False, default='')  # '' for events without an IP
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SecurityEventRollup {self.hour} {self.event_type} {self.ip}: {self.count}>'
+
+
 class ClinicManagerDoctor(db.Model):
     __tablename__ = 'clinic_manager_doctors'
 
@@ -513,6 +557,7 @@ class Appointment(db.Model):
         db.Index('idx_appointment_date_doctor', 'clinic_doctor_id', 'appointment_date'),
         db.Index('idx_appointment_booking_code', 'booking_code'),
         db.Index('idx_appointment_patient_phone', 'patient_phone'),
+        db.Index('idx_appointment_date_status', 'appointment_date', 'status'),
     )
 
     @property
@@ -634,7 +679,7 @@ class VerificationRequest(db.Model):
     email_verified = db.Column(db.Boolean, default=False)
     email_verification_token = db.Column(db.String(255), nullable=True)
 
-    # Document paths (stored in /instance/uploads/verification/{doctor_id}/)
+    # Document keys (content-addressed objects/..., see object_store.py; older rows verification/{doctor_id}/...)
     medical_degree_path = db.Column(db.String(500), nullable=True)
     govt_id_path = db.Column(db.String(500), nullable=True)
     practice_license_path = db.Column(db.String(500), nullable=True)
@@ -823,6 +868,66 @@ class ReviewHelpful(db.Model):
         return f'<ReviewHelpful Rating {self.rating_id} by User {self.user_id}>'
 
 
+class ReviewSignature(db.Model):
+    """
+    MinHash signature of a review's normalized text (see review_dedup.py)
+    Used to find near-duplicate reviews across all doctors
+    """
+    __tablename__ = 'review_signatures'
+
+    rating_id = db.Column(db.Integer, db.ForeignKey('ratings.id', ondelete='CASCADE'), primary_key=True)
+    signature = db.Column(db.LargeBinary, nullable=False)  # packed 32-bit MinHash values
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ReviewSignature Rating {self.rating_id}>'
+
+
+class ReviewSignatureBucket(db.Model):
+    """
+    LSH bucket membership: one row per (review, band) of its MinHash signature
+    Reviews sharing any bucket are near-duplicate candidates
+    """
+    __tablename__ = 'review_signature_buckets'
+
+    id = db.Column(db.Integer, primary_key=True)
+    rating_id = db.Column(db.Integer, db.ForeignKey('ratings.id', ondelete='CASCADE'), nullable=False, index=True)
+    bucket = db.Column(db.BigInteger, nullable=False, index=True)  # hash of (band number, band values)
+
+    def __repr__(self):
+        return f'<ReviewSignatureBucket Rating {self.rating_id} {self.bucket}>'
+
+
+class LeaderboardSnapshot(db.Model):
+    """
+    Pre-ranked top reviewers, rebuilt periodically by gamification.rebuild_leaderboard_snapshot()
+    One row per (board, rank); board is 'points', 'reviews' or 'helpful'
+    """
+    __tablename__ = 'leaderboard_snapshot'
+    __table_args__ = (db.UniqueConstraint('board', 'rank', name='unique_leaderboard_board_rank'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    board = db.Column(db.String(20), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    name = db.Column(db.String(200), nullable=False)
+    points = db.Column(db.Integer, default=0)
+    review_count = db.Column(db.Integer, default=0)
+    helpful_count = db.Column(db.Integer, default=0)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def tier(self):
+        return points_tier(self.points)
+
+    @property
+    def tier_name(self):
+        return TIER_NAMES.get(self.tier, 'Basic Contributor')
+
+    def __repr__(self):
+        return f'<LeaderboardSnapshot {self.board} #{self.rank} user={self.user_id}>'
+
+
 class ArticleCategory(db.Model):
     """
     Categories for health digest articles
@@ -857,7 +962,11 @@ class Article(db.Model):
     # Content
     summary = db.Column(db.Text)  # Short excerpt for listing page
     content = db.Column(db.Text, nullable=False)  # Full article content (HTML)
+    content_html = db.Column(db.Text, nullable=True)  # Pre-rendered Markdown (see article_render.py)
+    content_toc = db.Column(db.Text, nullable=True)  # Pre-rendered table of contents links
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of content that content_html was built from
     featured_image = db.Column(db.String(500))  # URL to featured image
+    featured_image_upload_token = db.Column(db.String(32), nullable=True)  # Latest staged image (see image_processing.py)
     quick_answer = db.Column(db.Text)  # Quick answer box (reduces bounce rate)
 
     # Author (can be admin or doctor in future)
@@ -1425,13 +1534,19 @@ class ScheduleException(db.Model):
 class AppointmentReminder(db.Model):
     """Track reminders sent for appointments"""
     __tablename__ = 'appointment_reminders'
+    __table_args__ = (
+        # One reminder per appointment, channel and offset (see appointment_reminders.py)
+        db.Index('uq_appointment_reminder', 'appointment_id', 'reminder_type', 'schedule', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False)
 
     reminder_type = db.Column(db.String(20), nullable=False)  # email, sms, whatsapp
+    schedule = db.Column(db.String(10), nullable=True)  # offset before the appointment, e.g. '24h', '2h'
+    outbox_email_id = db.Column(db.Integer, nullable=True)  # email_outbox row for email reminders
     sent_at = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), default='sent')  # sent, delivered, failed
+    status = db.Column(db.String(20), default='sent')  # queued, sent, delivered, failed, skipped
 
     # For tracking responses (SMS confirmation)
     response_received = db.Column(db.Boolean, default=False)
@@ -1474,3 +1589,96 @@ class PatientNoShowRecord(db.Model):
             PatientNoShowRecord.patient_phone == patient_phone,
             PatientNoShowRecord.no_show_date >= cutoff_date
         ).count()
+
+
+class Job(db.Model):
+    """
+    Background job queue (see jobs.py)
+    Rows are claimed by `flask jobs worker` processes and retried with backoff on failure
+    """
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # registered task name, e.g. 'send_email'
+    payload = db.Column(db.Text, nullable=True)  # JSON keyword arguments for the task
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'running', 'done', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=True)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    locked_by = db.Column(db.String(100), nullable=True)  # host:pid of the worker running it
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} {self.status}>'
+
+
+class OutboxEmail(db.Model):
+    """
+    Outgoing email waiting to be sent (see mailer.py)
+    Rows are sent in batches through Resend by the job worker
+    """
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_send_after', 'status', 'send_after'),
+        db.Index('ix_email_outbox_category_created', 'category', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    category = db.Column(db.String(50), nullable=True)  # 'verification', 'announcement', ...
+    from_email = db.Column(db.String(200), nullable=False)
+    recipients = db.Column(db.Text, nullable=False)  # JSON list of addresses
+    subject = db.Column(db.String(500), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    reply_to = db.Column(db.String(200), nullable=True)
+    dedupe_key = db.Column(db.String(200), unique=True, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'sending', 'sent', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    send_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    provider_id = db.Column(db.String(100), nullable=True)  # Resend email id
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<OutboxEmail {self.id} {self.status}>'
+
+
+class CachedDocument(db.Model):
+    """
+    Generated document served as-is (e.g. sitemap.xml)
+    Regenerated by a maintenance task instead of on each request
+    """
+    __tablename__ = 'cached_documents'
+
+    name = db.Column(db.String(100), primary_key=True)  # e.g. 'sitemap.xml'
+    content = db.Column(db.Text, nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    generated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CachedDocument {self.name} {self.generated_at}>'
+
+
+class StoredObject(db.Model):
+    """
+    Uploaded file stored once under its SHA-256 (see object_store.py)
+    refcount is the number of records pointing at object_key
+    """
+    __tablename__ = 'stored_objects'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    object_key = db.Column(db.String(255), unique=True, nullable=False)  # e.g. 'objects/ab/ab12...ef.pdf'
+    backend = db.Column(db.String(10), nullable=False)  # 'r2' or 'local'
+    size = db.Column(db.BigInteger, nullable=False)
+    content_type = db.Column(db.String(100), nullable=True)
+    refcount = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StoredObject {self.object_key} x{self.refcount}>'
@@ -0,0 +1,240 @@
+"""
+Content-addressed storage for verification documents
+
+Every verification upload used to get a new name: verification/<doctor>/
+<doc_type>.<ext> in R2, or a random UUID locally. A doctor resubmitting after
+a rejection usually uploads the very same degree certificate and ID scans,
+so identical bytes were stored again on every attempt. The fixed R2 name
+also meant a resubmission overwrote the file an earlier request pointed at.
+
+store() now hashes the upload (SHA-256, read in HASH_CHUNK_SIZE chunks) and
+keys it by content:
+
+    objects/ab/ab12...ef.pdf
+
+One stored_objects row per hash records where the object lives (R2, or the
+upload folder when R2 is unavailable), its size and content type, and how
+many records reference it. Uploading bytes that are already stored only
+increments refcount. release() decrements it and deletes the object once the
+last reference is gone.
+
+The row is locked (SELECT ... FOR UPDATE) while a reference is added or
+released, so dropping the last reference can't delete an object that a
+concurrent upload is about to reuse. Count changes belong to the caller's
+transaction: if the view rolls back, the reference goes with it.
+
+Keys written before this (verification/...) have no row; send() looks them
+up in R2 and then in the upload folder. send() streams documents to admins
+instead of loading them into memory, with Range support for PDF viewers.
+"""
+import os
+import tempfile
+
+from flask import Response, make_response, request, send_file
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+
+import r2_storage
+import upload_utils
+from models import db, StoredObject
+
+
+OBJECT_PREFIX = 'objects'
+TEMP_PREFIX = '.tmp-'
+DOCUMENT_CHUNK_SIZE = 64 * 1024
+# Private documents: browsers may keep them but must revalidate (a cheap 304)
+DOCUMENT_CACHE_CONTROL = 'private, no-cache'
+
+
+def object_key(digest, extension):
+    """Storage key for content with this SHA-256: objects/ab/ab12...ef.pdf"""
+    return f"{OBJECT_PREFIX}/{digest[:2]}/{digest}{extension}"
+
+
+def _extension(filename):
+    return os.path.splitext(secure_filename(filename or ''))[1].lower()[:10]
+
+
+def _locked(**criteria):
+    """The stored_objects row matching criteria, locked until the transaction ends"""
+    return StoredObject.query.filter_by(**criteria)\
+        .with_for_update().populate_existing().one_or_none()
+
+
+def save_verification_document(file, upload_folder):
+    """
+    Validate and store a verification document
+
+    Raises:
+        ValueError: if the upload is not an acceptable document
+
+    Returns:
+        str: object key, or None if it could not be stored
+    """
+    upload_utils.validate_verification_document(file)
+    return store(file, upload_folder)
+
+
+def store(file, upload_folder):
+    """
+    Store an upload, or add a reference to the identical stored object
+
+    Tries R2 first and falls back to upload_folder.
+
+    Returns:
+        str: object key, or None if it could not be stored
+    """
+    digest, size = upload_utils.get_file_hash(file)
+    if digest is None:
+        return None
+
+    existing = _locked(sha256=digest)
+    if existing is not None:
+        existing.refcount += 1
+        print(f"[OBJECTS] {existing.object_key} already stored ({existing.refcount} references)")
+        return existing.object_key
+
+    key = object_key(digest, _extension(file.filename))
+    content_type = file.content_type or 'application/octet-stream'
+    backend = 'r2'
+    if not r2_storage.save_verification_document(file, key, content_type):
+        backend = 'local'
+        if not _save_local(file, key, upload_folder):
+            return None
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(StoredObject(sha256=digest, object_key=key, backend=backend, size=size,
+                                        content_type=content_type, refcount=1))
+    except IntegrityError:
+        # A concurrent upload of the same bytes recorded it first
+        existing = _locked(sha256=digest)
+        existing.refcount += 1
+        if existing.backend != backend:
+            _delete(backend, key, upload_folder)
+        return existing.object_key
+    return key
+
+
+def _save_local(file, key, upload_folder):
+    path = os.path.join(upload_folder, key)
+    if os.path.exists(path):
+        return True  # same key, same bytes
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                file.seek(0)
+                file.save(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    except OSError as e:
+        print(f"[OBJECTS] Could not store {key} locally: {e}")
+        return False
+    return True
+
+
+def _delete(backend, key, upload_folder):
+    if backend == 'r2':
+        return r2_storage.delete_verification_document(key)
+    return upload_utils.delete_verification_document(upload_folder, key)
+
+
+def release(key, upload_folder):
+    """
+    Drop one reference to a stored object, deleting it with the last one
+
+    Call in the transaction that removes the reference and commit right
+    after. Keys without a stored_objects row (written before content
+    addressing) are left alone.
+
+    Returns:
+        bool: True if the object itself was deleted
+    """
+    row = _locked(object_key=key) if key else None
+    if row is None:
+        return False
+    row.refcount -= 1
+    if row.refcount > 0:
+        return False
+    _delete(row.backend, row.object_key, upload_folder)
+    db.session.delete(row)
+    db.session.flush()
+    return True
+
+
+def send(key, upload_folder, mimetype, download_name=None):
+    """
+    Response streaming a stored object (content-addressed or an older
+    verification key) to the browser
+
+    R2 objects are piped through in DOCUMENT_CHUNK_SIZE pieces, so a large
+    scanned PDF never sits in worker memory. A single-range Range header is
+    passed on to R2 and answered with 206, which lets PDF viewers seek and
+    load pages on demand. If-None-Match is checked by R2 against its ETag.
+    Local objects go through send_file: Range, conditional GET and the WSGI
+    server's sendfile.
+
+    Returns:
+        Response, or None if the object is in neither R2 nor the upload folder
+    """
+    row = StoredObject.query.filter_by(object_key=key).one_or_none()
+    backend = row.backend if row else None
+    db.session.commit()  # don't hold the transaction open while streaming
+
+    if backend != 'local':
+        response = _send_r2(key, mimetype, download_name)
+        if response is not None or backend == 'r2':
+            return response
+
+    path = os.path.join(upload_folder, key)
+    if not os.path.isfile(path):
+        return None
+    response = send_file(path, mimetype=mimetype, download_name=download_name or os.path.basename(key),
+                         conditional=True, etag=True, max_age=0)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = DOCUMENT_CACHE_CONTROL
+    return response
+
+
+def _send_r2(key, mimetype, download_name):
+    byte_range = request.range.to_header() if request.range and len(request.range.ranges) == 1 else None
+    if_none_match = request.if_none_match.to_header() if request.if_none_match else None
+    obj = r2_storage.open_verification_document(key, byte_range, if_none_match)
+    if obj is None:
+        return None
+
+    if obj.get('NotModified'):
+        response = make_response('', 304)
+        response.headers['ETag'] = if_none_match
+    elif obj.get('InvalidRange'):
+        response = make_response('', 416)
+        if obj.get('ObjectSize') is not None:
+            response.headers['Content-Range'] = f"bytes */{obj['ObjectSize']}"
+    else:
+        response = Response(_iter_body(obj['Body']), status=206 if obj.get('ContentRange') else 200,
+                            mimetype=mimetype, direct_passthrough=True)
+        response.content_length = obj['ContentLength']
+        if obj.get('ContentRange'):
+            response.headers['Content-Range'] = obj['ContentRange']
+        if obj.get('ETag'):
+            response.headers['ETag'] = obj['ETag']
+        if obj.get('LastModified'):
+            response.last_modified = obj['LastModified']
+        response.headers.set('Content-Disposition', 'inline', filename=download_name or os.path.basename(key))
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Cache-Control'] = DOCUMENT_CACHE_CONTROL
+    return response
+
+
+def _iter_body(body):
+    """Yield an R2 StreamingBody in chunks, returning its connection to the pool at the end"""
+    try:
+        for chunk in iter(lambda: body.read(DOCUMENT_CHUNK_SIZE), b''):
+            yield chunk
+    finally:
+        body.close()
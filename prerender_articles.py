@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Pre-render Markdown for all articles
+
+Fills Article.content_html / content_toc / content_hash for rows created before
+migration 014 (or edited with raw SQL). New saves are rendered automatically.
+
+Usage:
+    python prerender_articles.py
+"""
+from app import app, db
+from models import Article
+import article_render
+
+
+def main():
+    with app.app_context():
+        articles = Article.query.all()
+        rendered = 0
+        for article in articles:
+            if article_render.prerender_article(article):
+                rendered += 1
+        db.session.commit()
+        print(f"Rendered {rendered} of {len(articles)} articles ({len(articles) - rendered} already current)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+"""
+Cached QR codes for doctor profiles
+
+generate_qr_code, preview_printable_qr and generate_printable_qr rebuilt the
+QR matrix (ERROR_CORRECT_H) and redrew the printable card, fonts and all,
+on every request, although the profile URL behind them rarely changes. The
+rendered PNGs are now kept under instance/qr_cache/, one directory per slug:
+
+    qr_cache/<slug>/qr-10-<fingerprint>.png          plain QR, box size 10
+    qr_cache/<slug>/printable-1240-<fingerprint>.png  printable card
+
+The fingerprint hashes everything drawn into the image: profile URL, and for
+the card the name, specialty and city (plus RENDER_VERSION). The URL is
+always built from SITE_URL, never the request's Host header, so requests and
+pregeneration agree on the file and a forged Host can't add cache entries. A changed name
+therefore yields a new file, and the older one for that variant and size is
+removed when it is written. A changed slug means a new directory;
+invalidate() drops the old one.
+
+Responses carry the fingerprint as ETag. The dashboard links them with
+?v=<fingerprint> (the qr_version template global), and a request whose v
+matches is marked immutable, so the browser never asks again until the
+image actually changes.
+
+The cache is per container (like media_cache). Files are written atomically
+and rendered on first request, or ahead of time for every verified doctor:
+
+    flask --app app qr pregenerate [--workers 4] [--force]
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+import click
+import qrcode
+from flask import current_app, make_response, request, send_from_directory
+from flask.cli import AppGroup
+from PIL import Image, ImageDraw, ImageFont
+from werkzeug.utils import secure_filename
+
+from sitemap import SITE_URL
+
+
+RENDER_VERSION = 1  # bump when the drawing below changes
+QR_BOX_SIZES = (5, 10, 20)
+DEFAULT_BOX_SIZE = 10
+PRINTABLE_SIZE = (1240, 1754)  # A4 proportions at half of 300 DPI
+VARIANTS = ('qr', 'printable')
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'private, no-cache'
+PREGENERATE_WORKERS = min(4, os.cpu_count() or 1)
+TEMP_PREFIX = '.tmp-'
+
+FONT_BOLD = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+FONT_REGULAR = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+_state = {'dir': None}
+
+
+def init_app(app):
+    """Keep the cache under the app's instance folder and register `flask qr`"""
+    _state['dir'] = os.path.join(app.instance_path, 'qr_cache')
+    app.add_template_global(version_for, 'qr_version')
+    app.cli.add_command(qr_cli)
+
+
+def cache_dir():
+    return _state['dir']
+
+
+def profile_url(slug):
+    """Public profile URL encoded in the QR"""
+    return f"{SITE_URL.rstrip('/')}/doctor/{slug}"
+
+
+def _size(variant, size):
+    if variant == 'printable':
+        return PRINTABLE_SIZE[0]
+    return size if size in QR_BOX_SIZES else DEFAULT_BOX_SIZE
+
+
+def render_inputs(doctor, variant, size=None):
+    """Everything drawn into an image, as a tuple of plain values (picklable for the pool)"""
+    size = _size(variant, size)
+    url = profile_url(doctor.slug)
+    if variant == 'qr':
+        return (doctor.slug, variant, size, url)
+    subtitle = ' • '.join(filter(None, [doctor.specialty.name if doctor.specialty else None,
+                                        doctor.city.name if doctor.city else None]))
+    return (doctor.slug, variant, size, url, doctor.name or "Doctor", subtitle)
+
+
+def fingerprint(inputs):
+    raw = '\x1f'.join(str(value) for value in (RENDER_VERSION,) + inputs)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def version_for(doctor, variant='qr', size=None):
+    """Fingerprint of a doctor's current image (template global qr_version)"""
+    return fingerprint(render_inputs(doctor, variant, size))
+
+
+def _relative_path(inputs):
+    slug, variant, size = inputs[:3]
+    return os.path.join(secure_filename(slug), f"{variant}-{size}-{fingerprint(inputs)}.png")
+
+
+def _make_qr(url, box_size, border, fill_color):
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr.make_image(fill_color=fill_color, back_color="white")
+
+
+@lru_cache(maxsize=1)
+def _fonts():
+    """(title, name, body, small) fonts, loaded once per process"""
+    try:
+        return (ImageFont.truetype(FONT_BOLD, 60), ImageFont.truetype(FONT_BOLD, 50),
+                ImageFont.truetype(FONT_REGULAR, 35), ImageFont.truetype(FONT_REGULAR, 28))
+    except OSError:
+        default = ImageFont.load_default()
+        return default, default, default, default
+
+
+def _render_printable(url, doctor_name, subtitle):
+    """The printable 'scan to review' card"""
+    width, height = PRINTABLE_SIZE
+    template = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(template)
+    title_font, name_font, body_font, small_font = _fonts()
+
+    # Branding and doctor
+    draw.text((620, 80), "RankSewa", font=title_font, fill='#0D8ABC', anchor='mm')
+    draw.text((620, 150), "Nepal's Doctor Directory", font=small_font, fill='#64748b', anchor='mm')
+    draw.rectangle([(120, 200), (1120, 205)], fill='#0D8ABC')
+    draw.text((620, 280), doctor_name, font=name_font, fill='#0f172a', anchor='mm')
+    draw.text((620, 340), subtitle, font=body_font, fill='#64748b', anchor='mm')
+
+    qr_size = 600
+    qr_img = _make_qr(url, 10, 2, "#0D8ABC").get_image().convert('RGB')
+    template.paste(qr_img.resize((qr_size, qr_size), Image.Resampling.LANCZOS), ((width - qr_size) // 2, 450))
+
+    # Call to action and instructions
+    draw.text((620, 1100), "Scan to Rate Your Experience", font=body_font, fill='#0f172a', anchor='mm')
+    draw.text((620, 1160), "Share your feedback and help other patients", font=small_font, fill='#64748b', anchor='mm')
+    instructions = [
+        "1. Open your phone's camera app",
+        "2. Point it at this QR code",
+        "3. Tap the notification to visit profile",
+        "4. Write your review"
+    ]
+    for i, instruction in enumerate(instructions):
+        draw.text((620, 1250 + i * 45), instruction, font=small_font, fill='#64748b', anchor='mm')
+
+    # Footer
+    draw.rectangle([(120, 1550), (1120, 1555)], fill='#0D8ABC')
+    draw.text((620, 1620), "Thank you for your feedback!", font=body_font, fill='#0D8ABC', anchor='mm')
+    draw.text((620, 1680), url, font=small_font, fill='#94a3b8', anchor='mm')
+    return template
+
+
+def render(inputs, directory):
+    """
+    Render an image into the cache (a pregeneration worker's unit of work)
+
+    Writes to a temporary file and renames it into place, then removes older
+    renders of the same variant and size for the slug.
+
+    Returns:
+        str: path relative to the cache directory
+    """
+    slug, variant, size, url = inputs[:4]
+    if variant == 'qr':
+        img = _make_qr(url, size, 4, "black")
+    else:
+        img = _render_printable(url, *inputs[4:])
+
+    relative = _relative_path(inputs)
+    path = os.path.join(directory, relative)
+    slug_dir = os.path.dirname(path)
+    os.makedirs(slug_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=slug_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            img.save(f, 'PNG')
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+    prefix = f"{variant}-{size}-"
+    for entry in os.scandir(slug_dir):
+        if entry.name.startswith(prefix) and entry.path != path:
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+    return relative
+
+
+def cached_path(inputs, directory=None):
+    """Relative path of the cached image for inputs, rendering it on a miss"""
+    directory = directory or _state['dir']
+    relative = _relative_path(inputs)
+    if os.path.exists(os.path.join(directory, relative)):
+        return relative
+    return render(inputs, directory)
+
+
+def send(doctor, variant, size=None, download_name=None, as_attachment=False):
+    """
+    Response with a doctor's QR image from the cache
+
+    304 for a matching If-None-Match. Immutable caching when the request's
+    ?v= names the current version, otherwise the browser revalidates.
+    """
+    inputs = render_inputs(doctor, variant, size)
+    etag = fingerprint(inputs)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = send_from_directory(_state['dir'], cached_path(inputs), mimetype='image/png', etag=False,
+                                       as_attachment=as_attachment, download_name=download_name)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = (IMMUTABLE_CACHE_CONTROL if request.args.get('v') == etag
+                                         else REVALIDATE_CACHE_CONTROL)
+    return response
+
+
+def invalidate(slug):
+    """Drop every cached image for a slug (after the doctor's slug changed)"""
+    if not slug or not _state['dir']:
+        return
+    shutil.rmtree(os.path.join(_state['dir'], secure_filename(slug)), ignore_errors=True)
+
+
+def pregenerate(workers=PREGENERATE_WORKERS, force=False):
+    """
+    Render the plain QR and printable card of every verified doctor
+
+    Rendering is CPU-bound, so images are spread over a process pool;
+    workers only write files.
+
+    Returns:
+        (rendered, skipped, failed) counts
+    """
+    from sqlalchemy.orm import joinedload
+    from models import Doctor
+
+    directory = _state['dir']
+    jobs = []
+    doctors = Doctor.query.filter_by(is_verified=True, is_active=True)\
+        .options(joinedload(Doctor.specialty), joinedload(Doctor.city)).order_by(Doctor.id)
+    for doctor in doctors:
+        for variant in VARIANTS:
+            inputs = render_inputs(doctor, variant)
+            jobs.append(inputs)
+    todo = [inputs for inputs in jobs
+            if force or not os.path.exists(os.path.join(directory, _relative_path(inputs)))]
+    rendered, failed = 0, 0
+    if not todo:
+        return 0, len(jobs), 0
+
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(render, inputs, directory): inputs for inputs in todo}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                rendered += 1
+            except Exception as e:
+                failed += 1
+                print(f"[QR] {futures[future][0]} {futures[future][1]}: {type(e).__name__}: {e}")
+    return rendered, len(jobs) - len(todo), failed
+
+
+qr_cli = AppGroup('qr', help='Doctor profile QR codes')
+
+
+@qr_cli.command('pregenerate')
+@click.option('--workers', type=int, default=PREGENERATE_WORKERS, show_default=True, help='Worker processes')
+@click.option('--force', is_flag=True, help='Render again even if cached')
+def pregenerate_command(workers, force):
+    """Render QR codes and printable cards for all verified doctors (URLs from SITE_URL)"""
+    rendered, skipped, failed = pregenerate(workers=workers, force=force)
+    print(f"Rendered {rendered} images, {skipped} already cached, {failed} failed "
+          f"({current_app.instance_path}/qr_cache)")
+
+
+@qr_cli.command('clear')
+def clear_command():
+    """Empty the QR cache"""
+    shutil.rmtree(_state['dir'], ignore_errors=True)
+    print("QR cache cleared")
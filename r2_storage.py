@@ -1,16 +1,40 @@
 """
 Cloudflare R2 Storage Utility
 Handles file uploads and downloads to/from Cloudflare R2
+
+The helpers below share one R2Storage per process (get_storage()), created on
+first use from the R2_* environment variables. Its boto3 client keeps a
+connection pool of R2_MAX_POOL_CONNECTIONS and retries throttling/5xx errors,
+so a photo request no longer pays for a new client and TLS connection. The
+client is rebuilt after a fork (gunicorn workers must not share sockets).
+
+R2_BACKEND=memory (or set_storage(R2Storage.in_memory())) keeps objects in a
+dict instead - for tests and local development without R2 credentials.
 """
+import hashlib
 import os
+import threading
+from io import BytesIO
+from urllib.parse import quote
+
 import boto3
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError
-from werkzeug.utils import secure_filename
+
+import media_cache
+
+
+R2_MAX_POOL_CONNECTIONS = int(os.getenv('R2_MAX_POOL_CONNECTIONS', '20'))
+R2_MAX_ATTEMPTS = int(os.getenv('R2_MAX_ATTEMPTS', '3'))
+R2_CONNECT_TIMEOUT = 5  # seconds
+R2_READ_TIMEOUT = 15
+DEFAULT_BUCKET = 'ranksewa-documents'
+R2_PUBLIC_URL = os.getenv('R2_PUBLIC_URL', '').strip().rstrip('/')  # public bucket / CDN domain, if any
 
 class R2Storage:
     """Cloudflare R2 Storage Manager"""
 
-    def __init__(self, access_key_id, secret_access_key, endpoint_url, bucket_name):
+    def __init__(self, access_key_id, secret_access_key, endpoint_url, bucket_name, client=None):
         """
         Initialize R2 client
 
@@ -19,21 +43,30 @@ class R2Storage:
             secret_access_key: R2 Secret Access Key
             endpoint_url: R2 Endpoint URL
             bucket_name: R2 Bucket Name
+            client: S3-compatible client to use instead of creating one (e.g. MemoryS3Client)
         """
         self.bucket_name = bucket_name
 
+        if client is not None:
+            self.s3_client = client
+            return
+
         # Initialize S3-compatible client for R2
         # R2 requires specific config to work with boto3
-        from botocore.config import Config as BotoConfig
-
         boto_config = BotoConfig(
             signature_version='s3v4',
             s3={
                 'addressing_style': 'path'
-            }
+            },
+            max_pool_connections=R2_MAX_POOL_CONNECTIONS,
+            retries={'max_attempts': R2_MAX_ATTEMPTS, 'mode': 'standard'},
+            connect_timeout=R2_CONNECT_TIMEOUT,
+            read_timeout=R2_READ_TIMEOUT,
+            tcp_keepalive=True,
         )
 
-        self.s3_client = boto3.client(
+        # A private session: boto3's default session is not thread-safe
+        self.s3_client = boto3.session.Session().client(
             's3',
             endpoint_url=endpoint_url,
             aws_access_key_id=access_key_id,
@@ -42,6 +75,11 @@ class R2Storage:
             config=boto_config
         )
 
+    @classmethod
+    def in_memory(cls, bucket_name=DEFAULT_BUCKET):
+        """R2Storage backed by a MemoryS3Client (no network)"""
+        return cls(None, None, None, bucket_name, client=MemoryS3Client())
+
     def upload_file(self, file_obj, object_name, content_type=None):
         """
         Upload a file to R2
@@ -159,6 +197,68 @@ class R2Storage:
             print(f"Error getting file from R2: {e}")
             return None
 
+    def open_object(self, object_name, byte_range=None, if_none_match=None):
+        """
+        Start a GET of an object without reading its body
+
+        Args:
+            object_name: S3 object name (path in bucket)
+            byte_range: Range header value, e.g. 'bytes=0-65535' (optional)
+            if_none_match: ETag the client already has (optional)
+
+        Returns:
+            dict: the get_object response ('Body' is a StreamingBody to read
+            in chunks and close; 'ContentRange' is set for a range),
+            {'NotModified': True}, {'InvalidRange': True, 'ObjectSize': size}
+            (size None if unknown), or None if the object is missing or R2 failed
+        """
+        params = {'Bucket': self.bucket_name, 'Key': object_name}
+        if byte_range:
+            params['Range'] = byte_range
+        if if_none_match:
+            params['IfNoneMatch'] = if_none_match
+        try:
+            return self.s3_client.get_object(**params)
+        except ClientError as e:
+            error_code = e.response.get('Error', {}).get('Code', 'Unknown')
+            if error_code in ('304', 'NotModified'):
+                return {'NotModified': True}
+            if error_code == 'InvalidRange':
+                return {'InvalidRange': True, 'ObjectSize': self._object_size(object_name, e)}
+            print(f"Error opening file from R2: {e}")
+            return None
+
+    def _object_size(self, object_name, error):
+        """Object size for a 416's Content-Range: from the InvalidRange error, else a HEAD"""
+        size = error.response.get('Error', {}).get('ActualObjectSize')
+        if size is not None:
+            return int(size)
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket_name, Key=object_name)['ContentLength']
+        except ClientError:
+            return None
+
+    def presigned_url(self, object_name, expires_in):
+        """
+        Short-lived signed GET URL for an object (no request to R2 is made)
+
+        Args:
+            object_name: S3 object name (path in bucket)
+            expires_in: URL lifetime in seconds
+
+        Returns:
+            str: URL, or None if signing failed
+        """
+        try:
+            return self.s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.bucket_name, 'Key': object_name},
+                ExpiresIn=expires_in
+            )
+        except Exception as e:
+            print(f"[R2] Error signing URL for {object_name}: {e}")
+            return None
+
     def delete_file(self, object_name):
         """
         Delete a file from R2
@@ -201,57 +301,191 @@ class R2Storage:
             return False
 
 
-def save_verification_document(file, doctor_id, doc_type):
+
+class MemoryS3Client:
     """
-    Save verification document to R2
+    In-memory stand-in for the boto3 S3 client calls R2Storage makes
 
-    Args:
-        file: File object from request.files
-        doctor_id: Doctor ID or temp ID
-        doc_type: Type of document (medical_degree, govt_id, practice_license)
+    Missing keys raise the same ClientError codes as S3 ('NoSuchKey', '404').
+    """
+
+    def __init__(self):
+        self.objects = {}  # (bucket, key) -> {'body': bytes, 'content_type': str}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _missing(self, code, operation):
+        return ClientError({'Error': {'Code': code, 'Message': 'Not Found'}}, operation)
+
+    def upload_fileobj(self, file_obj, bucket, key, ExtraArgs=None):
+        self.put_object(Bucket=bucket, Key=key, Body=file_obj.read(),
+                        ContentType=(ExtraArgs or {}).get('ContentType'))
+
+    def upload_file(self, file_path, bucket, key, ExtraArgs=None):
+        with open(file_path, 'rb') as f:
+            self.upload_fileobj(f, bucket, key, ExtraArgs)
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        with self._lock:
+            self.calls += 1
+            self.objects[(Bucket, Key)] = {
+                'body': Body if isinstance(Body, bytes) else Body.read(),
+                'content_type': ContentType or 'binary/octet-stream',
+            }
+        return {}
+
+    def get_object(self, Bucket, Key, Range=None, IfNoneMatch=None):
+        with self._lock:
+            self.calls += 1
+            stored = self.objects.get((Bucket, Key))
+        if stored is None:
+            raise self._missing('NoSuchKey', 'GetObject')
+        body, etag = stored['body'], f'"{hashlib.md5(stored["body"]).hexdigest()}"'
+        if IfNoneMatch and IfNoneMatch.strip('"') == etag.strip('"'):
+            raise ClientError({'Error': {'Code': '304', 'Message': 'Not Modified'}}, 'GetObject')
+        response = {'ContentType': stored['content_type'], 'ETag': etag}
+        if Range:
+            start, end = self._byte_range(Range, len(body))
+            response['ContentRange'] = f'bytes {start}-{end}/{len(body)}'
+            body = body[start:end + 1]
+        response.update({'Body': BytesIO(body), 'ContentLength': len(body)})
+        return response
+
+    def _byte_range(self, header, size):
+        """(first, last) byte of a single 'bytes=' range, as S3 resolves it"""
+        first, _, last = header.split('=', 1)[1].partition('-')
+        if not first:
+            first, last = max(0, size - int(last)), size - 1
+        else:
+            first, last = int(first), min(int(last), size - 1) if last else size - 1
+        if first >= size or first > last:
+            raise ClientError({'Error': {'Code': 'InvalidRange', 'Message': 'Range Not Satisfiable',
+                                         'ActualObjectSize': str(size)}}, 'GetObject')
+        return first, last
+
+    def head_object(self, Bucket, Key):
+        with self._lock:
+            self.calls += 1
+            stored = self.objects.get((Bucket, Key))
+        if stored is None:
+            raise self._missing('404', 'HeadObject')
+        return {'ContentLength': len(stored['body']), 'ContentType': stored['content_type']}
+
+    def download_file(self, Bucket, Key, Filename):
+        with open(Filename, 'wb') as f:
+            f.write(self.get_object(Bucket=Bucket, Key=Key)['Body'].read())
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self.calls += 1
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"memory://{Params['Bucket']}/{quote(Params['Key'])}?expires_in={ExpiresIn}"
+
+
+_storage = {'current': None, 'pid': None, 'override': None}
+_storage_lock = threading.Lock()
+
+
+def _credentials():
+    """(access_key_id, secret_access_key, endpoint_url, bucket_name) from the environment, stripped"""
+    return (
+        os.getenv('R2_ACCESS_KEY_ID', '').strip(),
+        os.getenv('R2_SECRET_ACCESS_KEY', '').strip(),
+        os.getenv('R2_ENDPOINT_URL', '').strip(),
+        os.getenv('R2_BUCKET_NAME', DEFAULT_BUCKET).strip(),
+    )
+
+
+def is_configured():
+    """Whether R2 credentials (or the in-memory backend) are available"""
+    if _storage['override'] is not None or os.getenv('R2_BACKEND') == 'memory':
+        return True
+    access_key_id, secret_access_key, endpoint_url, _ = _credentials()
+    return all([access_key_id, secret_access_key, endpoint_url])
+
+
+def get_storage():
+    """
+    The process-wide R2Storage, created on first use (and again after a fork)
 
     Returns:
-        str: R2 object path if successful, None otherwise
+        R2Storage, or None if R2 is not configured
     """
-    # Get R2 credentials from environment (strip whitespace/newlines)
-    access_key_id = os.getenv('R2_ACCESS_KEY_ID', '').strip()
-    secret_access_key = os.getenv('R2_SECRET_ACCESS_KEY', '').strip()
-    endpoint_url = os.getenv('R2_ENDPOINT_URL', '').strip()
-    bucket_name = os.getenv('R2_BUCKET_NAME', 'ranksewa-documents').strip()
-
-    # Check if R2 is configured (all values must be non-empty after stripping)
-    if not all([access_key_id, secret_access_key, endpoint_url]):
-        print("[R2] Credentials not configured, falling back to local storage")
+    if _storage['override'] is not None:
+        return _storage['override']
+
+    pid = os.getpid()
+    if _storage['pid'] == pid:
+        return _storage['current']
+
+    with _storage_lock:
+        if _storage['pid'] != pid:
+            access_key_id, secret_access_key, endpoint_url, bucket_name = _credentials()
+            if os.getenv('R2_BACKEND') == 'memory':
+                storage = R2Storage.in_memory(bucket_name)
+            elif all([access_key_id, secret_access_key, endpoint_url]):
+                print(f"[R2] Initializing with bucket: {bucket_name}, endpoint: {endpoint_url}")
+                storage = R2Storage(access_key_id, secret_access_key, endpoint_url, bucket_name)
+            else:
+                storage = None
+            _storage['current'] = storage
+            _storage['pid'] = pid
+    return _storage['current']
+
+
+def public_url(object_name):
+    """URL of an object under R2_PUBLIC_URL (public bucket or CDN), or None if not configured"""
+    if not R2_PUBLIC_URL:
         return None
+    return f"{R2_PUBLIC_URL}/{quote(object_name)}"
+
+
+def set_storage(storage):
+    """Use `storage` in this process (None goes back to the environment default); returns the previous one"""
+    previous = _storage['override']
+    _storage['override'] = storage
+    return previous
 
-    print(f"[R2] Initializing with bucket: {bucket_name}, endpoint: {endpoint_url}")
 
-    # Initialize R2 client
+def _storage_or_none(purpose=None):
+    """get_storage(), logging (instead of raising) when R2 is unavailable"""
     try:
-        r2 = R2Storage(access_key_id, secret_access_key, endpoint_url, bucket_name)
+        r2 = get_storage()
     except Exception as e:
         print(f"[R2] Failed to initialize R2Storage: {type(e).__name__}: {e}")
         return None
+    if r2 is None and purpose:
+        print(f"[R2] Credentials not configured for {purpose}, falling back to local storage")
+    return r2
+
+
+def save_verification_document(file, object_name, content_type=None):
+    """
+    Save verification document to R2
 
-    # Generate secure filename
-    filename = secure_filename(file.filename)
-    file_ext = os.path.splitext(filename)[1]
+    Args:
+        file: File object from request.files
+        object_name: R2 object path (object_store picks content-addressed keys)
+        content_type: MIME type (defaults to the upload's)
 
-    # Create R2 object path: verification/{doctor_id}/{doc_type}{ext}
-    object_name = f"verification/{doctor_id}/{doc_type}{file_ext}"
+    Returns:
+        str: R2 object path if successful, None otherwise
+    """
+    r2 = _storage_or_none('verification document upload')
+    if r2 is None:
+        return None
 
     # Determine content type
-    content_type = file.content_type or 'application/octet-stream'
+    content_type = content_type or file.content_type or 'application/octet-stream'
 
     # Reset file pointer to beginning
     file.seek(0)
 
     # Upload to R2
-    result = r2.upload_file(file, object_name, content_type)
-
-    if result:
-        return object_name
-    return None
+    return r2.upload_file(file, object_name, content_type)
 
 
 def get_verification_document(object_name):
@@ -264,21 +498,23 @@ def get_verification_document(object_name):
     Returns:
         bytes: File content if successful, None otherwise
     """
-    # Get R2 credentials from environment (strip whitespace/newlines)
-    access_key_id = os.getenv('R2_ACCESS_KEY_ID', '').strip()
-    secret_access_key = os.getenv('R2_SECRET_ACCESS_KEY', '').strip()
-    endpoint_url = os.getenv('R2_ENDPOINT_URL', '').strip()
-    bucket_name = os.getenv('R2_BUCKET_NAME', 'ranksewa-documents').strip()
-
-    # Check if R2 is configured
-    if not all([access_key_id, secret_access_key, endpoint_url]):
+    r2 = _storage_or_none()
+    if r2 is None:
         return None
+    return r2.get_file_object(object_name)
 
-    # Initialize R2 client
-    r2 = R2Storage(access_key_id, secret_access_key, endpoint_url, bucket_name)
 
-    # Get file from R2
-    return r2.get_file_object(object_name)
+def open_verification_document(object_name, byte_range=None, if_none_match=None):
+    """
+    Start streaming a verification document from R2 (see R2Storage.open_object)
+
+    Returns:
+        dict or None, as R2Storage.open_object
+    """
+    r2 = _storage_or_none()
+    if r2 is None:
+        return None
+    return r2.open_object(object_name, byte_range, if_none_match)
 
 
 def delete_verification_document(object_name):
@@ -291,53 +527,27 @@ def delete_verification_document(object_name):
     Returns:
         bool: True if successful, False otherwise
     """
-    # Get R2 credentials from environment (strip whitespace/newlines)
-    access_key_id = os.getenv('R2_ACCESS_KEY_ID', '').strip()
-    secret_access_key = os.getenv('R2_SECRET_ACCESS_KEY', '').strip()
-    endpoint_url = os.getenv('R2_ENDPOINT_URL', '').strip()
-    bucket_name = os.getenv('R2_BUCKET_NAME', 'ranksewa-documents').strip()
-
-    # Check if R2 is configured
-    if not all([access_key_id, secret_access_key, endpoint_url]):
+    r2 = _storage_or_none()
+    if r2 is None:
         return False
-
-    # Initialize R2 client
-    r2 = R2Storage(access_key_id, secret_access_key, endpoint_url, bucket_name)
-
-    # Delete file from R2
     return r2.delete_file(object_name)
 
 
-def save_profile_photo(file_obj, doctor_id, filename):
+def save_profile_photo(file_obj, doctor_id, filename, content_type='image/jpeg'):
     """
-    Save profile photo to R2
+    Save profile photo (or one of its image_variants renditions) to R2
 
     Args:
         file_obj: File object (can be BytesIO from PIL or file from request.files)
         doctor_id: Doctor ID
         filename: Filename to use
+        content_type: MIME type (renditions may be image/webp)
 
     Returns:
         str: R2 object path if successful, None otherwise
     """
-    # Get R2 credentials from environment (strip whitespace/newlines)
-    access_key_id = os.getenv('R2_ACCESS_KEY_ID', '').strip()
-    secret_access_key = os.getenv('R2_SECRET_ACCESS_KEY', '').strip()
-    endpoint_url = os.getenv('R2_ENDPOINT_URL', '').strip()
-    bucket_name = os.getenv('R2_BUCKET_NAME', 'ranksewa-documents').strip()
-
-    # Check if R2 is configured (all values must be non-empty after stripping)
-    if not all([access_key_id, secret_access_key, endpoint_url]):
-        print("[R2] Credentials not configured for photo upload, falling back to local storage")
-        return None
-
-    print(f"[R2] Initializing for photo upload: {filename}")
-
-    # Initialize R2 client
-    try:
-        r2 = R2Storage(access_key_id, secret_access_key, endpoint_url, bucket_name)
-    except Exception as e:
-        print(f"[R2] Failed to initialize R2Storage for photo: {type(e).__name__}: {e}")
+    r2 = _storage_or_none('photo upload')
+    if r2 is None:
         return None
 
     # Create R2 object path: photos/{doctor_id}/{filename}
@@ -350,13 +560,34 @@ def save_profile_photo(file_obj, doctor_id, filename):
         pass  # File might not support seek
 
     # Upload to R2
-    result = r2.upload_file(file_obj, object_name, 'image/jpeg')
+    result = r2.upload_file(file_obj, object_name, content_type)
 
     if result:
+        media_cache.invalidate(object_name)
         return object_name
     return None
 
 
+def get_profile_photo(object_name):
+    """
+    Get profile photo from R2
+
+    Args:
+        object_name: R2 object path
+
+    Returns:
+        bytes: File content if successful, None otherwise
+    """
+    r2 = _storage_or_none()
+    if r2 is None:
+        return None
+    try:
+        return r2.get_file_object(object_name)
+    except Exception as e:
+        print(f"[R2] Error getting photo: {e}")
+        return None
+
+
 def delete_profile_photo(object_name):
     """
     Delete profile photo from R2
@@ -367,19 +598,11 @@ def delete_profile_photo(object_name):
     Returns:
         bool: True if successful, False otherwise
     """
-    # Get R2 credentials from environment
-    access_key_id = os.getenv('R2_ACCESS_KEY_ID', '').strip()
-    secret_access_key = os.getenv('R2_SECRET_ACCESS_KEY', '').strip()
-    endpoint_url = os.getenv('R2_ENDPOINT_URL', '').strip()
-    bucket_name = os.getenv('R2_BUCKET_NAME', 'ranksewa-documents').strip()
-
-    # Check if R2 is configured
-    if not all([access_key_id, secret_access_key, endpoint_url]):
+    r2 = _storage_or_none()
+    if r2 is None:
         return False
-
-    # Initialize R2 client
+    media_cache.invalidate(object_name)
     try:
-        r2 = R2Storage(access_key_id, secret_access_key, endpoint_url, bucket_name)
         return r2.delete_file(object_name)
     except Exception as e:
         print(f"[R2] Error deleting photo: {e}")
@@ -398,24 +621,8 @@ def save_clinic_logo(file_obj, clinic_id, filename):
     Returns:
         str: R2 object path if successful, None otherwise
     """
-    # Get R2 credentials from environment
-    access_key_id = os.getenv('R2_ACCESS_KEY_ID', '').strip()
-    secret_access_key = os.getenv('R2_SECRET_ACCESS_KEY', '').strip()
-    endpoint_url = os.getenv('R2_ENDPOINT_URL', '').strip()
-    bucket_name = os.getenv('R2_BUCKET_NAME', 'ranksewa-documents').strip()
-
-    # Check if R2 is configured
-    if not all([access_key_id, secret_access_key, endpoint_url]):
-        print("[R2] Credentials not configured for clinic logo upload, falling back to local storage")
-        return None
-
-    print(f"[R2] Initializing for clinic logo upload: {filename}")
-
-    # Initialize R2 client
-    try:
-        r2 = R2Storage(access_key_id, secret_access_key, endpoint_url, bucket_name)
-    except Exception as e:
-        print(f"[R2] Failed to initialize R2Storage for clinic logo: {type(e).__name__}: {e}")
+    r2 = _storage_or_none('clinic logo upload')
+    if r2 is None:
         return None
 
     # Create R2 object path: clinic_logos/{clinic_id}/{filename}
@@ -431,6 +638,7 @@ def save_clinic_logo(file_obj, clinic_id, filename):
     result = r2.upload_file(file_obj, object_name, 'image/jpeg')
 
     if result:
+        media_cache.invalidate(object_name)
         return object_name
     return None
 
@@ -445,19 +653,11 @@ def delete_clinic_logo(object_name):
     Returns:
         bool: True if successful, False otherwise
     """
-    # Get R2 credentials from environment
-    access_key_id = os.getenv('R2_ACCESS_KEY_ID', '').strip()
-    secret_access_key = os.getenv('R2_SECRET_ACCESS_KEY', '').strip()
-    endpoint_url = os.getenv('R2_ENDPOINT_URL', '').strip()
-    bucket_name = os.getenv('R2_BUCKET_NAME', 'ranksewa-documents').strip()
-
-    # Check if R2 is configured
-    if not all([access_key_id, secret_access_key, endpoint_url]):
+    r2 = _storage_or_none()
+    if r2 is None:
         return False
-
-    # Initialize R2 client
+    media_cache.invalidate(object_name)
     try:
-        r2 = R2Storage(access_key_id, secret_access_key, endpoint_url, bucket_name)
         return r2.delete_file(object_name)
     except Exception as e:
         print(f"[R2] Error deleting clinic logo: {e}")
@@ -474,20 +674,49 @@ def get_clinic_logo(object_name):
     Returns:
         bytes: File content if successful, None otherwise
     """
-    # Get R2 credentials from environment
-    access_key_id = os.getenv('R2_ACCESS_KEY_ID', '').strip()
-    secret_access_key = os.getenv('R2_SECRET_ACCESS_KEY', '').strip()
-    endpoint_url = os.getenv('R2_ENDPOINT_URL', '').strip()
-    bucket_name = os.getenv('R2_BUCKET_NAME', 'ranksewa-documents').strip()
-
-    # Check if R2 is configured
-    if not all([access_key_id, secret_access_key, endpoint_url]):
+    r2 = _storage_or_none()
+    if r2 is None:
         return None
-
-    # Initialize R2 client
     try:
-        r2 = R2Storage(access_key_id, secret_access_key, endpoint_url, bucket_name)
         return r2.get_file_object(object_name)
     except Exception as e:
         print(f"[R2] Error getting clinic logo: {e}")
         return None
+
+
+def save_share_image(file_obj, object_name):
+    """
+    Save a doctor's Open Graph share image to R2
+
+    Args:
+        file_obj: JPEG bytes as a file object
+        object_name: R2 object path (share/{doctor_id}/{fingerprint}.jpg)
+
+    Returns:
+        str: R2 object path if successful, None otherwise
+    """
+    r2 = _storage_or_none('share image upload')
+    if r2 is None:
+        return None
+    result = r2.upload_file(file_obj, object_name, 'image/jpeg')
+    if result:
+        media_cache.invalidate(object_name)
+    return result
+
+
+def delete_share_image(object_name):
+    """
+    Delete a share image from R2
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    r2 = _storage_or_none()
+    if r2 is None:
+        return False
+    media_cache.invalidate(object_name)
+    try:
+        return r2.delete_file(object_name)
+    except Exception as e:
+        print(f"[R2] Error deleting share image: {e}")
+        return False
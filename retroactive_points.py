@@ -1,10 +1,21 @@
 """
 Script to retroactively award points and badges to existing reviewers
 Run this once after the migration to give credit to early adopters
+
+Usage:
+    python retroactive_points.py            # per-user loop with progress output
+    python retroactive_points.py --batch    # set-based UPDATE/INSERT for all users at once
 """
+import argparse
+import time
+
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import aliased
+
 from app import app, db
 from models import User, Rating
-from gamification import process_new_review, check_and_award_badges, award_points
+from gamification import (process_new_review, check_and_award_badges, award_points, recalculate_user_counters,
+                          award_badges_bulk, DETAILED_REVIEW_LENGTH, POINTS)
 
 
 def award_retroactive_points():
@@ -17,6 +28,9 @@ def award_retroactive_points():
 
         print(f"Found {len(users_with_reviews)} users with existing reviews\n")
 
+        # Badge rules read the stored counters - make sure they reflect all reviews
+        recalculate_user_counters([u.id for u in users_with_reviews])
+
         for user in users_with_reviews:
             print(f"Processing {user.name} ({user.email})...")
 
@@ -45,7 +59,7 @@ def award_retroactive_points():
             # Check and award badges
             badges_earned = check_and_award_badges(user, db_commit=False)
             if badges_earned:
-                badge_names = [b.badge_definition.name for b in badges_earned]
+                badge_names = [b['name'] for b in badges_earned]
                 print(f"  → Badges unlocked: {', '.join(badge_names)}")
 
             db.session.commit()
@@ -56,5 +70,49 @@ def award_retroactive_points():
         print(f"- Total points distributed: {sum(u.points for u in users_with_reviews)}")
 
 
+def award_retroactive_points_batch():
+    """Same awards as award_retroactive_points(), computed set-based for every reviewer"""
+    with app.app_context():
+        print("🔄 Awarding retroactive points (batch mode)...")
+        start = time.perf_counter()
+
+        recalculate_user_counters()
+
+        # Points per review: base + detailed bonus + bonus if no earlier review of that doctor exists
+        earlier = aliased(Rating)
+        earlier_review = db.session.query(earlier.id).filter(
+            earlier.doctor_id == Rating.doctor_id,
+            or_(earlier.created_at < Rating.created_at,
+                and_(earlier.created_at == Rating.created_at, earlier.id < Rating.id))
+        ).exists()
+        review_points = (
+            POINTS['review']
+            + case((func.length(Rating.comment) >= DETAILED_REVIEW_LENGTH, POINTS['detailed_review']), else_=0)
+            + case((earlier_review, 0), else_=POINTS['first_review_bonus'])
+        )
+        has_reviews = db.session.query(Rating.id).filter(Rating.user_id == User.id).exists()
+        updated = User.query.filter(has_reviews).update(
+            {User.points: db.session.query(func.sum(review_points))
+                .filter(Rating.user_id == User.id).scalar_subquery()},
+            synchronize_session=False
+        )
+
+        awarded = award_badges_bulk()
+        db.session.commit()
+
+        elapsed = time.perf_counter() - start
+        print(f"\n✨ Updated points for {updated} users in {elapsed:.2f}s")
+        for slug, count in awarded.items():
+            if count:
+                print(f"- {slug}: {count} new")
+
+
 if __name__ == '__main__':
-    award_retroactive_points()
+    parser = argparse.ArgumentParser(description='Award retroactive points and badges')
+    parser.add_argument('--batch', action='store_true', help='set-based mode for large user tables')
+    args = parser.parse_args()
+
+    if args.batch:
+        award_retroactive_points_batch()
+    else:
+        award_retroactive_points()
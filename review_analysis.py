@@ -0,0 +1,226 @@
+"""
+Single-pass review text analysis
+
+Review submission used to scan the same comment several times:
+content_moderation ran better_profanity's contains_profanity() and then
+censor() (each a full tokenize + linear scan of ~900 word variants per word),
+split the text twice, and credibility.has_specific_content() ran five
+uncompiled regexes.
+
+analyze_review() makes one tokenizing pass for profanity and one for word
+lookups (both precompiled), and runs every check from those:
+
+- profanity: each token (and up to 5 following tokens joined, as
+  better_profanity does for phrases) is looked up in a dict keyed by a
+  "skeleton" that folds the leetspeak substitutions together, then confirmed
+  against better_profanity's own word variants
+- specificity: token set lookups per indicator category, plus two precompiled
+  patterns for phrases and "<number> <unit>"
+- length, all caps, repetition and URL checks as in content_moderation
+
+The result is a combined verdict (approved + user-facing message) that
+rate_doctor and credibility scoring share.
+"""
+import re
+
+from better_profanity import profanity
+from better_profanity.constants import ALLOWED_CHARACTERS
+
+
+MAX_REVIEW_LENGTH = 2000
+MIN_REVIEW_WORDS = 2
+ALL_CAPS_MIN_LENGTH = 20
+REPETITION_MIN_WORDS = 5
+REPETITION_MIN_UNIQUE_RATIO = 0.3
+URL_MARKERS = ('http://', 'https://', 'www.')
+SPECIFICITY_MIN_CATEGORIES = 3
+
+# Shown when a review is rejected, first matching issue wins
+MODERATION_MESSAGES = (
+    ('contains_profanity', 'Please keep your review professional and avoid inappropriate language.'),
+    ('too_short', 'Please write at least a few words about your experience.'),
+    ('too_long', 'Your review is too long. Please keep it under 2000 characters.'),
+    ('all_caps', 'Please don\'t write in all capital letters.'),
+    ('repetitive', 'Your review appears repetitive. Please write a genuine experience.'),
+    ('contains_url', 'Please don\'t include links in your review.'),
+)
+DEFAULT_MODERATION_MESSAGE = 'Your review doesn\'t meet our community guidelines.'
+
+# Specificity indicator categories (same vocabulary as the old regexes)
+SPECIFICITY_WORDS = {
+    'medical': frozenset({'diagnosis', 'treatment', 'medication', 'prescription', 'symptom', 'symptoms',
+                          'test', 'scan', 'surgery'}),
+    'time': frozenset({'minute', 'minutes', 'hour', 'hours', 'day', 'days', 'week', 'weeks',
+                       'month', 'months', 'waited', 'appointment'}),
+    'personal': frozenset({'i', 'my', 'me', 'felt', 'experienced', 'visited', 'went', 'saw', 'told'}),
+    'details': frozenset({'staff', 'nurse', 'reception', 'clinic', 'office', 'consultation'}),
+}
+_SPECIFICITY_PHRASES = {'x-ray': 'medical', 'waiting room': 'details'}
+_PHRASE_RE = re.compile(r'\b(x-ray|waiting room)\b')
+_NUMBER_UNIT_RE = re.compile(r'\d+\s*(?:minute|hour|rupee|day)')
+
+_WORD_RE = re.compile(r'\w+')
+# better_profanity's word characters: ASCII letters, digits, @ $ * " '
+_PROFANITY_TOKEN_RE = re.compile('[' + re.escape(''.join(sorted(ALLOWED_CHARACTERS))) + ']+')
+
+# Leetspeak folding: every substitution better_profanity accepts stays inside one class
+_SKELETON = str.maketrans({
+    **{char: '#' for char in 'aiouvel@*4103'},
+    **{char: 's' for char in 's$5'},
+    **{char: 't' for char in 't7'},
+})
+
+
+def _skeleton(word):
+    return word.translate(_SKELETON)
+
+
+def _build_profanity_index():
+    """skeleton -> list of better_profanity VaryingString entries"""
+    profanity.load_censor_words()
+    index = {}
+    for varying in profanity.CENSOR_WORDSET:
+        index.setdefault(_skeleton(str(varying)), []).append(varying)
+    return index
+
+
+_PROFANITY_INDEX = _build_profanity_index()
+_MAX_JOINED_WORDS = profanity.MAX_NUMBER_COMBINATIONS
+_MAX_PROFANE_LENGTH = max((len(str(varying)) for varying in profanity.CENSOR_WORDSET), default=0)
+
+
+def _is_profane(word):
+    candidates = _PROFANITY_INDEX.get(_skeleton(word))
+    return bool(candidates) and any(varying == word for varying in candidates)
+
+
+def _profanity_spans(text, tokens):
+    """
+    (start, end) spans of profane words/phrases, mirroring better_profanity.censor()
+
+    A token is checked joined with up to _MAX_JOINED_WORDS following tokens
+    (with and without the separators between them), then on its own.
+    """
+    spans = []
+    position = 0
+    count = len(tokens)
+    last_index = len(text) - 1
+    while position < count:
+        start, end = tokens[position]
+        word = text[start:end].lower()
+        matched_end = None
+
+        joined = word
+        for offset in range(1, _MAX_JOINED_WORDS + 1):
+            following = position + offset
+            if following >= count:
+                break
+            next_start, next_end = tokens[following]
+            if next_start >= last_index:
+                break  # better_profanity never joins a one-character final word
+            joined += text[next_start:next_end].lower()
+            with_separators = text[start:next_end].lower()
+            if len(joined) > _MAX_PROFANE_LENGTH and len(with_separators) > _MAX_PROFANE_LENGTH:
+                break
+            if _is_profane(joined) or _is_profane(with_separators):
+                matched_end = following
+                break
+
+        if matched_end is not None:
+            spans.append((start, tokens[matched_end][1]))
+            position = matched_end + 1
+            continue
+
+        if _is_profane(word):
+            spans.append((start, end))
+        position += 1
+    return spans
+
+
+def _censor(text, spans):
+    if not spans:
+        return text
+    pieces = []
+    last = 0
+    for start, end in spans:
+        pieces.append(text[last:start])
+        pieces.append('****')
+        last = end
+    pieces.append(text[last:])
+    return ''.join(pieces)
+
+
+def specificity_count(text):
+    """Number of specificity indicator categories present in text (0-5)"""
+    lowered = text.lower()
+    words = set(_WORD_RE.findall(lowered))
+    categories = {name for name, vocabulary in SPECIFICITY_WORDS.items() if not words.isdisjoint(vocabulary)}
+    for phrase in _PHRASE_RE.findall(lowered):
+        categories.add(_SPECIFICITY_PHRASES[phrase])
+    if _NUMBER_UNIT_RE.search(lowered):
+        categories.add('numbers')
+    return len(categories)
+
+
+def is_specific(text):
+    """Whether a review has enough specific details to suggest first-hand experience"""
+    return bool(text) and specificity_count(text) >= SPECIFICITY_MIN_CATEGORIES
+
+
+def moderation_message(issues):
+    """User-facing message for the first (most important) moderation issue"""
+    for issue, message in MODERATION_MESSAGES:
+        if issue in issues:
+            return message
+    return DEFAULT_MODERATION_MESSAGE if issues else ''
+
+
+def analyze_review(text):
+    """
+    Run every moderation and quality check on review text in one pass
+
+    Returns:
+        dict: {
+            'approved': bool,
+            'issues': list of issue codes (content_moderation's codes),
+            'message': str (user-friendly message if rejected),
+            'censored_text': text with profanity replaced by ****,
+            'specificity': number of specificity indicator categories,
+            'is_specific': bool (3+ categories),
+        }
+    """
+    text = text or ''
+    issues = []
+
+    tokens = [match.span() for match in _PROFANITY_TOKEN_RE.finditer(text)]
+    spans = _profanity_spans(text, tokens)
+    if spans:
+        issues.append('contains_profanity')
+
+    words = text.split()
+    if len(words) < MIN_REVIEW_WORDS:
+        issues.append('too_short')
+
+    if len(text) > MAX_REVIEW_LENGTH:
+        issues.append('too_long')
+
+    if len(text) > ALL_CAPS_MIN_LENGTH and text.isupper():
+        issues.append('all_caps')
+
+    if len(words) > REPETITION_MIN_WORDS and len(set(words)) / len(words) < REPETITION_MIN_UNIQUE_RATIO:
+        issues.append('repetitive')
+
+    lowered = text.lower()
+    if any(marker in lowered for marker in URL_MARKERS):
+        issues.append('contains_url')
+
+    specificity = specificity_count(text) if text else 0
+
+    return {
+        'approved': not issues,
+        'issues': issues,
+        'message': moderation_message(issues),
+        'censored_text': _censor(text, spans),
+        'specificity': specificity,
+        'is_specific': specificity >= SPECIFICITY_MIN_CATEGORIES,
+    }
@@ -0,0 +1,299 @@
+"""
+Near-duplicate review detection (MinHash + LSH)
+
+credibility.is_duplicate_content() only compares a new review with the latest
+50 reviews of the same doctor, so the same text pasted on many different
+doctors goes unnoticed. This module indexes every review across the corpus:
+
+- text is lowercased and split into words; overlapping 3-word shingles are hashed
+- a 64-value MinHash signature estimates Jaccard similarity between shingle sets
+- the signature is cut into 16 bands of 4 values; reviews that share any band
+  bucket are candidates (P(candidate) ~ 0.99 at similarity 0.7, ~0.07 at 0.3)
+- candidates are confirmed by comparing signatures (>= NEAR_DUPLICATE_THRESHOLD)
+
+Signatures and bucket rows are persisted in review_signatures and
+review_signature_buckets (migration 017) and mirrored in an in-memory index per
+worker process. Each lookup first pulls rows newer than the last one seen, and
+the whole index is reloaded every INDEX_RELOAD_SECONDS to pick up deletions
+and rows committed out of id order by other workers.
+
+Existing reviews are indexed by backfill_review_signatures.py.
+"""
+import os
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import defaultdict
+from functools import lru_cache
+from hashlib import blake2b
+
+from sqlalchemy import inspect
+
+from models import db, ReviewSignature, ReviewSignatureBucket
+
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3                 # words per shingle
+MIN_WORDS = 8                    # shorter reviews ("Very good doctor") are too generic to compare
+NEAR_DUPLICATE_THRESHOLD = 0.7   # estimated Jaccard similarity of shingle sets
+INDEX_RELOAD_SECONDS = int(os.getenv('REVIEW_INDEX_RELOAD_SECONDS', '3600'))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_SIGNATURE_FORMAT = f'<{NUM_PERM}I'
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Fixed seed: signatures are stored, so every process must use the same permutations
+_rng = random.Random(20261019)
+_PERMUTATIONS = tuple(
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+)
+
+
+def shingle_hashes(text):
+    """CRC32 hashes of the text's 3-word shingles (empty set if the text is too short)"""
+    words = _WORD_RE.findall((text or '').lower())
+    if len(words) < MIN_WORDS:
+        return set()
+    return {
+        zlib.crc32(' '.join(words[i:i + SHINGLE_SIZE]).encode('utf-8'))
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash(hashes):
+    """MinHash signature (tuple of NUM_PERM 32-bit ints) of a set of shingle hashes"""
+    return tuple(
+        min(((a * x + b) % _MERSENNE_PRIME) & _MAX_HASH for x in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+@lru_cache(maxsize=256)
+def signature_for_text(text):
+    """MinHash signature of review text, or None if the text is too short to index"""
+    hashes = shingle_hashes(text)
+    return minhash(hashes) if hashes else None
+
+
+def band_buckets(signature):
+    """One signed 64-bit bucket id per band (band number is part of the hash)"""
+    buckets = []
+    for band in range(BANDS):
+        values = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = blake2b(struct.pack(f'<H{ROWS_PER_BAND}I', band, *values), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'little', signed=True))
+    return buckets
+
+
+def estimate_similarity(signature1, signature2):
+    """Fraction of matching MinHash values (estimated Jaccard similarity)"""
+    return sum(1 for a, b in zip(signature1, signature2) if a == b) / NUM_PERM
+
+
+def pack_signature(signature):
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def unpack_signature(data):
+    return struct.unpack(_SIGNATURE_FORMAT, data)
+
+
+class SignatureIndex:
+    """In-memory LSH index: bucket -> review ids, review id -> packed signature"""
+
+    def __init__(self):
+        self.buckets = defaultdict(set)
+        self.signatures = {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def add(self, rating_id, signature, buckets=None):
+        self.signatures[rating_id] = pack_signature(signature)
+        for bucket in buckets or band_buckets(signature):
+            self.buckets[bucket].add(rating_id)
+
+    def remove(self, rating_id):
+        data = self.signatures.pop(rating_id, None)
+        if data is None:
+            return
+        for bucket in band_buckets(unpack_signature(data)):
+            ids = self.buckets.get(bucket)
+            if ids is not None:
+                ids.discard(rating_id)
+
+    def candidates(self, signature):
+        found = set()
+        for bucket in band_buckets(signature):
+            found.update(self.buckets.get(bucket, ()))
+        return found
+
+    def query(self, signature, exclude_id=None, before_id=None, threshold=NEAR_DUPLICATE_THRESHOLD):
+        """
+        Indexed reviews similar to the signature
+
+        With before_id, only reviews with a lower id count, so the first copy
+        of a text is never the duplicate (as in copied_ids()).
+
+        Returns:
+            list of (rating_id, similarity), most similar first
+        """
+        matches = []
+        for rating_id in self.candidates(signature):
+            if rating_id == exclude_id or (before_id is not None and rating_id >= before_id):
+                continue
+            similarity = estimate_similarity(signature, unpack_signature(self.signatures[rating_id]))
+            if similarity >= threshold:
+                matches.append((rating_id, similarity))
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches
+
+    def copied_ids(self, threshold=NEAR_DUPLICATE_THRESHOLD):
+        """Ids of reviews that near-duplicate an earlier (lower id) review"""
+        copied = set()
+        for ids in self.buckets.values():
+            if len(ids) < 2:
+                continue
+            ordered = sorted(ids)
+            for position, rating_id in enumerate(ordered[1:], start=1):
+                if rating_id in copied:
+                    continue
+                signature = unpack_signature(self.signatures[rating_id])
+                for earlier_id in ordered[:position]:
+                    earlier = unpack_signature(self.signatures[earlier_id])
+                    if estimate_similarity(signature, earlier) >= threshold:
+                        copied.add(rating_id)
+                        break
+        return copied
+
+
+# Per-process mirror of the signature tables
+_index_lock = threading.Lock()
+_state = {'index': None, 'max_rating_id': 0, 'loaded_at': None, 'pid': None}
+_tables = {'checked': False, 'available': False}
+
+
+def index_available():
+    """Whether migration 017's tables exist (checked once per process)"""
+    if not _tables['checked']:
+        try:
+            _tables['available'] = 'review_signatures' in inspect(db.engine).get_table_names()
+        except Exception as e:
+            print(f"[REVIEW DEDUP] Could not check signature tables: {e}")
+            _tables['available'] = False
+        _tables['checked'] = True
+    return _tables['available']
+
+
+def reset_index():
+    """Forget the in-memory index and table check (next lookup reloads)"""
+    with _index_lock:
+        _state.update(index=None, max_rating_id=0, loaded_at=None, pid=None)
+    _tables['checked'] = False
+
+
+def _load_rows(index, after_id):
+    signatures = db.session.query(ReviewSignature.rating_id, ReviewSignature.signature)\
+        .filter(ReviewSignature.rating_id > after_id).all()
+    buckets = defaultdict(list)
+    for rating_id, bucket in db.session.query(ReviewSignatureBucket.rating_id, ReviewSignatureBucket.bucket)\
+            .filter(ReviewSignatureBucket.rating_id > after_id):
+        buckets[rating_id].append(bucket)
+
+    max_id = after_id
+    for rating_id, data in signatures:
+        index.add(rating_id, unpack_signature(data), buckets.get(rating_id))
+        max_id = max(max_id, rating_id)
+    return max_id
+
+
+def get_index():
+    """
+    The synced in-memory index (None if the signature tables don't exist)
+
+    Must run inside an app context.
+    """
+    if not index_available():
+        return None
+
+    now = time.time()
+    with _index_lock:
+        index = _state['index']
+        stale = (
+            index is None
+            or _state['pid'] != os.getpid()
+            or now - _state['loaded_at'] > INDEX_RELOAD_SECONDS
+        )
+        if stale:
+            index = SignatureIndex()
+            max_id = _load_rows(index, 0)
+            _state.update(index=index, max_rating_id=max_id, loaded_at=now, pid=os.getpid())
+        else:
+            _state['max_rating_id'] = _load_rows(index, _state['max_rating_id'])
+        return index
+
+
+def find_near_duplicates(text, exclude_rating_id=None, before_rating_id=None):
+    """
+    Reviews anywhere in the corpus whose text nearly matches this one
+    (only those older than before_rating_id, if given)
+
+    Returns:
+        list of (rating_id, similarity), most similar first
+    """
+    signature = signature_for_text(text)
+    if signature is None:
+        return []
+    index = get_index()
+    if index is None:
+        return []
+    return index.query(signature, exclude_id=exclude_rating_id, before_id=before_rating_id)
+
+
+def is_near_duplicate(review):
+    """Whether review (a Rating) nearly matches an earlier indexed review"""
+    return bool(find_near_duplicates(review.comment, exclude_rating_id=review.id, before_rating_id=review.id))
+
+
+def index_review(review):
+    """
+    Add a review's signature and bucket rows to the session (caller commits)
+
+    Returns:
+        bool: True if the review was indexed (False if too short or no tables)
+    """
+    if not index_available():
+        return False
+    signature = signature_for_text(review.comment)
+    if signature is None:
+        return False
+
+    db.session.add(ReviewSignature(rating_id=review.id, signature=pack_signature(signature)))
+    db.session.add_all([
+        ReviewSignatureBucket(rating_id=review.id, bucket=bucket) for bucket in band_buckets(signature)
+    ])
+    return True
+
+
+def remove_review(rating_id):
+    """Delete a review's index rows (caller commits) and drop it from this process's index"""
+    if not index_available():
+        return
+    ReviewSignatureBucket.query.filter_by(rating_id=rating_id).delete(synchronize_session=False)
+    ReviewSignature.query.filter_by(rating_id=rating_id).delete(synchronize_session=False)
+    with _index_lock:
+        if _state['index'] is not None:
+            _state['index'].remove(rating_id)
+
+
+def find_copied_reviews():
+    """Ids of indexed reviews that near-duplicate an earlier review (empty set without tables)"""
+    index = get_index()
+    return index.copied_ids() if index is not None else set()
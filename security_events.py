@@ -0,0 +1,363 @@
+"""
+Security event retention and hourly rollups
+
+Every blocked request, verification email, login event and booking adds a
+security_events row, and the rate limiters count rows by (event_type, ip or
+email, time window). Raw rows are now kept for SECURITY_EVENT_RETENTION_DAYS
+only. Their hourly counts live on in security_event_rollups, which the admin
+charts read.
+
+- rollups: every ROLLUP_INTERVAL_SECONDS, each completed hour since the last
+  rolled one is aggregated by (hour, event_type, ip) in one INSERT ... SELECT
+  ... GROUP BY per day of events. Re-rolling an hour overwrites its counts, so
+  a repeated run changes nothing.
+- PostgreSQL: security_events is range-partitioned by month on created_at
+  (migration 022, partitions security_events_YYYY_MM). The daily task creates
+  partitions PARTITIONS_AHEAD months ahead. Rows outside every month (the
+  task stopped running, or a clock far off) land in security_events_default;
+  creating their month's partition moves them out of it. Expired months are
+  dropped whole (DETACH + DROP) instead of deleted row by row.
+- other databases (SQLite in development, or PostgreSQL before migration 022):
+  expired rows are moved into monthly archive tables
+  (security_events_archive_YYYY_MM), and those are dropped after
+  SECURITY_EVENT_ARCHIVE_MONTHS.
+
+    flask --app app maintenance run rollup_security_events security_event_retention
+"""
+import os
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, func, inspect, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import maintenance
+from models import db, SecurityEvent, SecurityEventRollup
+
+
+SECURITY_EVENT_RETENTION_DAYS = int(os.getenv('SECURITY_EVENT_RETENTION_DAYS', '90'))
+SECURITY_EVENT_ARCHIVE_MONTHS = int(os.getenv('SECURITY_EVENT_ARCHIVE_MONTHS', '12'))
+ROLLUP_RETENTION_DAYS = int(os.getenv('SECURITY_ROLLUP_RETENTION_DAYS', '730'))
+ROLLUP_INTERVAL_SECONDS = 900
+ROLLUP_GRACE_SECONDS = 300  # an hour is rolled up once it ended this long ago
+ROLLUP_CHUNK = timedelta(days=1)
+PARTITIONS_AHEAD = 3
+CHART_TYPES = 6  # event types drawn separately; the rest are summed as 'other'
+
+PARTITION_PREFIX = 'security_events_'
+DEFAULT_PARTITION = 'security_events_default'
+ARCHIVE_PREFIX = 'security_events_archive_'
+_MONTH_SUFFIX_RE = re.compile(r'^(\d{4})_(\d{2})$')
+
+
+def _floor_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+
+def _next_month(month):
+    return datetime(month.year + (month.month == 12), month.month % 12 + 1, 1)
+
+
+def _month_suffix(month):
+    return f'{month.year:04d}_{month.month:02d}'
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def _hour_bucket(column):
+    """SQL expression truncating a timestamp to its hour"""
+    if _dialect() == 'postgresql':
+        return func.date_trunc('hour', column)
+    # SQLite stores DateTime as text; keep SQLAlchemy's format so comparisons work
+    return func.strftime('%Y-%m-%d %H:00:00.000000', column)
+
+
+def _upsert(model):
+    return pg_insert(model) if _dialect() == 'postgresql' else sqlite_insert(model)
+
+
+# --- Rollups ---
+
+def rollup_range(start, end):
+    """Aggregate events created in [start, end) into hourly rollups; returns rollup rows written"""
+    hour = _hour_bucket(SecurityEvent.created_at).label('hour')
+    ip = func.coalesce(SecurityEvent.ip, '').label('ip')
+    aggregate = select(hour, SecurityEvent.event_type, ip, func.count().label('count'))\
+        .where(SecurityEvent.created_at >= start, SecurityEvent.created_at < end)\
+        .group_by(hour, SecurityEvent.event_type, ip)
+
+    statement = _upsert(SecurityEventRollup)\
+        .from_select(['hour', 'event_type', 'ip', 'count'], aggregate)
+    statement = statement.on_conflict_do_update(
+        index_elements=['hour', 'event_type', 'ip'],
+        set_={'count': statement.excluded['count']},
+    )
+    result = db.session.execute(statement)
+    db.session.commit()
+    return result.rowcount or 0
+
+
+def rollup_pending_hours(now=None):
+    """
+    Roll up every completed hour after the newest rollup
+
+    Returns:
+        int: rollup rows written
+    """
+    end = _floor_hour((now or datetime.utcnow()) - timedelta(seconds=ROLLUP_GRACE_SECONDS))
+    last_hour = db.session.query(func.max(SecurityEventRollup.hour)).scalar()
+    if last_hour is not None:
+        start = last_hour + timedelta(hours=1)
+    else:
+        first_event = db.session.query(func.min(SecurityEvent.created_at)).scalar()
+        if first_event is None:
+            return 0
+        start = _floor_hour(first_event)
+
+    written = 0
+    while start < end:
+        chunk_end = min(start + ROLLUP_CHUNK, end)
+        written += rollup_range(start, chunk_end)
+        start = chunk_end
+    return written
+
+
+@maintenance.database_task('rollup_security_events', ROLLUP_INTERVAL_SECONDS)
+def rollup_security_events():
+    return rollup_pending_hours()
+
+
+# --- PostgreSQL partitions ---
+
+def is_partitioned():
+    """Whether security_events is a partitioned table (PostgreSQL after migration 022)"""
+    if _dialect() != 'postgresql':
+        return False
+    return bool(db.session.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'security_events' AND pg_table_is_visible(c.oid)"
+    )).scalar())
+
+
+def _partition_months():
+    """Month start -> partition name for the existing partitions"""
+    names = db.session.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'security_events' AND pg_table_is_visible(p.oid)"
+    )).scalars()
+    return _months_from_names(names, PARTITION_PREFIX)
+
+
+def _has_default_partition():
+    return bool(db.session.execute(text(f"SELECT to_regclass('{DEFAULT_PARTITION}') IS NOT NULL")).scalar())
+
+
+def _create_partition(month, from_default):
+    name = f"{PARTITION_PREFIX}{_month_suffix(month)}"
+    bounds = f"FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+    if not from_default:
+        db.session.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF security_events FOR VALUES {bounds}"))
+        return
+    # PARTITION OF would fail while the default partition holds rows of this
+    # month, so build the table, move them over, then attach it
+    db.session.execute(text(f"CREATE TABLE {name} (LIKE security_events INCLUDING DEFAULTS)"))
+    db.session.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+        f"WHERE created_at >= :start AND created_at < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {'start': month, 'end': _next_month(month)})
+    db.session.execute(text(f"ALTER TABLE security_events ATTACH PARTITION {name} FOR VALUES {bounds}"))
+
+
+def ensure_partitions(now=None, months_ahead=PARTITIONS_AHEAD):
+    """Create monthly partitions from the current month to months_ahead; returns how many were created"""
+    existing = _partition_months()
+    from_default = _has_default_partition()
+    month = _month_start(now or datetime.utcnow())
+    created = 0
+    for _ in range(months_ahead + 1):
+        if month not in existing:
+            _create_partition(month, from_default)
+            created += 1
+        month = _next_month(month)
+    db.session.commit()
+    return created
+
+
+def drop_expired_partitions(cutoff):
+    """
+    Drop partitions whose whole month is older than cutoff, and delete expired
+    rows from the default partition; returns the dropped partitions' names
+    """
+    dropped = []
+    for month, name in sorted(_partition_months().items()):
+        if _next_month(month) > cutoff:
+            continue
+        db.session.execute(text(f"ALTER TABLE security_events DETACH PARTITION {name}"))
+        db.session.execute(text(f"DROP TABLE {name}"))
+        db.session.commit()
+        dropped.append(name)
+    if _has_default_partition():
+        db.session.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at < :cutoff"), {'cutoff': cutoff})
+        db.session.commit()
+    return dropped
+
+
+# --- Archive tables (non-partitioned databases) ---
+
+# Typed so datetimes are bound in the format SQLAlchemy stores them in
+_RANGE_PARAMS = (bindparam('start', type_=db.DateTime), bindparam('end', type_=db.DateTime))
+
+
+def _months_from_names(names, prefix):
+    months = {}
+    for name in names:
+        if not name.startswith(prefix):
+            continue
+        match = _MONTH_SUFFIX_RE.match(name[len(prefix):])
+        if match:
+            months[datetime(int(match.group(1)), int(match.group(2)), 1)] = name
+    return months
+
+
+def archive_expired_events(cutoff):
+    """
+    Move events older than cutoff into monthly archive tables
+
+    Returns:
+        int: events archived
+    """
+    oldest = db.session.query(func.min(SecurityEvent.created_at)).scalar()
+    if oldest is None or oldest >= cutoff:
+        return 0
+
+    columns = ', '.join(column.name for column in SecurityEvent.__table__.columns)
+    archived = 0
+    month = _month_start(oldest)
+    while month < cutoff:
+        end = min(_next_month(month), cutoff)
+        table = f'{ARCHIVE_PREFIX}{_month_suffix(month)}'
+        params = {'start': month, 'end': end}
+        db.session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {table} AS SELECT {columns} FROM security_events WHERE 1 = 0"
+        ))
+        db.session.execute(text(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} FROM security_events "
+            f"WHERE created_at >= :start AND created_at < :end"
+        ).bindparams(*_RANGE_PARAMS), params)
+        result = db.session.execute(text(
+            "DELETE FROM security_events WHERE created_at >= :start AND created_at < :end"
+        ).bindparams(*_RANGE_PARAMS), params)
+        db.session.commit()
+        archived += result.rowcount or 0
+        month = _next_month(month)
+    return archived
+
+
+def drop_expired_archives(now=None, months=SECURITY_EVENT_ARCHIVE_MONTHS):
+    """Drop archive tables older than `months`; returns their names"""
+    oldest_kept = _month_start(now or datetime.utcnow())
+    for _ in range(months):
+        oldest_kept = _month_start(oldest_kept - timedelta(days=1))
+    archives = _months_from_names(inspect(db.engine).get_table_names(), ARCHIVE_PREFIX)
+    dropped = []
+    for month, name in sorted(archives.items()):
+        if month < oldest_kept:
+            db.session.execute(text(f"DROP TABLE {name}"))
+            db.session.commit()
+            dropped.append(name)
+    return dropped
+
+
+# --- Retention ---
+
+def apply_retention(now=None, days=SECURITY_EVENT_RETENTION_DAYS):
+    """
+    Roll up, then expire raw events older than `days` and rollups older than ROLLUP_RETENTION_DAYS
+
+    Returns:
+        dict: {'rolled_up', 'partitions_created', 'partitions_dropped', 'archived', 'archives_dropped', 'rollups_deleted'}
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=days)
+    stats = {'rolled_up': rollup_pending_hours(now), 'partitions_created': 0, 'partitions_dropped': [],
+             'archived': 0, 'archives_dropped': [], 'rollups_deleted': 0}
+
+    if is_partitioned():
+        stats['partitions_created'] = ensure_partitions(now)
+        stats['partitions_dropped'] = drop_expired_partitions(cutoff)
+    else:
+        stats['archived'] = archive_expired_events(cutoff)
+        stats['archives_dropped'] = drop_expired_archives(now)
+
+    stats['rollups_deleted'] = SecurityEventRollup.query\
+        .filter(SecurityEventRollup.hour < now - timedelta(days=ROLLUP_RETENTION_DAYS))\
+        .delete(synchronize_session=False)
+    db.session.commit()
+
+    if stats['partitions_dropped'] or stats['archived'] or stats['archives_dropped']:
+        print(f"[SECURITY EVENTS] Retention: dropped partitions {stats['partitions_dropped']}, "
+              f"archived {stats['archived']} events, dropped archives {stats['archives_dropped']}")
+    return stats
+
+
+@maintenance.database_task('security_event_retention', maintenance.PRUNE_INTERVAL_SECONDS)
+def security_event_retention():
+    return apply_retention()
+
+
+# --- Admin charts ---
+
+def hourly_chart(hours=168, now=None):
+    """
+    Events per hour by type over the last `hours`, from rollups (the current hour is not included yet)
+
+    Returns:
+        dict: {'labels': ['10-19 14:00', ...], 'datasets': [{'label': event_type, 'data': [...]}, ...]}
+    """
+    end = _floor_hour(now or datetime.utcnow())
+    start = end - timedelta(hours=hours)
+    rows = db.session.query(SecurityEventRollup.hour, SecurityEventRollup.event_type,
+                            func.sum(SecurityEventRollup.count))\
+        .filter(SecurityEventRollup.hour >= start, SecurityEventRollup.hour < end)\
+        .group_by(SecurityEventRollup.hour, SecurityEventRollup.event_type).all()
+
+    totals = {}
+    for _, event_type, count in rows:
+        totals[event_type] = totals.get(event_type, 0) + count
+    charted = sorted(totals, key=totals.get, reverse=True)[:CHART_TYPES]
+
+    slots = [start + timedelta(hours=index) for index in range(hours)]
+    position = {slot: index for index, slot in enumerate(slots)}
+    series = {event_type: [0] * hours for event_type in charted}
+    for hour, event_type, count in rows:
+        index = position.get(hour)
+        if index is None:
+            continue
+        if event_type not in series:
+            series.setdefault('other', [0] * hours)
+            event_type = 'other'
+        series[event_type][index] += count
+
+    return {
+        'labels': [slot.strftime('%m-%d %H:00') for slot in slots],
+        'datasets': [{'label': event_type, 'data': data} for event_type, data in series.items()],
+    }
+
+
+def top_ips(hours=24, limit=10, now=None):
+    """[(ip, event_type, count)] with the most events over the last `hours`, from rollups"""
+    since = _floor_hour(now or datetime.utcnow()) - timedelta(hours=hours)
+    total = func.sum(SecurityEventRollup.count).label('total')
+    return db.session.query(SecurityEventRollup.ip, SecurityEventRollup.event_type, total)\
+        .filter(SecurityEventRollup.hour >= since, SecurityEventRollup.ip != '')\
+        .group_by(SecurityEventRollup.ip, SecurityEventRollup.event_type)\
+        .order_by(total.desc()).limit(limit).all()
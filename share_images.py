@@ -0,0 +1,339 @@
+"""
+Open Graph share images for doctor profiles
+
+Every doctor profile shared on Facebook or WhatsApp used to show the same
+card: the profile photo if there was one, otherwise the site logo. Each
+active doctor now gets a 1200x630 card with photo (or initials avatar),
+name, specialty, city, rating and verified badge. The card is rendered by
+a background batch, never on the request path:
+
+- card_inputs() reduces a doctor to the tuple of values drawn on the card.
+  Its hash names the stored file, share/<doctor_id>/<fingerprint>.jpg, so
+  the key is addressed by what the card shows. Cards are stored in R2 only:
+  they are rendered on the job worker, whose disk the web processes may not
+  share. Without R2 no cards are made and profiles keep the fallback below.
+- Doctor.share_image holds the current key. A doctor needs a new card
+  exactly when the key computed from their current fields differs. A new
+  review, an edited name or a new photo changes it; profile views don't.
+- the 'share_images' maintenance task (job worker, every
+  SHARE_IMAGE_SCAN_SECONDS) computes every active doctor's key in one
+  aggregate query and renders up to SHARE_IMAGE_BATCH changed cards,
+  verified doctors first. The replaced file is deleted.
+- doctor_profile.html links the stored card through the share_image_url
+  filter (a URL built from the column) and falls back to the photo or logo
+  while a doctor has none. The serve_share_image route only hands out a key
+  that is some doctor's current card, i.e. one known to be in R2.
+
+Bulk generation (e.g. right after deploying this):
+
+    flask --app app share-images generate [--workers 4] [--limit N]
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from io import BytesIO
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+from sqlalchemy import func
+
+import avatars
+import image_variants
+import maintenance
+import r2_storage
+from models import db, Doctor, Specialty, City, Rating
+
+
+RENDER_VERSION = 1  # bump when the drawing below changes
+CARD_SIZE = (1200, 630)
+PHOTO_SIZE = 300
+SHARE_IMAGE_SCAN_SECONDS = int(os.getenv('SHARE_IMAGE_SCAN_SECONDS', '900'))
+SHARE_IMAGE_BATCH = int(os.getenv('SHARE_IMAGE_BATCH', '200'))
+GENERATE_WORKERS = min(4, os.cpu_count() or 1)
+JPEG_OPTIONS = {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True}
+SHARE_PREFIX = 'share'
+
+BRAND_COLOR = '#0D8ABC'
+TEXT_COLOR = '#0f172a'
+MUTED_COLOR = '#64748b'
+STAR_COLOR = '#f59e0b'
+VERIFIED_COLOR = '#10b981'
+FONT_BOLD = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+FONT_REGULAR = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+
+def card_inputs(doctor_id, name, specialty, city, is_verified, photo_url, photo_variants, avg_rating, rating_count):
+    """
+    The values drawn on a doctor's card, as a plain (picklable) tuple
+
+    The photo is referenced by its 400px rendition when the doctor has
+    renditions. The rating is rounded as displayed, so only a visible
+    change produces a new card.
+    """
+    photo = None
+    if photo_url:
+        photo = image_variants.variant_key(photo_url, 400, 'jpeg') if photo_variants else photo_url
+    rating = round(float(avg_rating), 1) if rating_count else None
+    return (doctor_id, name or "Doctor", specialty or '', city or '', bool(is_verified), photo,
+            rating, int(rating_count or 0))
+
+
+def share_key(inputs):
+    """share/<doctor_id>/<fingerprint>.jpg for a card's inputs"""
+    raw = '\x1f'.join(str(value) for value in (RENDER_VERSION,) + inputs)
+    return f"{SHARE_PREFIX}/{inputs[0]}/{hashlib.sha256(raw.encode('utf-8')).hexdigest()[:24]}.jpg"
+
+
+def _rows():
+    """(current share_image, inputs) for active doctors, verified first"""
+    ratings = db.session.query(
+        Rating.doctor_id,
+        func.avg(Rating.rating).label('avg_rating'),
+        func.count(Rating.id).label('rating_count'),
+    ).group_by(Rating.doctor_id).subquery()
+    query = db.session.query(
+        Doctor.share_image, Doctor.id, Doctor.name, Specialty.name, City.name, Doctor.is_verified,
+        Doctor.photo_url, Doctor.photo_variants, ratings.c.avg_rating, ratings.c.rating_count,
+    ).outerjoin(Specialty, Doctor.specialty_id == Specialty.id)\
+        .outerjoin(City, Doctor.city_id == City.id)\
+        .outerjoin(ratings, ratings.c.doctor_id == Doctor.id)\
+        .filter(Doctor.is_active.is_(True))
+    return [(row[0], card_inputs(*row[1:]))
+            for row in query.order_by(Doctor.is_verified.desc(), Doctor.id)]
+
+
+def stale_cards(limit=None):
+    """[(current share_image, inputs)] of doctors whose card is missing or out of date"""
+    stale = [(current, inputs) for current, inputs in _rows() if current != share_key(inputs)]
+    return stale[:limit] if limit else stale
+
+
+@lru_cache(maxsize=None)
+def _font(bold, size):
+    try:
+        return ImageFont.truetype(FONT_BOLD if bold else FONT_REGULAR, size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def _fit_text(draw, text, bold, size, min_size, max_width):
+    """(text, font) shrunk to fit max_width, ellipsized at min_size"""
+    while size > min_size and draw.textlength(text, font=_font(bold, size)) > max_width:
+        size -= 4
+    font = _font(bold, size)
+    if draw.textlength(text, font=font) > max_width:
+        while text and draw.textlength(text + '…', font=font) > max_width:
+            text = text[:-1]
+        text = text.rstrip() + '…'
+    return text, font
+
+
+def _avatar(doctor_id, name, upload_folder, photo):
+    """Circular PHOTO_SIZE image: the stored photo, or the initials avatar"""
+    size = (PHOTO_SIZE, PHOTO_SIZE)
+    img = None
+    if photo:
+        try:
+            img = ImageOps.fit(Image.open(BytesIO(image_variants.load_photo(photo, upload_folder))).convert('RGB'),
+                               size, Image.Resampling.LANCZOS)
+        except Exception as e:
+            print(f"[SHARE] Doctor {doctor_id}: photo {photo} unavailable, using initials ({type(e).__name__})")
+    if img is None:
+        img = Image.new('RGB', size, '#' + avatars.color_for(doctor_id))
+        ImageDraw.Draw(img).text((PHOTO_SIZE // 2, PHOTO_SIZE // 2), avatars.initials_for(name),
+                                 font=_font(True, 120), fill='white', anchor='mm')
+    mask = Image.new('L', size, 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, PHOTO_SIZE - 1, PHOTO_SIZE - 1), fill=255)
+    return img, mask
+
+
+def render_card(inputs, upload_folder):
+    """The card for inputs, as JPEG bytes"""
+    doctor_id, name, specialty, city, is_verified, photo, rating, rating_count = inputs
+    width, height = CARD_SIZE
+    card = Image.new('RGB', CARD_SIZE, 'white')
+    draw = ImageDraw.Draw(card)
+
+    # Brand bar
+    draw.rectangle([(0, 0), (width, 12)], fill=BRAND_COLOR)
+    draw.rectangle([(0, height - 90), (width, height)], fill='#f1f5f9')
+    draw.text((70, height - 45), "RankSewa", font=_font(True, 40), fill=BRAND_COLOR, anchor='lm')
+    draw.text((width - 70, height - 45), "Real patient reviews • ranksewa.com", font=_font(False, 28),
+              fill=MUTED_COLOR, anchor='rm')
+
+    # Photo
+    avatar, mask = _avatar(doctor_id, name, upload_folder, photo)
+    top = (height - 90 - PHOTO_SIZE) // 2 + 6
+    card.paste(avatar, (70, top), mask)
+
+    # Name, specialty and city, rating
+    left, max_width = 70 + PHOTO_SIZE + 60, width - (70 + PHOTO_SIZE + 60) - 60
+    text, font = _fit_text(draw, name, True, 60, 36, max_width)
+    draw.text((left, 150), text, font=font, fill=TEXT_COLOR, anchor='ls')
+    subtitle = ' • '.join(part for part in (specialty, city) if part)
+    if subtitle:
+        text, font = _fit_text(draw, subtitle, False, 38, 28, max_width)
+        draw.text((left, 215), text, font=font, fill=MUTED_COLOR, anchor='ls')
+
+    if rating is not None:
+        stars = round(rating)
+        draw.text((left, 310), '★' * stars + '☆' * (5 - stars), font=_font(False, 52), fill=STAR_COLOR, anchor='ls')
+        reviews = f"{rating:.1f} · {rating_count} review{'s' if rating_count != 1 else ''}"
+        draw.text((left, 370), reviews, font=_font(True, 36), fill=TEXT_COLOR, anchor='ls')
+    else:
+        draw.text((left, 310), "No reviews yet - be the first", font=_font(False, 34), fill=MUTED_COLOR, anchor='ls')
+
+    if is_verified:
+        draw.rounded_rectangle([(left, 410), (left + 300, 462)], radius=26, fill=VERIFIED_COLOR)
+        draw.text((left + 150, 436), "✓ NMC Verified", font=_font(True, 28), fill='white', anchor='mm')
+
+    buffer = BytesIO()
+    card.save(buffer, **JPEG_OPTIONS)
+    return buffer.getvalue()
+
+
+def store_card(inputs, upload_folder):
+    """
+    Render and store a card (a generation worker's unit of work)
+
+    Returns:
+        str: the card's key
+
+    Raises:
+        ValueError: if it could not be stored in R2
+    """
+    key = share_key(inputs)
+    data = render_card(inputs, upload_folder)
+    if not r2_storage.save_share_image(BytesIO(data), key):
+        raise ValueError(f"Could not store {key} in R2")
+    return key
+
+
+def delete_card(key):
+    """Remove a replaced card from R2 (a missing one is ignored)"""
+    r2_storage.delete_share_image(key)
+
+
+def _switch(doctor_id, previous, key):
+    """Point the doctor at the new card (unless someone else already did) and drop the old one"""
+    updated = Doctor.query.filter(Doctor.id == doctor_id, Doctor.share_image.is_(None) if previous is None
+                                  else Doctor.share_image == previous)\
+        .update({'share_image': key}, synchronize_session=False)
+    if updated and previous and previous != key:
+        delete_card(previous)
+    return bool(updated)
+
+
+def is_current(key):
+    """Whether key is a doctor's current card (and so stored in R2)"""
+    doctor_id = key.split('/')[1] if key.count('/') == 2 else ''
+    if not key.startswith(SHARE_PREFIX + '/') or not doctor_id.isdigit():
+        return False
+    return db.session.query(
+        Doctor.query.filter(Doctor.id == int(doctor_id), Doctor.share_image == key).exists()
+    ).scalar()
+
+
+def refresh(limit=SHARE_IMAGE_BATCH, upload_folder=None):
+    """
+    Render the cards of up to `limit` doctors whose card is missing or stale
+    (nothing without R2)
+
+    Returns:
+        (rendered, failed) counts
+    """
+    rendered, failed = 0, 0
+    if not r2_storage.is_configured():
+        return rendered, failed
+    upload_folder = upload_folder or current_app.config['UPLOAD_FOLDER']
+    for previous, inputs in stale_cards(limit):
+        try:
+            key = store_card(inputs, upload_folder)
+        except Exception as e:
+            failed += 1
+            print(f"[SHARE] Doctor {inputs[0]}: {type(e).__name__}: {e}")
+            continue
+        _switch(inputs[0], previous, key)
+        db.session.commit()
+        rendered += 1
+    return rendered, failed
+
+
+@maintenance.database_task('share_images', SHARE_IMAGE_SCAN_SECONDS)
+def refresh_share_images():
+    """Re-render share cards whose displayed fields changed (see module docstring)"""
+    rendered, failed = refresh()
+    if rendered or failed:
+        print(f"[SHARE] Rendered {rendered} share images ({failed} failed)")
+
+
+def generate(workers=GENERATE_WORKERS, limit=None):
+    """
+    Render every stale card on a process pool (bulk backfill)
+
+    Workers render and upload; this process switches doctors over.
+
+    Returns:
+        (rendered, failed) counts
+    """
+    rendered, failed = 0, 0
+    if not r2_storage.is_configured():
+        return rendered, failed
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    stale = stale_cards(limit)
+    db.session.commit()  # don't hold a transaction open while the pool works
+    if not stale:
+        return rendered, failed
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(store_card, inputs, upload_folder): (previous, inputs) for previous, inputs in stale}
+        for future in as_completed(futures):
+            previous, inputs = futures[future]
+            try:
+                key = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[SHARE] Doctor {inputs[0]}: {type(e).__name__}: {e}")
+                continue
+            _switch(inputs[0], previous, key)
+            rendered += 1
+            if rendered % 50 == 0:
+                db.session.commit()
+                print(f"[SHARE] {rendered + failed}/{len(stale)} share images")
+    db.session.commit()
+    return rendered, failed
+
+
+def share_image_url(key):
+    """Absolute URL of a stored card (template filter share_image_url)"""
+    return url_for('serve_share_image', filename=key[len(SHARE_PREFIX) + 1:], _external=True)
+
+
+share_cli = AppGroup('share-images', help='Open Graph share images for doctor profiles')
+
+
+@share_cli.command('generate')
+@click.option('--workers', type=int, default=GENERATE_WORKERS, show_default=True, help='Worker processes')
+@click.option('--limit', type=int, default=None, help='Render at most this many cards')
+def generate_command(workers, limit):
+    """Render missing or out-of-date share images for all active doctors"""
+    if not r2_storage.is_configured():
+        print("R2 is not configured; share images are only stored there")
+        return
+    rendered, failed = generate(workers=workers, limit=limit)
+    print(f"Rendered {rendered} share images ({failed} failed)")
+
+
+@share_cli.command('status')
+def status_command():
+    """How many doctors have an up-to-date share image"""
+    rows = _rows()
+    stale = sum(1 for current, inputs in rows if current != share_key(inputs))
+    print(f"{len(rows) - stale}/{len(rows)} active doctors have an up-to-date share image")
+
+
+def init_app(app):
+    app.add_template_filter(share_image_url, 'share_image_url')
+    app.cli.add_command(share_cli)
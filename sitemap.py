@@ -1,18 +1,27 @@
 """
 Sitemap generator for RankSewa
 Helps Google discover and index all doctor profiles and articles
+
+The maintenance task 'regenerate_sitemap' stores the XML in cached_documents
+(store_sitemap); /sitemap.xml serves the stored copy.
 """
 
-from flask import make_response, url_for, request
+import os
+from flask import make_response, url_for, request, has_request_context
 from datetime import datetime
 
+SITE_URL = os.getenv('SITE_URL', 'https://ranksewa.com')
+SITEMAP_DOCUMENT = 'sitemap.xml'
+
 
-def generate_sitemap(app, db):
+def generate_sitemap(app, db, base_url=None):
     """Generate XML sitemap for Google Search Console"""
     from models import Doctor, Article, City, Specialty
 
-    # Get base URL from request or use default
-    base_url = request.host_url.rstrip('/') if request else 'https://ranksewa.com'
+    # Get base URL from the argument, the request or SITE_URL
+    if base_url is None:
+        base_url = request.host_url if has_request_context() else SITE_URL
+    base_url = base_url.rstrip('/')
 
     pages = []
 
@@ -75,3 +84,23 @@ def generate_sitemap(app, db):
     sitemap_xml += '</urlset>'
 
     return sitemap_xml
+
+
+def store_sitemap(app, db):
+    """
+    Regenerate the sitemap for SITE_URL and store it in cached_documents
+
+    Returns:
+        CachedDocument: the stored sitemap
+    """
+    from models import CachedDocument
+
+    sitemap_xml = generate_sitemap(app, db, base_url=SITE_URL)
+    document = db.session.get(CachedDocument, SITEMAP_DOCUMENT)
+    if document is None:
+        document = CachedDocument(name=SITEMAP_DOCUMENT, content_type='application/xml')
+        db.session.add(document)
+    document.content = sitemap_xml
+    document.generated_at = datetime.utcnow()
+    db.session.commit()
+    return document
@@ -8,17 +8,23 @@ import hashlib
 from werkzeug.utils import secure_filename
 from PIL import Image
 
+import image_variants
+
 
 # Allowed file extensions for different document types
 ALLOWED_EXTENSIONS = {
     'image': {'jpg', 'jpeg', 'png'},
     'document': {'pdf'},
-    'all': {'jpg', 'jpeg', 'png', 'pdf'}
+    'all': {'jpg', 'jpeg', 'png', 'pdf'},
+    'article_image': {'jpg', 'jpeg', 'png', 'webp'}
 }
 
 # Maximum file size in MB
 MAX_FILE_SIZE_MB = 10
 
+# Read size when hashing uploads
+HASH_CHUNK_SIZE = 1024 * 1024
+
 
 def allowed_file(filename, file_type='all'):
     """
@@ -96,22 +102,19 @@ def generate_unique_filename(original_filename):
     return secure_filename(unique_name + extension)
 
 
-def save_verification_document(file, upload_folder, doctor_id, doc_type):
+def validate_verification_document(file):
     """
-    Save a verification document to the filesystem
+    Validate an uploaded verification document before it is stored
+
+    Checks the extension and size, and that images actually decode (the
+    header is parsed from the upload stream; nothing is written to disk).
 
     Args:
         file: FileStorage object from request.files
-        upload_folder: Base upload folder path
-        doctor_id: ID of the doctor
-        doc_type: Type of document ('medical_degree', 'govt_id', 'practice_license')
 
-    Returns:
-        Relative path to saved file, or None if save failed
+    Raises:
+        ValueError: with a message for the user if the file is not acceptable
     """
-    if not file or file.filename == '':
-        return None
-
     # Validate file type
     if not allowed_file(file.filename):
         raise ValueError(f"File type not allowed. Allowed: {', '.join(ALLOWED_EXTENSIONS['all'])}")
@@ -120,33 +123,14 @@ def save_verification_document(file, upload_folder, doctor_id, doc_type):
     if not validate_file_size(file):
         raise ValueError(f"File too large. Maximum size: {MAX_FILE_SIZE_MB}MB")
 
-    # Create doctor-specific directory
-    doctor_folder = os.path.join(upload_folder, 'verification', str(doctor_id))
-    os.makedirs(doctor_folder, exist_ok=True)
-
-    # Generate unique filename
-    unique_filename = generate_unique_filename(file.filename)
-
-    # Save file
-    filepath = os.path.join(doctor_folder, unique_filename)
-    file.save(filepath)
-
-    # Return relative path (from upload_folder)
-    relative_path = os.path.join('verification', str(doctor_id), unique_filename)
-
     # Validate if it's an image (optional quality check)
     if allowed_file(file.filename, 'image'):
         try:
-            # Try to open and verify it's a valid image
-            img = Image.open(filepath)
-            img.verify()
+            Image.open(file).verify()
         except Exception as e:
-            # If image is invalid, delete it and raise error
-            if os.path.exists(filepath):
-                os.remove(filepath)
             raise ValueError(f"Invalid image file: {str(e)}")
-
-    return relative_path
+        finally:
+            file.seek(0)
 
 
 def delete_verification_document(upload_folder, relative_path):
@@ -175,26 +159,40 @@ def delete_verification_document(upload_folder, relative_path):
         return False
 
 
-def get_file_hash(filepath):
+def get_file_hash(source, chunk_size=HASH_CHUNK_SIZE):
     """
-    Calculate MD5 hash of a file (for duplicate detection)
+    Calculate the SHA-256 of a file, reading it in chunks
 
     Args:
-        filepath: Full path to the file
+        source: full path to the file, or a file object (read from the
+            start and rewound afterwards)
+        chunk_size: bytes read per iteration
 
     Returns:
-        MD5 hash string
+        (hex digest, size in bytes), or (None, 0) if the file can't be read
     """
-    hash_md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    size = 0
 
     try:
-        with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+        if isinstance(source, (str, os.PathLike)):
+            f = open(source, 'rb')
+        else:
+            f = source
+            f.seek(0)
+        try:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha256.update(chunk)
+                size += len(chunk)
+        finally:
+            if f is source:
+                f.seek(0)
+            else:
+                f.close()
+        return sha256.hexdigest(), size
     except Exception as e:
-        print(f"Error hashing file {filepath}: {e}")
-        return None
+        print(f"Error hashing file {source}: {e}")
+        return None, 0
 
 
 def validate_image_dimensions(file, min_width=200, min_height=200, max_width=5000, max_height=5000):
@@ -242,9 +240,68 @@ def get_upload_path(upload_folder, doctor_id, filename):
     return os.path.join(upload_folder, 'verification', str(doctor_id), filename)
 
 
+def open_image(source, max_size):
+    """
+    Open an image for downscaling to fit within max_size
+
+    For JPEGs, Image.draft() lets the decoder produce a 1/2, 1/4 or 1/8 scale
+    image directly (still at least max_size), so a 24 MP camera photo is not
+    decoded to full size just to be shrunk to 800 px.
+
+    Args:
+        source: path or file object
+        max_size: (width, height) the caller will resize to
+
+    Returns:
+        PIL Image
+    """
+    img = Image.open(source)
+    if img.format == 'JPEG':
+        img.draft('RGB', max_size)
+    return img
+
+
+def flatten_to_rgb(img):
+    """Convert to RGB, pasting transparent images onto white"""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def validate_image_upload(file, max_size_mb=5, min_dimension=100, max_dimension=5000, file_type='image'):
+    """
+    Check an uploaded image's type, size and dimensions (reads the header only)
+
+    Raises:
+        ValueError: with a message for the user
+    """
+    # Validate file type - only images allowed
+    if not allowed_file(file.filename, file_type):
+        raise ValueError(f"Invalid file type. Allowed: {', '.join(sorted(ALLOWED_EXTENSIONS[file_type]))}")
+
+    # Validate file size
+    if not validate_file_size(file, max_mb=max_size_mb):
+        raise ValueError(f"File too large. Maximum size: {max_size_mb}MB")
+
+    # Validate image dimensions
+    is_valid, message = validate_image_dimensions(file, min_width=min_dimension, min_height=min_dimension,
+                                                  max_width=max_dimension, max_height=max_dimension)
+    if not is_valid:
+        raise ValueError(message)
+
+
 def save_profile_photo(file, upload_folder, doctor_id, max_size_mb=5):
     """
-    Save and optimize a doctor's profile photo
+    Validate and save a doctor's profile photo within the request
+
+    Web uploads go through image_processing instead (validated here, processed
+    off-request by process_profile_photo).
 
     Args:
         file: FileStorage object from request.files
@@ -257,44 +314,38 @@ def save_profile_photo(file, upload_folder, doctor_id, max_size_mb=5):
     """
     if not file or file.filename == '':
         return None
+    validate_image_upload(file, max_size_mb=max_size_mb, min_dimension=100)
+    return process_profile_photo(file, upload_folder, doctor_id)
 
-    # Validate file type - only images allowed
-    if not allowed_file(file.filename, 'image'):
-        raise ValueError(f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS['image'])}")
 
-    # Validate file size
-    if not validate_file_size(file, max_mb=max_size_mb):
-        raise ValueError(f"File too large. Maximum size: {max_size_mb}MB")
+def process_profile_photo(source, upload_folder, doctor_id):
+    """
+    Resize a profile photo to at most 800x800, store it plus its responsive
+    renditions (see image_variants; the caller sets doctor.photo_variants)
 
-    # Validate image dimensions
-    is_valid, message = validate_image_dimensions(file, min_width=100, min_height=100)
-    if not is_valid:
-        raise ValueError(message)
+    Args:
+        source: path or file object of the uploaded image
+        upload_folder: Base upload folder path
+        doctor_id: ID of the doctor
 
+    Returns:
+        Relative path to saved photo (R2 or local)
+    """
     # Create photos directory
     photos_folder = os.path.join(upload_folder, 'photos')
     os.makedirs(photos_folder, exist_ok=True)
 
-    # Generate unique filename
-    unique_filename = generate_unique_filename(file.filename)
+    # Generate unique filename (always JPEG, whatever was uploaded)
+    unique_filename = generate_unique_filename('photo.jpg')
 
     # Save and optimize image
     filepath = os.path.join(photos_folder, unique_filename)
+    relative_path = os.path.join('photos', unique_filename)
 
     try:
-        # Open and process image
-        img = Image.open(file)
-
-        # Convert RGBA to RGB if necessary (for PNG with transparency)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-
         # Resize if image is too large (max 800x800 for profile photos)
         max_dimension = 800
+        img = flatten_to_rgb(open_image(source, (max_dimension, max_dimension)))
         if img.width > max_dimension or img.height > max_dimension:
             img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
 
@@ -302,14 +353,21 @@ def save_profile_photo(file, upload_folder, doctor_id, max_size_mb=5):
         from io import BytesIO
         img_bytes = BytesIO()
         img.save(img_bytes, 'JPEG', quality=85, optimize=True)
+        renditions = image_variants.render_variants(img)
 
         # Try to upload to R2 first
         import r2_storage
         r2_path = None
         try:
             r2_path = r2_storage.save_profile_photo(img_bytes, doctor_id, unique_filename)
+            if r2_path:
+                image_variants.store_variants(renditions, r2_path, upload_folder)
         except Exception as e:
             print(f"[R2] Photo upload failed, falling back to local storage: {e}")
+            if r2_path:
+                r2_storage.delete_profile_photo(r2_path)
+                image_variants.delete_variants(r2_path, upload_folder)
+                r2_path = None
 
         # If R2 upload succeeded, return R2 path
         if r2_path:
@@ -317,16 +375,11 @@ def save_profile_photo(file, upload_folder, doctor_id, max_size_mb=5):
             return r2_path
 
         # Fallback: Save to local storage
-        try:
-            img_bytes.seek(0)
-        except Exception:
-            pass
-
         with open(filepath, 'wb') as f:
             f.write(img_bytes.getvalue())
+        image_variants.store_variants(renditions, relative_path, upload_folder)
 
         # Return relative path for local storage
-        relative_path = os.path.join('photos', unique_filename)
         print(f"[Local] Photo saved to local storage: {relative_path}")
         return relative_path
 
@@ -334,12 +387,16 @@ def save_profile_photo(file, upload_folder, doctor_id, max_size_mb=5):
         # If save fails, clean up and raise error
         if os.path.exists(filepath):
             os.remove(filepath)
+        image_variants.delete_variants(relative_path, upload_folder)
         raise ValueError(f"Error processing image: {str(e)}")
 
 
 def save_clinic_logo(file, upload_folder, clinic_id, max_size_mb=5):
     """
-    Save and optimize a clinic's logo
+    Validate and save a clinic's logo within the request
+
+    Web uploads go through image_processing instead (validated here, processed
+    off-request by process_clinic_logo).
 
     Args:
         file: FileStorage object from request.files
@@ -352,22 +409,24 @@ def save_clinic_logo(file, upload_folder, clinic_id, max_size_mb=5):
     """
     if not file or file.filename == '':
         return None
+    validate_image_upload(file, max_size_mb=max_size_mb, min_dimension=50)
+    return process_clinic_logo(file, upload_folder, clinic_id)
 
-    # Validate file type - only images allowed
-    if not allowed_file(file.filename, 'image'):
-        raise ValueError(f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS['image'])}")
 
-    # Validate file size
-    if not validate_file_size(file, max_mb=max_size_mb):
-        raise ValueError(f"File too large. Maximum size: {max_size_mb}MB")
+def process_clinic_logo(source, upload_folder, clinic_id):
+    """
+    Resize a clinic logo to at most 400x400 and store it
 
-    # Validate image dimensions
-    is_valid, message = validate_image_dimensions(file, min_width=50, min_height=50)
-    if not is_valid:
-        raise ValueError(message)
+    Args:
+        source: path or file object of the uploaded image
+        upload_folder: Base upload folder path
+        clinic_id: ID of the clinic
 
-    # Generate unique filename
-    unique_filename = f"clinic_{clinic_id}_{generate_unique_filename(file.filename)}"
+    Returns:
+        Relative path to saved logo (R2 or local)
+    """
+    # Generate unique filename (always JPEG, whatever was uploaded)
+    unique_filename = f"clinic_{clinic_id}_{generate_unique_filename('logo.jpg')}"
 
     # Create clinic logos directory for local fallback
     logos_folder = os.path.join(upload_folder, 'clinic_logos')
@@ -377,19 +436,9 @@ def save_clinic_logo(file, upload_folder, clinic_id, max_size_mb=5):
     filepath = os.path.join(logos_folder, unique_filename)
 
     try:
-        # Open and process image
-        img = Image.open(file)
-
-        # Convert RGBA to RGB if necessary (for PNG with transparency)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-
         # Resize if image is too large (max 400x400 for logos)
         max_dimension = 400
+        img = flatten_to_rgb(open_image(source, (max_dimension, max_dimension)))
         if img.width > max_dimension or img.height > max_dimension:
             img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
 
@@ -412,11 +461,6 @@ def save_clinic_logo(file, upload_folder, clinic_id, max_size_mb=5):
             return r2_path
 
         # Fallback: Save to local storage
-        try:
-            img_bytes.seek(0)
-        except Exception:
-            pass
-
         with open(filepath, 'wb') as f:
             f.write(img_bytes.getvalue())
 
@@ -432,6 +476,68 @@ def save_clinic_logo(file, upload_folder, clinic_id, max_size_mb=5):
         raise ValueError(f"Error processing image: {str(e)}")
 
 
+def process_article_image(source, static_folder='static'):
+    """
+    Crop and resize an article's featured image and save it under
+    static/img/articles/
+
+    - Resizes to optimal social sharing size (1200x630px for OG tags)
+    - Compresses for web (reduces file size 60-80%)
+    - Converts to JPEG for consistency
+    - Generates unique filename
+
+    Returns: relative path like 'img/articles/abc123.jpg'
+    """
+    # Generate unique filename
+    filename = f"{uuid.uuid4().hex[:16]}.jpg"
+    articles_folder = os.path.join(static_folder, 'img', 'articles')
+    os.makedirs(articles_folder, exist_ok=True)
+    filepath = os.path.join(articles_folder, filename)
+
+    # Resize to optimal social sharing size (1200x630px for OG tags)
+    # This is the perfect size for Facebook/Twitter/LinkedIn sharing
+    target_width = 1200
+    target_height = 630
+
+    # Open (JPEGs decode at reduced scale) and flatten transparency onto white
+    img = flatten_to_rgb(open_image(source, (target_width, target_height)))
+
+    # Calculate aspect ratio
+    aspect = img.width / img.height
+    target_aspect = target_width / target_height
+
+    if aspect > target_aspect:
+        # Image is wider - crop width
+        new_width = int(img.height * target_aspect)
+        left = (img.width - new_width) // 2
+        img = img.crop((left, 0, left + new_width, img.height))
+    else:
+        # Image is taller - crop height
+        new_height = int(img.width / target_aspect)
+        top = (img.height - new_height) // 2
+        img = img.crop((0, top, img.width, top + new_height))
+
+    # Resize to target dimensions
+    img = img.resize((target_width, target_height), Image.Resampling.LANCZOS)
+
+    # Save with high quality JPEG compression (85 = good balance of quality/size)
+    img.save(filepath, 'JPEG', quality=85, optimize=True)
+
+    # Return relative path for database (without 'static/' prefix)
+    return f"img/articles/{filename}"
+
+
+def delete_article_image(relative_path, static_folder='static'):
+    """Delete an article image saved by process_article_image"""
+    if not relative_path:
+        return False
+    try:
+        os.remove(os.path.join(static_folder, relative_path))
+        return True
+    except OSError:
+        return False
+
+
 def delete_clinic_logo(upload_folder, relative_path):
     """
     Delete a clinic logo from R2 or local filesystem
@@ -491,6 +597,9 @@ def delete_profile_photo(upload_folder, relative_path):
     # R2 paths have doctor ID in them, local paths are just photos/{filename}
     import r2_storage
 
+    # Renditions live next to the photo, in the same storage
+    image_variants.delete_variants(relative_path, upload_folder)
+
     if relative_path.count('/') > 1:  # R2 path has multiple slashes
         # Try to delete from R2
         try:
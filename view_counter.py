@@ -0,0 +1,176 @@
+"""
+Coalesced page view counters
+
+Article and doctor profile pages used to commit a write transaction per page
+load (view_count += 1, DoctorAnalytics row update). Views are now counted in
+memory per worker process and flushed in batches:
+
+- articles:         UPDATE articles SET view_count = view_count + :delta
+- doctors:          UPDATE doctors SET profile_views = profile_views + :delta
+- doctor_analytics: one row per (doctor, day), counters incremented the same way
+
+Each web process's maintenance thread (maintenance.py) calls flush_views()
+every VIEW_FLUSH_INTERVAL seconds; it also runs once more at shutdown.
+"""
+import atexit
+import os
+import threading
+from collections import Counter, defaultdict
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from models import db, DoctorAnalytics
+
+
+VIEW_FLUSH_INTERVAL = int(os.getenv('VIEW_FLUSH_INTERVAL', '30'))  # seconds
+
+# DoctorAnalytics columns that record_doctor_view() may increment
+ANALYTICS_FIELDS = ('profile_views', 'source_search', 'source_homepage', 'source_google', 'source_direct')
+
+_lock = threading.Lock()
+_pending = {
+    'articles': Counter(),               # article_id -> views
+    'doctors': Counter(),                # doctor_id -> views
+    'analytics': defaultdict(Counter),   # (doctor_id, date) -> {field: delta}
+}
+_state = {'app': None}
+
+
+def init_app(app):
+    """Remember the Flask app so the final flush can open an app context"""
+    _state['app'] = app
+    atexit.register(_flush_at_exit)
+
+
+def record_article_view(article_id):
+    """Count one article page view (flushed later)"""
+    with _lock:
+        _pending['articles'][article_id] += 1
+
+
+def record_doctor_view(doctor_id, day, source_field=None):
+    """
+    Count one doctor profile view (flushed later)
+
+    Args:
+        doctor_id: Doctor.id
+        day: date for the DoctorAnalytics row (Nepal time)
+        source_field: one of ANALYTICS_FIELDS starting with 'source_', or None
+    """
+    with _lock:
+        _pending['doctors'][doctor_id] += 1
+        daily = _pending['analytics'][(doctor_id, day)]
+        daily['profile_views'] += 1
+        if source_field in ANALYTICS_FIELDS:
+            daily[source_field] += 1
+
+
+def pending_counts():
+    """Snapshot of unflushed views (for debugging/monitoring)"""
+    with _lock:
+        return {
+            'articles': sum(_pending['articles'].values()),
+            'doctors': sum(_pending['doctors'].values()),
+        }
+
+
+def _take_pending():
+    with _lock:
+        articles = _pending['articles']
+        doctors = _pending['doctors']
+        analytics = _pending['analytics']
+        _pending['articles'] = Counter()
+        _pending['doctors'] = Counter()
+        _pending['analytics'] = defaultdict(Counter)
+    return articles, doctors, analytics
+
+
+def _restore_pending(articles, doctors, analytics):
+    """Put deltas back after a failed flush so views aren't lost"""
+    with _lock:
+        _pending['articles'].update(articles)
+        _pending['doctors'].update(doctors)
+        for key, fields in analytics.items():
+            _pending['analytics'][key].update(fields)
+
+
+def _flush_analytics(analytics):
+    """Increment existing (doctor, day) rows and insert the missing ones"""
+    doctor_ids = {doctor_id for doctor_id, _ in analytics}
+    days = {day for _, day in analytics}
+    existing = {
+        (row.doctor_id, row.date): row.id
+        for row in db.session.query(DoctorAnalytics.id, DoctorAnalytics.doctor_id, DoctorAnalytics.date)
+        .filter(DoctorAnalytics.doctor_id.in_(doctor_ids), DoctorAnalytics.date.in_(days))
+    }
+
+    set_clause = ', '.join(f"{field} = COALESCE({field}, 0) + :{field}" for field in ANALYTICS_FIELDS)
+    updates = []
+    inserts = []
+    for (doctor_id, day), fields in analytics.items():
+        params = {field: fields.get(field, 0) for field in ANALYTICS_FIELDS}
+        row_id = existing.get((doctor_id, day))
+        if row_id:
+            params['id'] = row_id
+            updates.append(params)
+        else:
+            inserts.append(DoctorAnalytics(
+                doctor_id=doctor_id, date=day,
+                search_appearances=0, search_clicks=0, phone_clicks=0,
+                website_clicks=0, review_button_clicks=0,
+                **params
+            ))
+
+    if updates:
+        db.session.execute(text(f"UPDATE doctor_analytics SET {set_clause} WHERE id = :id"), updates)
+    if inserts:
+        db.session.add_all(inserts)
+
+
+def flush_views():
+    """
+    Write pending view counts to the database in batched UPDATEs
+
+    Must run inside an app context. Returns the number of views flushed.
+    """
+    articles, doctors, analytics = _take_pending()
+    if not articles and not doctors:
+        return 0
+
+    try:
+        if articles:
+            db.session.execute(
+                text("UPDATE articles SET view_count = COALESCE(view_count, 0) + :delta WHERE id = :id"),
+                [{'id': article_id, 'delta': delta} for article_id, delta in articles.items()]
+            )
+        if doctors:
+            db.session.execute(
+                text("UPDATE doctors SET profile_views = COALESCE(profile_views, 0) + :delta WHERE id = :id"),
+                [{'id': doctor_id, 'delta': delta} for doctor_id, delta in doctors.items()]
+            )
+            try:
+                with db.session.begin_nested():
+                    _flush_analytics(analytics)
+            except IntegrityError:
+                # Another worker created one of today's rows first - its id now exists, retry once
+                _flush_analytics(analytics)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        _restore_pending(articles, doctors, analytics)
+        print(f"[VIEW COUNTER] Flush failed, will retry: {e}")
+        return 0
+
+    return sum(articles.values()) + sum(doctors.values())
+
+
+def _flush_at_exit():
+    app = _state['app']
+    if app is None:
+        return
+    try:
+        with app.app_context():
+            flush_views()
+    except Exception as e:
+        print(f"[VIEW COUNTER] Final flush failed: {e}")